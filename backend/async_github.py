@@ -0,0 +1,166 @@
+"""Async GitHub REST client on httpx, for the asyncio action path."""
+import asyncio
+import threading
+
+import httpx
+
+import metrics
+from http_cache import add_validators, cache_key, cacheable
+from rate_limit import MAX_WAIT_SECONDS, RateLimited, current_user, github_retry_delay, resource_of
+from streaming import CHUNK_SIZE, MAX_INLINE_BYTES, Window, content_length
+
+_ssl_context = None
+_ssl_lock = threading.Lock()
+
+
+def shared_ssl_context():
+    """One SSL context for every client; loading the CA bundle costs ~40ms per client otherwise."""
+    global _ssl_context
+    if _ssl_context is None:
+        with _ssl_lock:
+            if _ssl_context is None:
+                _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+class AsyncGitHub:
+    """Minimal GitHub REST client for one event loop.
+
+    Use it as ``async with`` and do not share it between loops: httpx
+    connection pools belong to the loop they were opened on. Errors surface
+    as ``httpx.HTTPStatusError``, whose ``response.status_code`` matches what
+    the sync helpers read off ``requests.HTTPError``. ``pacer``, ``gate`` and
+    ``max_retries`` behave as in http_cache.ConditionalCacheAdapter; with a
+    ``cache`` (that adapter) GETs are revalidated against, and stored in, the
+    same ETag cache as the sync path's.
+    """
+
+    def __init__(self, base_url, token=None, max_connections=100, timeout=30.0,
+                 pacer=None, gate=None, max_retries=0, cache=None):
+        self.pacer = pacer
+        self.gate = gate
+        self.max_retries = max_retries
+        self.cache = cache
+        headers = {"Accept": "application/vnd.github+json"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=shared_ssl_context(),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    async def _send(self, method, url, stream=False, **kwargs):
+        """Send with pacing, a fair slot and rate-limit retries; returns an unread response."""
+        resource = resource_of(str(self._client.base_url.join(url)))
+        for attempt in range(self.max_retries + 1):
+            if self.pacer:
+                delay = self.pacer.delay(resource)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            request = self._client.build_request(method, url, **kwargs)
+            entry = None
+            if self.cache is not None and method == "GET":
+                entry = self.cache.lookup(cache_key(request.url, request.headers))
+                add_validators(request.headers, entry)
+            if self.gate:
+                await self.gate.acquire_async(current_user.get())
+            try:
+                response = await self._client.send(request, stream=stream)
+            finally:
+                if self.gate:
+                    self.gate.release()
+            if self.pacer:
+                self.pacer.update(response.headers)
+            delay = github_retry_delay(response.status_code, response.headers, attempt)
+            if delay is None:
+                return await self._revalidated(response, entry, stream)
+            await response.aclose()
+            if attempt == self.max_retries or delay > MAX_WAIT_SECONDS:
+                raise RateLimited(delay, "github")
+            await asyncio.sleep(delay)
+
+    async def _revalidated(self, response, entry, stream):
+        """A 304 for a cached entry as the cached 200; a fresh non-streamed 200 is stored."""
+        if self.cache is None or response.request.method != "GET":
+            return response
+        if response.status_code == 304 and entry:
+            await response.aclose()
+            self.cache.record(response.request.url, response.headers, True)
+            headers = httpx.Headers(entry["headers"])
+            for name, value in response.headers.items():
+                if name.lower().startswith("x-ratelimit-") or name.lower() == "date":
+                    headers[name] = value
+            return httpx.Response(200, headers=headers, content=entry["content"], request=response.request,
+                                  extensions={"revalidated": True})
+        self.cache.record(response.request.url, response.headers, False)
+        if not stream:
+            self._keep(response, response.content)
+        return response
+
+    def _keep(self, response, content):
+        """Store a fresh 200's decoded body in the ETag cache."""
+        if self.cache is not None and cacheable(response) and not response.extensions.get("revalidated"):
+            self.cache.store(cache_key(response.request.url, response.request.headers), response, content)
+
+    async def _request(self, method, url, **kwargs):
+        with metrics.span("github"):
+            response = await self._send(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def get_json(self, path, params=None):
+        return (await self._request("GET", path, params=params)).json()
+
+    async def get_text(self, path, accept):
+        return (await self._request("GET", path, headers={"Accept": accept})).text
+
+    async def post_json(self, path, payload):
+        return (await self._request("POST", path, json=payload)).json()
+
+    async def paginate(self, path, params=None):
+        """All items of a list endpoint, following ``Link: rel="next"``."""
+        items = []
+        url, params = path, {"per_page": 100, **(params or {})}
+        while url:
+            response = await self._request("GET", url, params=params)
+            items.extend(response.json())
+            url, params = response.links.get("next", {}).get("url"), None
+        return items
+
+    async def read_capped(self, path, accept, byte_range=None, line_range=None, max_bytes=MAX_INLINE_BYTES):
+        """Streamed GET kept to ``max_bytes`` after windowing; same ``(text, info)`` as streaming.read_capped."""
+        with metrics.span("github"):
+            response = await self._send("GET", path, stream=True, headers={"Accept": accept})
+            try:
+                response.raise_for_status()
+                info = {"total_bytes": content_length(response.headers), "max_bytes": max_bytes,
+                        "bytes": 0, "truncated": False}
+                selection = Window(info, byte_range, line_range, max_bytes)
+                pieces = []
+                # A copy of the whole body, for the ETag cache if it is read to the end and fits
+                body, body_bytes = [], 0
+                keep_limit = self.cache.max_entry_bytes if self.cache is not None else -1
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    body_bytes += len(chunk)
+                    if body is not None and body_bytes <= keep_limit:
+                        body.append(chunk)
+                    else:
+                        body = None
+                    pieces.append(selection.feed(chunk))
+                    if selection.done:
+                        break
+                else:
+                    if body is not None:
+                        self._keep(response, b"".join(body))
+            finally:
+                await response.aclose()
+        return b"".join(pieces).decode("utf-8", errors="replace"), info
@@ -0,0 +1,143 @@
+"""User accounts and bearer tokens: hashed passwords, an indexed users collection and a verified-token cache."""
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import jwt
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# PBKDF2-SHA256 rounds for new and rehashed passwords; each login costs one hash
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Longest a verified token is trusted without decoding it again, even if it expires later
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+_HASH_PREFIXES = ("pbkdf2:", "scrypt:")
+
+
+def hash_password(password, iterations=PASSWORD_HASH_ITERATIONS):
+    return generate_password_hash(password, method=f"pbkdf2:sha256:{iterations}")
+
+
+def check_password(stored, password):
+    """Check ``password`` against a stored hash, or against a plaintext password from before hashing."""
+    if not isinstance(stored, str):
+        return False
+    if stored.startswith(_HASH_PREFIXES):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+
+def needs_rehash(stored, iterations=PASSWORD_HASH_ITERATIONS):
+    """True for plaintext passwords and hashes weaker than the configured cost."""
+    if not stored.startswith("pbkdf2:"):
+        return not stored.startswith("scrypt:")
+    method = stored.split("$", 1)[0].split(":")
+    try:
+        return method[1] != "sha256" or int(method[2]) < iterations
+    except (IndexError, ValueError):
+        return True
+
+
+class UserStore:
+    """Accounts in the ``users`` collection, looked up through a unique index on username.
+
+    The index is created on first use in each process. If existing duplicate
+    usernames prevent it, lookups still work and ``index_error`` says why.
+    """
+
+    def __init__(self, collection, iterations=PASSWORD_HASH_ITERATIONS):
+        self.collection = collection
+        self.iterations = iterations
+        self.index_error = None
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        if self._indexed:
+            return
+        with self._lock:
+            if not self._indexed:
+                try:
+                    self.collection.create_index("username", unique=True)
+                except DuplicateKeyError as e:
+                    self.index_error = str(e)
+                self._indexed = True
+
+    def create(self, username, password):
+        """Add a user with a hashed password; False if the username is taken."""
+        self.ensure_indexes()
+        if self.index_error and self.collection.find_one({"username": username}, {"_id": 1}):
+            return False
+        try:
+            self.collection.insert_one({
+                "username": username,
+                "password": hash_password(password, self.iterations),
+                "created_at": datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def verify(self, username, password):
+        """True if the credentials match; upgrades plaintext or weaker hashes as a side effect."""
+        self.ensure_indexes()
+        user = self.collection.find_one({"username": username}, {"password": 1})
+        if not user or not check_password(user.get("password"), password):
+            return False
+        if needs_rehash(user["password"], self.iterations):
+            try:
+                # Matching on the old value keeps a concurrent login's upgrade from being overwritten
+                self.collection.update_one({"username": username, "password": user["password"]},
+                                           {"$set": {"password": hash_password(password, self.iterations)}})
+            except PyMongoError:
+                pass  # Logging in matters more than the upgrade; it is retried next time
+        return True
+
+
+class TokenCache:
+    """LRU of decoded JWT claims, so repeat requests skip the signature check.
+
+    Entries last until the token's ``exp`` or ``ttl_seconds``, whichever is
+    sooner. Keys include the signing secret, so rotating it invalidates them.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE, ttl_seconds=TOKEN_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (secret, token) -> (claims, valid_until)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def verify(self, token, secret):
+        """Claims of a valid token; raises ``jwt.InvalidTokenError`` otherwise."""
+        key = (secret, token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry[1]:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.counters["misses"] += 1
+
+        claims = jwt.decode(token, secret, algorithms=["HS256"])
+        valid_until = now + self.ttl_seconds
+        if "exp" in claims:
+            valid_until = min(valid_until, claims["exp"])
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (claims, valid_until)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries)}
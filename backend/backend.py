@@ -1,72 +1,190 @@
 import os
 import json
-import google.generativeai as genai
-from github import Github
-from flask import Flask, request, jsonify
+import math
+import asyncio
+import inspect
+import queue
+import threading
+import time
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, stream_with_context
+from urllib.parse import quote
 from flask_cors import CORS
 import requests
+import httpx
 import re
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv  # Import python-dotenv to load .env file
-from pymongo import MongoClient
 from bson.objectid import ObjectId
+from repo_tree import list_repo_files, list_repo_tree, resolve_ref
+from repo_index import RepoIndex, query_terms, related_context
+from bdd_pipeline import select_files, run_bdd_pipeline
+from jobs import JobManager, make_job_store
+from llm_cache import ResponseCache, cache_key
+import auth
+import compression
+import intent_router
+import webhooks
+import metrics
+import rate_limit
+from rate_limit import RateLimited, call_with_backoff, call_with_backoff_async, gemini_gate
+from clients import ClientRegistry
+from incremental_review import incremental_review, make_review_store
+from streaming import (
+    DIFF_MEDIA_TYPE, MAX_STREAM_BYTES, NDJSON_FLUSH_BYTES, RAW_MEDIA_TYPE, ndjson_lines, open_stream, parse_range, read_capped,
+    truncation_meta,
+)
+from diff_compare import compare_diffs
+from pagination import (
+    decode_cursor, iter_page, page_requested, page_size, paginate, paginate_requested, parse_fields, select_fields,
+)
+from diff_chunker import chunk_diff, estimate_tokens, map_concurrently, merge_issues, merge_test_cases
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app, resources={r"/*": {
-    "origins": ["http://localhost:3000", "http://192.168.1.3:3000"],
-    "methods": ["GET", "POST", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
-}})
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))  # Load Gemini API key from environment
+bp = Blueprint("backend", __name__)
 
-# Initialize GitHub API
-github_token = os.getenv("GITHUB_TOKEN")  # Ensure this is set in your environment
-g = Github(github_token)
+# Shared GitHub/Gemini/Mongo clients, built on first use. All GitHub HTTP
+# traffic (PyGithub and raw diff fetches) goes through one keep-alive session
+# whose adapter revalidates cached GETs with ETags; 304s do not count against
+# the rate limit
+clients = ClientRegistry.from_env()
+GITHUB_API_URL = clients.github_api_url
+MONGO_DB = os.getenv("MONGO_DB", "Mydatabase_git")
 
+# Gemini model and prompt template versions. Bump a template's version when its
+# prompt text changes so cached answers to the old prompt are not replayed.
+GEMINI_MODEL = "gemini-1.5-pro-latest"
+PROMPT_VERSIONS = {"intent": "3", "code_review": "2", "bdd_diff": "2", "bdd_file": "2"}
 
+# Bearer token required to scrape /metrics; leave unset to expose it openly
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Shared secret of the GitHub webhook; /webhooks/github refuses every delivery while it is unset
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
 
-# JWT Secret Key
-app.config['SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
-if not app.config['SECRET_KEY']:
-    raise ValueError("JWT_SECRET_KEY is not set in the environment variables!")
+# Objects below hold database handles or worker threads, so they are built on
+# first use and rebuilt in each forked worker rather than inherited
+_shared = {}
+_shared_lock = threading.Lock()
 
-# In-memory user store (replace with a database in production)
-users = {
-    "admin": generate_password_hash("password123")  # Username: admin, Password: password123
-}
+def shared(name, factory):
+    """Return the process-wide object ``name``, building it with ``factory`` on first use."""
+    value = _shared.get(name)
+    if value is None:
+        with _shared_lock:
+            value = _shared.get(name)
+            if value is None:
+                value = _shared[name] = factory()
+    return value
 
-client = MongoClient('mongodb://localhost:27017')
-db = client['Mydatabase_git']
-collection = db['users']
+def reset_after_fork():
+    global _shared_lock
+    _shared.clear()
+    _shared_lock = threading.Lock()
+    clients.reset()
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+def get_db():
+    return clients.mongo()[MONGO_DB]
+
+def get_users():
+    return get_db()['users']
+
+def get_user_store():
+    """Accounts, with the unique username index created on first use."""
+    return shared("user_store", lambda: auth.UserStore(get_users()))
+
+def get_token_cache():
+    return shared("token_cache", auth.TokenCache)
+
+def get_llm_cache():
+    """Cache of Gemini responses, backed by Mongo unless LLM_CACHE_PERSIST=0."""
+    return shared("llm_cache", lambda: ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400")),
+        collection=get_db()['llm_cache'] if os.getenv("LLM_CACHE_PERSIST", "1") != "0" else None,
+    ))
+
+def get_review_store():
+    """Last reviewed head and per-hunk findings for each PR."""
+    return shared("review_store", lambda: make_review_store(get_db()))
+
+def get_result_cache():
+    """Action results keyed by the PR base/head they were computed for, filled by webhooks and by chat."""
+    return shared("result_cache", lambda: ResponseCache(
+        max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+        ttl_seconds=int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 86400))),
+        collection=get_db()['precomputed'] if os.getenv("LLM_CACHE_PERSIST", "1") != "0" else None,
+    ))
+
+def get_repo_index():
+    """Search index of synced repositories' files, or None when REPO_INDEX=0."""
+    if os.getenv("REPO_INDEX", "1") == "0":
+        return None
+    return shared("repo_index", lambda: RepoIndex(os.getenv("REPO_INDEX_PATH", "repo_index.sqlite3")))
+
+def get_job_manager():
+    """Background workers for long-running actions."""
+    return shared("job_manager", lambda: JobManager(
+        make_job_store(get_db()), max_workers=int(os.getenv("JOB_WORKERS", "4"))))
+
+def create_app(config=None):
+    """Build the Flask app. No client is created and no service contacted until a request needs it."""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
+    app.config.update(config or {})
+    if not app.config['SECRET_KEY']:
+        raise ValueError("JWT_SECRET_KEY is not set in the environment variables!")
+    CORS(app, resources={r"/*": {
+        "origins": ["http://localhost:3000", "http://192.168.1.3:3000"],
+        "methods": ["GET", "POST", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["X-Intent-Route", "Server-Timing", "Retry-After"]
+    }})
+    app.register_blueprint(bp)
+    return app
 
 # JWT token required decorator
+def authenticate():
+    """Return ``(username, None)`` for a valid bearer token, else ``(None, error response)``."""
+    token = None
+    if 'Authorization' in request.headers:
+        token = request.headers['Authorization'].split(" ")[1]  # Bearer <token>
+    if not token:
+        return None, (jsonify({"error": "Token is missing!"}), 401)
+    try:
+        with metrics.span("auth"):
+            data = get_token_cache().verify(token, current_app.config['SECRET_KEY'])
+        rate_limit.current_user.set(data['username'])
+        return data['username'], None
+    except:
+        return None, (jsonify({"error": "Token is invalid!"}), 401)
+
 def token_required(f):
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async(*args, **kwargs):
+            current_user, error = authenticate()
+            if error:
+                return error
+            return await f(current_user, *args, **kwargs)
+        return decorated_async
+
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]  # Bearer <token>
-        if not token:
-            return jsonify({"error": "Token is missing!"}), 401
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = data['username']
-        except:
-            return jsonify({"error": "Token is invalid!"}), 401
+        current_user, error = authenticate()
+        if error:
+            return error
         return f(current_user, *args, **kwargs)
     return decorated
 
 
 
-@app.route('/signup', methods=['POST'])
+@bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
     username = data.get('username')
@@ -74,21 +192,18 @@ def signup():
 
     if not username or not password:
         return jsonify({"error": "Username and password required!"}), 400
+    if not isinstance(username, str) or not isinstance(password, str):
+        return jsonify({"error": "Username and password must be strings!"}), 400
     if len(username) < 4:
         return jsonify({"error": "Username must be at least 4 characters!"}), 400
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters!"}), 400
-    
-    user_1 = collection.find_one({"username": username})
-    
-    if user_1:
-        return jsonify({"error": "Username already exists!"}), 400
 
-    # users[username] = generate_password_hash(password)
-    result = collection.insert_one(data)
+    if not get_user_store().create(username, password):
+        return jsonify({"error": "Username already exists!"}), 400
     return jsonify({"message": "User created successfully!"}), 201
 # Login endpoint
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -96,24 +211,93 @@ def login():
 
     if not username or not password:
         return jsonify({"error": "Username and password are required!"}), 400
-    
-    user_1 = collection.find_one({"username": username})
-   
-    if not user_1 or not user_1['password'] == password:
+    if not isinstance(username, str) or not isinstance(password, str):
+        return jsonify({"error": "Username and password must be strings!"}), 400
+
+    if not get_user_store().verify(username, password):
         return jsonify({"error": "Invalid username or password!"}), 401
 
     # Generate JWT token
     token = jwt.encode({
         'username': username,
         'exp': datetime.utcnow() + timedelta(hours=24)
-    }, app.config['SECRET_KEY'], algorithm="HS256")
+    }, current_app.config['SECRET_KEY'], algorithm="HS256")
 
     return jsonify({"token": token})
 
 # Gemini API call function
-def call_gemini(prompt):
-    """Force Gemini to return structured JSON instructions."""
-    structured_prompt = f"""
+def extract_json(response_text):
+    """Pull the JSON object out of Gemini's response text, with or without a ```json fence."""
+    json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+    json_string = json_match.group(1) if json_match else response_text.strip()
+    return json.loads(json_string)
+
+def record_gemini_usage(template, prompt, response, response_text):
+    """Count a Gemini call's tokens, estimating them when the SDK does not report usage."""
+    metrics.gemini_calls.inc(1, template, "miss")
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_token_count, usage.candidates_token_count
+    else:
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(response_text)
+    metrics.gemini_tokens.inc(prompt_tokens, template, "prompt")
+    metrics.gemini_tokens.inc(completion_tokens, template, "completion")
+
+def generate_json(template, prompt):
+    """Run ``prompt`` through Gemini and parse the JSON answer, serving repeats from llm_cache."""
+    key = cache_key(GEMINI_MODEL, f"{template}:{PROMPT_VERSIONS[template]}", prompt)
+    cached = get_llm_cache().get(key)
+    if cached is not None:
+        metrics.gemini_calls.inc(1, template, "hit")
+        return extract_json(cached)
+
+    model = clients.model(GEMINI_MODEL)
+    user = rate_limit.current_user.get()
+
+    def attempt():
+        # The slot is held per attempt, not through the backoff sleeps between them
+        with gemini_gate.slot(user):
+            return model.generate_content(prompt)
+
+    with metrics.span("llm"):
+        response = call_with_backoff(attempt)
+    response_text = response.candidates[0].content.parts[0].text
+    record_gemini_usage(template, prompt, response, response_text)
+    result = extract_json(response_text)
+    # Only answers that parsed are worth replaying
+    get_llm_cache().set(key, response_text)
+    return result
+
+async def generate_json_async(template, prompt):
+    """Async ``generate_json``: awaits Gemini instead of holding a thread for the call."""
+    key = cache_key(GEMINI_MODEL, f"{template}:{PROMPT_VERSIONS[template]}", prompt)
+    # The cache may fall through to Mongo, so it stays off the event loop
+    cached = await asyncio.to_thread(get_llm_cache().get, key)
+    if cached is not None:
+        metrics.gemini_calls.inc(1, template, "hit")
+        return extract_json(cached)
+
+    model = clients.async_model(GEMINI_MODEL)
+    user = rate_limit.current_user.get()
+
+    async def attempt():
+        await gemini_gate.acquire_async(user)
+        try:
+            return await model.generate_content_async(prompt)
+        finally:
+            gemini_gate.release()
+
+    with metrics.span("llm"):
+        response = await call_with_backoff_async(attempt)
+    response_text = response.candidates[0].content.parts[0].text
+    record_gemini_usage(template, prompt, response, response_text)
+    result = extract_json(response_text)
+    await asyncio.to_thread(get_llm_cache().set, key, response_text)
+    return result
+
+def intent_prompt(prompt):
+    """Prompt asking Gemini to classify ``prompt`` as a structured action."""
+    return f"""
     You are an AI assistant specializing in GitHub automation. 
     Your response **must be a JSON object**, with **no explanations**.
 
@@ -121,14 +305,18 @@ def call_gemini(prompt):
 
     Return JSON in this format:
     {{
-      "action": "<fetch_pull_requests | fetch_repo_files | read_file | create_pr | generate_snapshot | compare_snapshot | fetch_pr_details | fetch_all_repos | generate_code_review | generate_bdd_test_cases | generate_bdd_from_repo>",
+      "action": "<fetch_pull_requests | fetch_repo_files | read_file | create_pr | generate_snapshot | compare_snapshot | fetch_pr_details | fetch_all_repos | generate_code_review | generate_bdd_test_cases | generate_bdd_from_repo | review_open_prs | fetch_all_pull_requests>",
       "repo": "<repository_name>",
       "additional_params": {{
         "file_path": "<if applicable>",
-        "pr_number": "<if applicable>"
+        "pr_number": "<if applicable>",
+        "pr_number2": "<second PR number, for compare_snapshot only>"
       }}
     }}
 
+    Use review_open_prs to review every open PR of one repository, and
+    fetch_all_pull_requests (with no repo) to list open PRs across all of the user's repositories.
+
     If the request is unclear, return:
     {{
       "error": "I couldn't understand your request. Please try rephrasing or check the help section for examples."
@@ -137,70 +325,154 @@ def call_gemini(prompt):
     **DO NOT** generate test cases or other results here. Just provide the action and parameters.
     """
 
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-    response = model.generate_content(structured_prompt)
+def call_gemini(prompt):
+    """Force Gemini to return structured JSON instructions."""
     try:
-        response_text = response.candidates[0].content.parts[0].text
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-        json_string = json_match.group(1) if json_match else response_text.strip()
-        return json.loads(json_string)
+        return generate_json("intent", intent_prompt(prompt))
     except (json.JSONDecodeError, IndexError, AttributeError) as e:
         
         return {"error": f"Invalid response from Gemini: {str(e)}"}
 
+async def call_gemini_async(prompt):
+    try:
+        return await generate_json_async("intent", intent_prompt(prompt))
+    except (json.JSONDecodeError, IndexError, AttributeError) as e:
+        return {"error": f"Invalid response from Gemini: {str(e)}"}
+
+# Minimum local router confidence before the Gemini classification call is skipped
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8"))
+
+# Request fields that complete a create_pr prompt
+PR_FIELDS = ("branch_name", "title")
+
+def resolve_intent(prompt, data=None):
+    """Map a prompt to an action, returning ``(intent, route)`` where route is "local" or "llm"."""
+    with metrics.span("intent"):
+        intent, confidence = intent_router.route(prompt, [f for f in PR_FIELDS if (data or {}).get(f)])
+        if intent is not None and confidence >= INTENT_ROUTER_THRESHOLD:
+            return intent, "local"
+        return call_gemini(prompt), "llm"
+
+async def resolve_intent_async(prompt, data=None):
+    with metrics.span("intent"):
+        intent, confidence = intent_router.route(prompt, [f for f in PR_FIELDS if (data or {}).get(f)])
+        if intent is not None and confidence >= INTENT_ROUTER_THRESHOLD:
+            return intent, "local"
+        return await call_gemini_async(prompt), "llm"
+
 # GitHub utility functions
+def iter_pull_requests(repo_name):
+    """Open PRs, fetched a page of the GitHub API at a time as they are consumed."""
+    repo = clients.github().get_repo(repo_name)
+    for pr in repo.get_pulls(state='open'):
+        yield {"title": pr.title, "number": pr.number}
+
 def fetch_pull_requests(repo_name):
-    repo = g.get_repo(repo_name)
-    prs = repo.get_pulls(state='open')
-    return [{"title": pr.title, "number": pr.number} for pr in prs]
+    return list(iter_pull_requests(repo_name))
 
 def fetch_repo_files(repo_name):
-    repo = g.get_repo(repo_name)
-    contents = repo.get_contents("")
-    files = []
-    while contents:
-        file_content = contents.pop(0)
-        if file_content.type == "file":
-            files.append(file_content.path)
-        else:
-            contents.extend(repo.get_contents(file_content.path))
-    return files
+    return list_repo_files(clients.github(), repo_name)
+
+def fetch_repo_entries(repo_name):
+    """Tree entries (path, sha, size, ...) of the repo's files, for callers selecting fields."""
+    return [entry for entry in fetch_repo_tree(repo_name) if entry["type"] == "blob"]
+
+def fetch_repo_tree(repo_name, ref=None):
+    return list_repo_tree(clients.github(), repo_name, ref)
+
+def contents_url(repo_name, file_path, ref=None):
+    url = f"{GITHUB_API_URL}/repos/{repo_name}/contents/{quote(file_path.lstrip('/'))}"
+    return f"{url}?ref={quote(ref, safe='')}" if ref else url
+
+def pull_url(repo_name, pr_number):
+    return f"{GITHUB_API_URL}/repos/{repo_name}/pulls/{pr_number}"
+
+def fetch_pull(repo_name, pr_number):
+    """The PR's JSON. Revalidated with its ETag, so asking again about an unchanged PR costs no quota."""
+    response = clients.http().get(pull_url(repo_name, pr_number))
+    response.raise_for_status()
+    return response.json()
+
+def snapshot_key(repo_name, pull):
+    """Result cache key of a PR's snapshot; the diff only changes when its base or head does."""
+    return cache_key("snapshot", "1", f"{repo_name}#{pull['number']}@{pull['base']['sha']}..{pull['head']['sha']}")
+
+def read_file_window(repo_name, file_path, ref=None, byte_range=None, line_range=None):
+    """Read (part of) a file as raw bytes, holding at most MAX_INLINE_BYTES. Returns ``(text, info)``."""
+    return read_capped(clients.http(), contents_url(repo_name, file_path, ref), RAW_MEDIA_TYPE, byte_range, line_range)
 
 def read_file(repo_name, file_path):
-    repo = g.get_repo(repo_name)
-    file_content = repo.get_contents(file_path)
-    return file_content.decoded_content.decode()
+    return read_file_window(repo_name, file_path)[0]
 
 def create_pr(repo_name, branch_name, title, body):
-    repo = g.get_repo(repo_name)
+    repo = clients.github().get_repo(repo_name)
     base_branch = repo.default_branch
     pr = repo.create_pull(title=title, body=body, head=branch_name, base=base_branch)
     return pr.html_url
 
-def generate_snapshot(repo_name, pr_number):
-    repo = g.get_repo(repo_name)
-    pr = repo.get_pull(pr_number)
-    diff_url = pr.diff_url
-    response = requests.get(diff_url)
-    return response.text if response.status_code == 200 else f"Error fetching PR diff: {response.status_code}"
+def fetch_diff(repo_name, pr_number):
+    # The API's diff media type supports conditional requests, unlike pr.diff_url
+    response = clients.http().get(pull_url(repo_name, pr_number), headers={"Accept": DIFF_MEDIA_TYPE})
+    response.raise_for_status()
+    return response.text
+
+def generate_snapshot(repo_name, pr_number, byte_range=None, line_range=None):
+    """PR diff capped at MAX_INLINE_BYTES, with truncation metadata; /stream/snapshot serves it whole.
 
-def compare_snapshot(repo_name, pr_number1, pr_number2):
-    diff1 = generate_snapshot(repo_name, pr_number1)
-    diff2 = generate_snapshot(repo_name, pr_number2)
-    return {"pr1_diff": diff1, "pr2_diff": diff2}
+    Whole-diff snapshots are kept in the result cache for the PR's current
+    base and head.
+    """
+    key = None
+    try:
+        if not (byte_range or line_range):
+            key = snapshot_key(repo_name, fetch_pull(repo_name, pr_number))
+            cached = get_result_cache().get(key)
+            if cached is not None:
+                return json.loads(cached)
+        text, info = read_capped(clients.http(), pull_url(repo_name, pr_number), DIFF_MEDIA_TYPE, byte_range, line_range)
+    except requests.HTTPError as e:
+        return {"snapshot": f"Error fetching PR diff: {e.response.status_code}"}
+    result = {"snapshot": text, **truncation_meta(info)}
+    if key:
+        get_result_cache().set(key, json.dumps(result))
+    return result
+
+def compare_snapshot(repo_name, pr_number1, pr_number2, include_raw=False):
+    """Fetch both PR diffs in parallel and compare them hunk by hunk.
+
+    The raw diffs are only returned with ``include_raw``.
+    """
+    pr_numbers = [pr_number1, pr_number2]
+    fetched = map_concurrently(
+        lambda n: read_capped(clients.http(), pull_url(repo_name, n), DIFF_MEDIA_TYPE, max_bytes=MAX_STREAM_BYTES),
+        pr_numbers, 2,
+    )
+    for pr_number, (_, error) in zip(pr_numbers, fetched):
+        if isinstance(error, requests.HTTPError):
+            raise ActionError(f"Error fetching PR #{pr_number} diff: {error.response.status_code}")
+        if error:
+            raise error
+    (diff1, info1), (diff2, info2) = (result for result, _ in fetched)
+
+    comparison = compare_diffs(diff1, diff2)
+    comparison["pr1"] = {"number": pr_number1, **truncation_meta(info1)}
+    comparison["pr2"] = {"number": pr_number2, **truncation_meta(info2)}
+    if include_raw:
+        comparison["pr1_diff"], comparison["pr2_diff"] = diff1, diff2
+    return {"comparison": comparison}
 
 def fetch_pr_details(repo_name, pr_number):
-    repo = g.get_repo(repo_name)
-    pr = repo.get_pull(pr_number)
-    return {"title": pr.title, "body": pr.body, "user": pr.user.login, "state": pr.state}
+    pr = fetch_pull(repo_name, pr_number)
+    return {"title": pr["title"], "body": pr["body"], "user": pr["user"]["login"], "state": pr["state"]}
+
+def iter_all_repos():
+    for repo in clients.github().get_user().get_repos():
+        yield repo.full_name
 
 def fetch_all_repos():
-    repos = g.get_user().get_repos()
-    return [repo.full_name for repo in repos]
+    return list(iter_all_repos())
 
-def generate_code_review(repo_name, pr_number):
-    pr_diff = generate_snapshot(repo_name, pr_number)
-    review_prompt = f"""
+REVIEW_PROMPT = """
     You are a professional code reviewer. Analyze the following GitHub pull request diff 
     and provide a structured code review. Return JSON:
     {{
@@ -212,14 +484,11 @@ def generate_code_review(repo_name, pr_number):
         }}
       ]
     }}
-    Diff:
-    {pr_diff}
+    {context}Diff:
+    {diff}
     """
-    return call_gemini(review_prompt)
 
-def generate_bdd_test_cases(repo_name, pr_number):
-    pr_diff = generate_snapshot(repo_name, pr_number)
-    bdd_prompt = f"""
+BDD_DIFF_PROMPT = """
     Based on the following GitHub pull request diff, generate BDD-style test cases.
     Return JSON in this format:
     {{
@@ -233,110 +502,961 @@ def generate_bdd_test_cases(repo_name, pr_number):
         }}
       ]
     }}
-    Diff:
-    {pr_diff}
+    {context}Diff:
+    {diff}
     """
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-    response = model.generate_content(bdd_prompt)
+
+# Token budget per diff chunk and how many chunks are sent to Gemini at once
+REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET", "8000"))
+# Smallest budget a client may ask for; below it a diff turns into a Gemini call per few lines
+MIN_REVIEW_TOKEN_BUDGET = int(os.getenv("MIN_REVIEW_TOKEN_BUDGET", "1000"))
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "4"))
+
+def review_token_budget(token_budget):
+    """Clamp a client's ``token_budget`` to MIN_REVIEW_TOKEN_BUDGET..REVIEW_TOKEN_BUDGET, defaulting to the maximum."""
+    if token_budget in (None, ""):
+        return REVIEW_TOKEN_BUDGET
+    if isinstance(token_budget, bool):
+        raise ValueError("token_budget must be an integer.")
     try:
-        response_text = response.candidates[0].content.parts[0].text
-        json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-        json_string = json_match.group(1) if json_match else response_text.strip()
-        return json.loads(json_string)
-    except (json.JSONDecodeError, IndexError, AttributeError) as e:
-       
-        return {"error": f"Failed to generate BDD test cases: {str(e)}"}
+        token_budget = int(token_budget)
+    except (TypeError, ValueError):
+        raise ValueError("token_budget must be an integer.")
+    return max(min(MIN_REVIEW_TOKEN_BUDGET, REVIEW_TOKEN_BUDGET), min(token_budget, REVIEW_TOKEN_BUDGET))
+
+def run_chunked(template, prompt, diff_text, token_budget=None, context_fn=None):
+    """Send each token-budgeted chunk of ``diff_text`` through ``prompt`` concurrently.
+
+    ``context_fn(chunk_text)``, if given, supplies the prompt's related-code
+    section for each chunk. Returns the parsed per-chunk results plus
+    metadata: chunk count, tokens sent, files left out of the prompt and any
+    per-chunk errors.
+    """
+    chunks, skipped = chunk_diff(diff_text, review_token_budget(token_budget))
+    prompts = [prompt.format(diff=chunk.text, context=context_fn(chunk.text) if context_fn else "")
+               for chunk in chunks]
+    outcomes = map_concurrently(lambda p: generate_json(template, p), prompts, REVIEW_CONCURRENCY)
+    meta = {
+        "chunks": len(chunks),
+        "tokens_sent": sum(estimate_tokens(p) for p in prompts),
+        "skipped_files": skipped,
+    }
+    errors = [error for _, error in outcomes if error is not None]
+    raise_if_all_rate_limited(errors, len(outcomes))
+    if errors:
+        meta["errors"] = [str(error) for error in errors]
+    return [result for result, error in outcomes if error is None], meta
+
+# Commits a push may add and still be reviewed incrementally
+PUSH_MAX_COMMITS = 100
+
+def fetch_push_diff(repo_name, old_sha, new_sha):
+    """Diff between two heads of a PR branch, or None if it can't stand in for the PR's own changes.
+
+    That is when the branch was rewritten rather than pushed to, or when the
+    push merged another branch (usually the base) in: its diff would then
+    carry upstream changes that are not the PR's to review.
+    """
+    url = f"{GITHUB_API_URL}/repos/{repo_name}/compare/{old_sha}...{new_sha}"
+    comparison = clients.http().get(url, params={"per_page": PUSH_MAX_COMMITS})
+    if comparison.status_code != 200:
+        return None
+    comparison = comparison.json()
+    commits = comparison.get("commits", [])
+    if (comparison.get("status") != "ahead" or comparison.get("total_commits", 0) > len(commits)
+            or any(len(commit.get("parents", [])) > 1 for commit in commits)):
+        return None
+    response = clients.http().get(url, headers={"Accept": "application/vnd.github.v3.diff"})
+    return response.text if response.status_code == 200 else None
+
+# Largest repo (in files worth indexing) a review or PR BDD request will index on the spot
+REPO_INDEX_MAX_FILES = int(os.getenv("REPO_INDEX_MAX_FILES", "500"))
+
+def sync_repo_index(repo_name, max_files=None):
+    """Bring the repo's index up to its default branch, reading only changed blobs.
+
+    Returns ``(files, skipped)``: the indexed tree entries, and a {path: reason}
+    map of those select_files left out. ``files`` is None when the index is
+    disabled or the repo has more than ``max_files`` files to index.
+    """
+    index = get_repo_index()
+    if index is None:
+        return None, {}
+    commit_sha = resolve_ref(clients.github(), repo_name)
+    files, skipped = select_files(list_repo_tree(clients.github(), repo_name, commit_sha))
+    if max_files is not None and len(files) > max_files:
+        return None, skipped
+    index.sync(repo_name, files, lambda path: read_file_window(repo_name, path, commit_sha)[0])
+    return files, skipped
+
+# Least time between two background syncs of one repo's index from reviews
+REPO_INDEX_REFRESH_SECONDS = int(os.getenv("REPO_INDEX_REFRESH_SECONDS", "300"))
+
+def queue_index_sync(repo_name):
+    """Sync the repo's index in a background job, at most once per REPO_INDEX_REFRESH_SECONDS; returns the job id or None."""
+    queued = shared("index_syncs", dict)  # repo -> when its last sync was queued
+    now = time.monotonic()
+    last = queued.get(repo_name)
+    if last is not None and now - last < REPO_INDEX_REFRESH_SECONDS:
+        return None
+    queued[repo_name] = now
+
+    def job(emit):
+        rate_limit.current_user.set(f"index:{repo_name}")
+        files, _ = sync_repo_index(repo_name, REPO_INDEX_MAX_FILES)
+        return {"repo": repo_name, "files": None if files is None else len(files)}
+
+    return get_job_manager().submit("index", "sync_repo_index", metrics.tracked("sync_repo_index", job))
+
+def diff_context_fn(repo_name):
+    """Related-code lookup for diff chunks of ``repo_name``, or None if the repo has not been indexed yet.
+
+    Requests never index on the spot: a background job builds or refreshes
+    the index, and reviews get related code once it is there. Repos above
+    REPO_INDEX_MAX_FILES are only searched once generate_bdd_from_repo has
+    indexed them.
+    """
+    index = get_repo_index()
+    if index is None:
+        return None
+    try:
+        queue_index_sync(repo_name)
+    except Exception:
+        pass  # Review without a fresher index rather than not at all
+    if not index.has_repo(repo_name):
+        return None
+    return lambda text: related_context(index.search(repo_name, query_terms(text)))
+
+def generate_code_review(repo_name, pr_number, token_budget=None, full=False):
+    """Review a PR, re-reviewing only what changed since its last reviewed head unless ``full``.
+
+    Each diff chunk is sent with the repository code most related to it.
+    """
+    def review(diff_text):
+        results, meta = run_chunked("code_review", REVIEW_PROMPT, diff_text, token_budget, diff_context_fn(repo_name))
+        if meta.get("errors") and not results:
+            meta["error"] = f"Invalid response from Gemini: {meta['errors'][0]}"
+        return merge_issues(results), meta
+
+    head_sha = fetch_pull(repo_name, pr_number)["head"]["sha"]
+    return incremental_review(
+        get_review_store(), repo_name, int(pr_number), head_sha,
+        lambda: fetch_diff(repo_name, pr_number),
+        lambda old_sha, new_sha: fetch_push_diff(repo_name, old_sha, new_sha),
+        review,
+        full=full,
+    )
+
+def generate_bdd_test_cases(repo_name, pr_number, token_budget=None):
+    results, meta = run_chunked("bdd_diff", BDD_DIFF_PROMPT, fetch_diff(repo_name, pr_number), token_budget,
+                                diff_context_fn(repo_name))
+    if meta.get("errors") and not results:
+        return {"error": f"Failed to generate BDD test cases: {meta['errors'][0]}", **meta}
+    return {"test_cases": merge_test_cases(results), **meta}
+
+def generate_file_bdd(file_path, file_content, context=""):
+    bdd_prompt = f"""
+    Analyze the following code and generate BDD-style test cases.
+    Return JSON in this format:
+    {{
+      "test_cases": [
+        {{
+          "feature": "<feature_name>",
+          "given": "<precondition>",
+          "when": "<action>",
+          "then": "<expected_outcome>",
+          "scenario": "<scenario_description>"
+        }}
+      ]
+    }}
+    {context}Code:
+    {file_content}
+    """
+    return generate_json("bdd_file", bdd_prompt)
+
+def bdd_repo_paths(repo_name):
+    """Files generate_bdd_from_repo analyses and a {path: reason} map of those it skips.
+
+    The repo index is brought up to date first.
+    """
+    if get_repo_index() is None:
+        files, skipped = select_files(fetch_repo_tree(repo_name))
+    else:
+        files, skipped = sync_repo_index(repo_name)
+    return [f["path"] for f in files], skipped
+
+def generate_bdd_from_repo(repo_name, on_result=None, paths=None, stop=None):
+    """BDD test cases for every file worth analysing, each prompt carrying related code from other files.
+
+    Files come out of the repo index, so a rerun after a push only reads the
+    blobs that changed. ``paths`` (some of bdd_repo_paths) limits the run to
+    those files; setting the ``stop`` event ends it early.
+    """
+    if paths is None:
+        paths, _ = bdd_repo_paths(repo_name)
+    index = get_repo_index()
+    if index is None:
+        return run_bdd_pipeline(
+            paths,
+            lambda file_path: read_file(repo_name, file_path),
+            generate_file_bdd,
+            on_result=on_result,
+            stop=stop,
+        )
+
+    def generate(file_path, content):
+        hits = index.search(repo_name, query_terms(content), exclude_paths=[file_path])
+        return generate_file_bdd(file_path, content, related_context(hits))
+
+    return run_bdd_pipeline(
+        paths,
+        lambda file_path: index.text(repo_name, file_path) or read_file(repo_name, file_path),
+        generate,
+        on_result=on_result,
+        stop=stop,
+    )
+
+def precompute_pr(repo_name, pr_number, head_sha, emit=None):
+    """Warm a PR's details, snapshot and review so chat answers them without waiting on GitHub or Gemini.
+
+    Nothing is done if the PR has moved past ``head_sha``: the push that
+    moved it sends its own event.
+    """
+    current = fetch_pull(repo_name, pr_number)["head"]["sha"]
+    if current != head_sha:
+        return {"head_sha": head_sha, "skipped": f"PR head moved to {current}"}
+    warmed, errors = [], {}
+    for name, fn in (
+        ("details", lambda: fetch_pr_details(repo_name, pr_number)),
+        ("snapshot", lambda: generate_snapshot(repo_name, pr_number)),
+        ("review", lambda: generate_code_review(repo_name, pr_number)),
+    ):
+        try:
+            fn()
+            warmed.append(name)
+        except Exception as e:
+            errors[name] = str(e)
+        if emit:
+            emit(name, errors.get(name, "ok"))
+    result = {"head_sha": head_sha, "warmed": warmed}
+    if errors:
+        result["errors"] = errors
+    return result
+
+# How many repos or PRs a batch action works on at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+def raise_if_all_rate_limited(errors, count):
+    """Surface a rate limit as such when it is why every item of a fan-out failed."""
+    if count and len(errors) == count and all(isinstance(error, RateLimited) for error in errors):
+        raise errors[0]
+
+def collect_pull_requests(repos, outcomes, cursor=None, limit=None):
+    """Flatten per-repo ``(prs, error)`` outcomes into one page of ``{"repo", "title", "number"}`` rows."""
+    raise_if_all_rate_limited([error for _, error in outcomes if error is not None], len(repos))
+    pulls, errors = [], {}
+    for repo_name, (prs, error) in zip(repos, outcomes):
+        if error is not None:
+            errors[repo_name] = str(error)
+        else:
+            pulls += [{"repo": repo_name, **pr} for pr in prs]
+    page, meta = paginate(pulls, cursor, limit)
+    result = {"pull_requests": page, "repos": len(repos), **meta}
+    if errors:
+        result["errors"] = errors
+    return result
+
+def fetch_all_pull_requests(cursor=None, limit=None):
+    """Open PRs of every repo the token can see, listed concurrently and returned a page at a time."""
+    repos = fetch_all_repos()
+    outcomes = map_concurrently(fetch_pull_requests, repos, BATCH_CONCURRENCY)
+    return collect_pull_requests(repos, outcomes, cursor, limit)
+
+def review_open_prs(repo_name, cursor=None, limit=None, token_budget=None, full=False):
+    """Review one page of a repo's open PRs concurrently; ``next_cursor`` reviews the next page.
+
+    Each review goes through generate_code_review, so PRs whose head has not
+    moved since their last review come back from the review store.
+    """
+    page, meta = paginate(fetch_pull_requests(repo_name), cursor, limit)
+    outcomes = map_concurrently(
+        lambda pr: generate_code_review(repo_name, pr["number"], token_budget, full), page, BATCH_CONCURRENCY)
+    raise_if_all_rate_limited([error for _, error in outcomes if error is not None], len(page))
+    reviews = [{**pr, "error": str(error)} if error is not None else {**pr, "review": review}
+               for pr, (review, error) in zip(page, outcomes)]
+    return {"reviews": reviews, "repo": repo_name, **meta}
+
+UNCLEAR_REQUEST = "I couldn't understand your request. Please try rephrasing or check the help section for examples."
+
+# Actions that may take minutes; clients can send "async": true to run them as jobs
+LONG_RUNNING_ACTIONS = {"generate_bdd_from_repo", "generate_code_review", "compare_snapshot", "review_open_prs"}
 
-def generate_bdd_from_repo(repo_name):
-    files = fetch_repo_files(repo_name)
-    test_cases = {}
-    for file_path in files:
+class ActionError(Exception):
+    """Raised when a routed action is missing the parameters it needs."""
+
+def run_action(action, repo_name, additional_params, data, on_result=None):
+    """Execute a routed action and return its result.
+
+    ``on_result(key, value)`` receives partial results from actions that
+    produce them incrementally.
+    """
+    pr_number = additional_params.get("pr_number")
+    pr_number2 = additional_params.get("pr_number2") or data.get("pr_number2")
+    try:
+        byte_range = parse_range(data.get("bytes"))
+        line_range = parse_range(data.get("lines"))
+        decode_cursor(data.get("cursor"))
+        page_size(data.get("limit"))
+        fields = parse_fields(data.get("fields"))
+        token_budget = review_token_budget(data.get("token_budget"))
+    except ValueError as e:
+        raise ActionError(str(e))
+
+    if action == "fetch_pull_requests":
+        return paginate_requested(fetch_pull_requests(repo_name), data.get("cursor"), data.get("limit"))
+    elif action == "fetch_repo_files":
+        # Plain paths unless the client picks fields of the tree entries
+        files = fetch_repo_entries(repo_name) if fields else fetch_repo_files(repo_name)
+        return paginate_requested(files, data.get("cursor"), data.get("limit"))
+    elif action == "read_file" and additional_params.get("file_path"):
+        file_path = additional_params["file_path"]
+        text, info = read_file_window(repo_name, file_path, data.get("ref"), byte_range, line_range)
+        if not info["truncated"]:
+            return text
+        stream_url = f"/stream/file?repo={quote(repo_name)}&path={quote(file_path)}"
+        if data.get("ref"):
+            stream_url += f"&ref={quote(data['ref'])}"
+        return {"content": text, **truncation_meta(info), "stream_url": stream_url}
+    elif action == "create_pr":
+        # Fields the request carries win over those the router read from the prompt
+        branch_name = data.get("branch_name") or additional_params.get("branch_name")
+        title = data.get("title") or additional_params.get("title")
+        body = data.get("body") or additional_params.get("body")
+        if not (branch_name and title and body):
+            raise ActionError("Missing required parameters for creating a PR.")
+        return {"pr_url": create_pr(repo_name, branch_name, title, body)}
+    elif action == "generate_snapshot" and pr_number:
+        return generate_snapshot(repo_name, pr_number, byte_range, line_range)
+    elif action == "compare_snapshot" and pr_number and pr_number2:
+        return compare_snapshot(repo_name, pr_number, pr_number2, include_raw=bool(data.get("include_raw")))
+    elif action == "fetch_pr_details" and pr_number:
+        return fetch_pr_details(repo_name, pr_number)
+    elif action == "fetch_all_repos":
+        return paginate_requested(fetch_all_repos(), data.get("cursor"), data.get("limit"))
+    elif action == "generate_code_review" and pr_number:
+        return {"review": generate_code_review(
+            repo_name, pr_number, token_budget, full=bool(data.get("full_review")))}
+    elif action == "generate_bdd_test_cases" and pr_number:
+        return {"bdd_tests": generate_bdd_test_cases(repo_name, pr_number, token_budget)}
+    elif action == "generate_bdd_from_repo":
+        paths, skipped = bdd_repo_paths(repo_name)
+        if not page_requested(data.get("cursor"), data.get("limit")):
+            return {"bdd_tests": generate_bdd_from_repo(repo_name, on_result, paths), "skipped_files": skipped}
+        # Only the requested page of files is analysed; the skipped ones are listed on the first
+        page, meta = paginate(paths, data.get("cursor"), data.get("limit"))
+        if not data.get("cursor"):
+            meta["skipped_files"] = skipped
+        return {"bdd_tests": generate_bdd_from_repo(repo_name, on_result, page), **meta}
+    elif action == "review_open_prs" and repo_name:
+        return review_open_prs(repo_name, data.get("cursor"), data.get("limit"),
+                               token_budget, full=bool(data.get("full_review")))
+    elif action == "fetch_all_pull_requests":
+        return fetch_all_pull_requests(data.get("cursor"), data.get("limit"))
+    raise ActionError(UNCLEAR_REQUEST)
+
+# Async counterparts of the I/O-bound actions. They keep the sync versions'
+# response shapes; gh is an AsyncGitHub open for the current request.
+async def fetch_pull_requests_async(gh, repo_name):
+    prs = await gh.paginate(f"/repos/{repo_name}/pulls", {"state": "open"})
+    return [{"title": pr["title"], "number": pr["number"]} for pr in prs]
+
+async def fetch_pr_details_async(gh, repo_name, pr_number):
+    pr = await gh.get_json(f"/repos/{repo_name}/pulls/{int(pr_number)}")
+    return {"title": pr["title"], "body": pr["body"], "user": pr["user"]["login"], "state": pr["state"]}
+
+async def fetch_all_repos_async(gh):
+    return [repo["full_name"] for repo in await gh.paginate("/user/repos")]
+
+async def fetch_all_pull_requests_async(gh, cursor=None, limit=None):
+    repos = await fetch_all_repos_async(gh)
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch(repo_name):
+        async with slots:
+            return await fetch_pull_requests_async(gh, repo_name)
+
+    outcomes = await asyncio.gather(*(fetch(repo_name) for repo_name in repos), return_exceptions=True)
+    outcomes = [(None, o) if isinstance(o, Exception) else (o, None) for o in outcomes]
+    return collect_pull_requests(repos, outcomes, cursor, limit)
+
+async def generate_snapshot_async(gh, repo_name, pr_number, byte_range=None, line_range=None):
+    key = None
+    try:
+        if not (byte_range or line_range):
+            key = snapshot_key(repo_name, await gh.get_json(f"/repos/{repo_name}/pulls/{pr_number}"))
+            cached = await asyncio.to_thread(get_result_cache().get, key)
+            if cached is not None:
+                return json.loads(cached)
+        text, info = await gh.read_capped(f"/repos/{repo_name}/pulls/{pr_number}", DIFF_MEDIA_TYPE,
+                                          byte_range, line_range)
+    except httpx.HTTPStatusError as e:
+        return {"snapshot": f"Error fetching PR diff: {e.response.status_code}"}
+    result = {"snapshot": text, **truncation_meta(info)}
+    if key:
+        await asyncio.to_thread(get_result_cache().set, key, json.dumps(result))
+    return result
+
+async def compare_snapshot_async(gh, repo_name, pr_number1, pr_number2, include_raw=False):
+    pr_numbers = [pr_number1, pr_number2]
+    fetched = await asyncio.gather(
+        *(gh.read_capped(f"/repos/{repo_name}/pulls/{n}", DIFF_MEDIA_TYPE, max_bytes=MAX_STREAM_BYTES)
+          for n in pr_numbers),
+        return_exceptions=True,
+    )
+    for pr_number, outcome in zip(pr_numbers, fetched):
+        if isinstance(outcome, httpx.HTTPStatusError):
+            raise ActionError(f"Error fetching PR #{pr_number} diff: {outcome.response.status_code}")
+        if isinstance(outcome, Exception):
+            raise outcome
+    (diff1, info1), (diff2, info2) = fetched
+
+    comparison = compare_diffs(diff1, diff2)
+    comparison["pr1"] = {"number": pr_number1, **truncation_meta(info1)}
+    comparison["pr2"] = {"number": pr_number2, **truncation_meta(info2)}
+    if include_raw:
+        comparison["pr1_diff"], comparison["pr2_diff"] = diff1, diff2
+    return {"comparison": comparison}
+
+async def run_chunked_async(template, prompt, diff_text, token_budget=None, context_fn=None):
+    """``run_chunked`` with the chunk prompts awaited together, at most REVIEW_CONCURRENCY at a time."""
+    chunks, skipped = chunk_diff(diff_text, review_token_budget(token_budget))
+    contexts = [await asyncio.to_thread(context_fn, chunk.text) if context_fn else "" for chunk in chunks]
+    prompts = [prompt.format(diff=chunk.text, context=context) for chunk, context in zip(chunks, contexts)]
+    limit = asyncio.Semaphore(REVIEW_CONCURRENCY)
+
+    async def generate(p):
+        async with limit:
+            return await generate_json_async(template, p)
+
+    outcomes = await asyncio.gather(*(generate(p) for p in prompts), return_exceptions=True)
+    meta = {
+        "chunks": len(chunks),
+        "tokens_sent": sum(estimate_tokens(p) for p in prompts),
+        "skipped_files": skipped,
+    }
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    raise_if_all_rate_limited(errors, len(outcomes))
+    if errors:
+        meta["errors"] = [str(error) for error in errors]
+    return [outcome for outcome in outcomes if not isinstance(outcome, Exception)], meta
+
+async def generate_bdd_test_cases_async(gh, repo_name, pr_number, token_budget=None):
+    diff_text = await gh.get_text(f"/repos/{repo_name}/pulls/{pr_number}", DIFF_MEDIA_TYPE)
+    context_fn = await asyncio.to_thread(diff_context_fn, repo_name)
+    results, meta = await run_chunked_async("bdd_diff", BDD_DIFF_PROMPT, diff_text, token_budget, context_fn)
+    if meta.get("errors") and not results:
+        return {"error": f"Failed to generate BDD test cases: {meta['errors'][0]}", **meta}
+    return {"test_cases": merge_test_cases(results), **meta}
+
+async def run_action_async(action, repo_name, additional_params, data):
+    """Async ``run_action``.
+
+    Reads and Gemini calls await httpx and the SDK's async client, so the
+    fan-out inside one request (chunks, PR pages) shares a single thread.
+    Flask still serves each request on a worker thread of its own. Actions built on PyGithub
+    or the thread-pooled pipelines (create_pr, fetch_repo_files,
+    generate_code_review, review_open_prs, generate_bdd_from_repo) and anything missing its
+    parameters run through ``run_action`` on a worker thread.
+    """
+    pr_number = additional_params.get("pr_number")
+    pr_number2 = additional_params.get("pr_number2") or data.get("pr_number2")
+    try:
+        byte_range = parse_range(data.get("bytes"))
+        line_range = parse_range(data.get("lines"))
+        decode_cursor(data.get("cursor"))
+        page_size(data.get("limit"))
+        parse_fields(data.get("fields"))
+        token_budget = review_token_budget(data.get("token_budget"))
+    except ValueError as e:
+        raise ActionError(str(e))
+
+    async with clients.async_github() as gh:
+        if action == "fetch_pull_requests":
+            return paginate_requested(await fetch_pull_requests_async(gh, repo_name),
+                                      data.get("cursor"), data.get("limit"))
+        elif action == "read_file" and additional_params.get("file_path"):
+            file_path = additional_params["file_path"]
+            text, info = await gh.read_capped(contents_url(repo_name, file_path, data.get("ref")),
+                                              RAW_MEDIA_TYPE, byte_range, line_range)
+            if not info["truncated"]:
+                return text
+            stream_url = f"/stream/file?repo={quote(repo_name)}&path={quote(file_path)}"
+            if data.get("ref"):
+                stream_url += f"&ref={quote(data['ref'])}"
+            return {"content": text, **truncation_meta(info), "stream_url": stream_url}
+        elif action == "generate_snapshot" and pr_number:
+            return await generate_snapshot_async(gh, repo_name, pr_number, byte_range, line_range)
+        elif action == "compare_snapshot" and pr_number and pr_number2:
+            return await compare_snapshot_async(gh, repo_name, pr_number, pr_number2,
+                                                include_raw=bool(data.get("include_raw")))
+        elif action == "fetch_pr_details" and pr_number:
+            return await fetch_pr_details_async(gh, repo_name, pr_number)
+        elif action == "fetch_all_repos":
+            return paginate_requested(await fetch_all_repos_async(gh), data.get("cursor"), data.get("limit"))
+        elif action == "fetch_all_pull_requests":
+            return await fetch_all_pull_requests_async(gh, data.get("cursor"), data.get("limit"))
+        elif action == "generate_bdd_test_cases" and pr_number:
+            return {"bdd_tests": await generate_bdd_test_cases_async(gh, repo_name, pr_number, token_budget)}
+    return await asyncio.to_thread(run_action, action, repo_name, additional_params, data)
+
+# List actions that can answer as newline-delimited JSON ("stream": true)
+STREAMABLE_ACTIONS = {"fetch_pull_requests", "fetch_repo_files", "fetch_all_repos", "generate_bdd_from_repo"}
+
+def iter_repo_files(repo_name, fields=None):
+    yield from fetch_repo_entries(repo_name) if fields else fetch_repo_files(repo_name)
+
+# Per-file results held for a streaming client before the pipeline waits on it
+BDD_STREAM_BUFFER = int(os.getenv("BDD_STREAM_BUFFER", "16"))
+
+def iter_bdd_from_repo(repo_name, cursor=None, limit=None, meta=None):
+    """generate_bdd_from_repo's per-file results as ``{"path", ...}``, in the order they finish.
+
+    Only the requested page of files is analysed; its paging info goes into
+    ``meta``, and so do the files skipped, unless this is a later page.
+    """
+    meta = {} if meta is None else meta
+    paths, skipped = bdd_repo_paths(repo_name)
+    if not cursor:
+        meta["skipped_files"] = skipped
+    if page_requested(cursor, limit):
+        paths, page_meta = paginate(paths, cursor, limit)
+        meta.update(page_meta)
+    # Bounded, so the pipeline waits for a slow client instead of piling up results
+    results = queue.Queue(maxsize=BDD_STREAM_BUFFER)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def run():
         try:
-            file_content = read_file(repo_name, file_path)
-            bdd_prompt = f"""
-            Analyze the following code and generate BDD-style test cases.
-            Return JSON in this format:
-            {{
-              "test_cases": [
-                {{
-                  "feature": "<feature_name>",
-                  "given": "<precondition>",
-                  "when": "<action>",
-                  "then": "<expected_outcome>",
-                  "scenario": "<scenario_description>"
-                }}
-              ]
-            }}
-            Code:
-            {file_content}
-            """
-            model = genai.GenerativeModel("gemini-1.5-pro-latest")
-            response = model.generate_content(bdd_prompt)
-            response_text = response.candidates[0].content.parts[0].text
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            json_string = json_match.group(1) if json_match else response_text.strip()
-            test_cases[file_path] = json.loads(json_string)
+            generate_bdd_from_repo(repo_name, lambda path, result: put({"path": path, **result}), paths, stop)
+            put(None)
         except Exception as e:
-            
-            test_cases[file_path] = {"error": str(e)}
-    return test_cases
+            put(e)
+
+    threading.Thread(target=metrics.bind(run), daemon=True).start()
+    count = 0
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            count += 1
+            yield item
+    finally:
+        # Also reached when the client disconnects, so the files not yet started are dropped
+        stop.set()
+    meta["count"] = count
+
+def stream_action(current_user, action, repo_name, data, headers):
+    """NDJSON response with one line per item of a list action, sent as items arrive.
+
+    The last line is ``{"done": true, "count", "next_cursor"}``, or an error.
+    Items are fetched lazily, so the first bytes go out before the list is
+    complete and memory does not grow with its length.
+    """
+    if action not in STREAMABLE_ACTIONS:
+        raise ActionError(f"Streaming is only available for {', '.join(sorted(STREAMABLE_ACTIONS))}.")
+    cursor, limit = data.get("cursor"), data.get("limit")
+    try:
+        decode_cursor(cursor)
+        page_size(limit)
+        fields = parse_fields(data.get("fields"))
+    except ValueError as e:
+        raise ActionError(str(e))
+    meta = {}
+    timer = metrics.current()
+    profile = bool(request.headers.get("X-Profile"))
+
+    def items():
+        # The body is produced after the view returns; its GitHub and Gemini calls count toward this request
+        rate_limit.current_user.set(current_user)
+        metrics.use(timer)
+        if action == "generate_bdd_from_repo":
+            source = iter_bdd_from_repo(repo_name, cursor, limit, meta)
+        elif action == "fetch_pull_requests":
+            source = iter_page(iter_pull_requests(repo_name), cursor, limit, meta)
+        elif action == "fetch_all_repos":
+            source = iter_page(iter_all_repos(), cursor, limit, meta)
+        else:
+            source = iter_page(iter_repo_files(repo_name, fields), cursor, limit, meta)
+        for item in source:
+            yield select_fields(item, fields)
+
+    # The file list arrives whole and is sent in batches; the other sources wait
+    # on GitHub or Gemini between items, so each line goes out as soon as it exists
+    flush_bytes = NDJSON_FLUSH_BYTES if action == "fetch_repo_files" else 0
+    def trailer():
+        # Server-Timing went out with the headers, before the body's work was done
+        if profile and timer is not None:
+            return {"done": True, **meta, "server_timing": metrics.server_timing(timer)}
+        return {"done": True, **meta}
+
+    body = ndjson_lines(items(), trailer, flush_bytes)
+    # Not stream_with_context: the body needs nothing from the request, and the
+    # async route's request context can't be re-entered from the WSGI thread
+    return Response(body, mimetype="application/x-ndjson",
+                    headers={**headers, "Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+def rate_limited(retry_after, message, headers=None):
+    """429 response telling the client how long to back off."""
+    retry_after = max(1, math.ceil(retry_after))
+    return (jsonify({"error": message, "retry_after": retry_after}), 429,
+            {**(headers or {}), "Retry-After": str(retry_after)})
+
+def action_cost(action, data):
+    """Budget ``action`` takes; actions working on a page of items are charged for the whole page."""
+    items = 1
+    if action in rate_limit.PER_ITEM_COSTS:
+        try:
+            items = page_size(data.get("limit"))
+        except ValueError:
+            pass  # Rejected when the action runs
+    # A large page can cost more than a full budget; it then takes all of it instead of never fitting
+    return min(rate_limit.action_cost(action, items), rate_limit.user_limiter.burst)
+
+def charge_user(current_user, cost, headers=None):
+    """Charge ``cost`` to the user's budget; a 429 response if it is spent, else None."""
+    wait = rate_limit.user_limiter.charge(current_user, cost)
+    if wait > 0:
+        return rate_limited(wait, "Too many requests; slow down.", headers)
+    return None
+
+def submit_job(current_user, action, repo_name, additional_params, data):
+    """Queue ``action`` as a background job and describe where to follow it."""
+    def job(emit):
+        # Job threads start without the request's context
+        rate_limit.current_user.set(current_user)
+        result = select_fields(run_action(action, repo_name, additional_params, data, on_result=emit),
+                               parse_fields(data.get("fields")))
+        if action == "generate_bdd_from_repo" and isinstance(result, dict):
+            # Each file's tests were already stored as a partial result
+            result.pop("bdd_tests", None)
+        return result
+
+    job_id = get_job_manager().submit(current_user, action, metrics.tracked(action, job))
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    })
 
 # Main GitHub action endpoint
-@app.route('/github-action', methods=['POST'])
+@bp.route('/github-action', methods=['POST'])
 @token_required
 def github_action(current_user):
     data = request.get_json()
     if not data or "prompt" not in data:
         return jsonify({"error": "Please provide a prompt to proceed."}), 400
 
+    # Charged before resolving, which may itself call Gemini
+    limited = charge_user(current_user, rate_limit.INTENT_COST)
+    if limited:
+        return limited
+
     user_prompt = data["prompt"]
-    gemini_response = call_gemini(user_prompt)
+    gemini_response, route = resolve_intent(user_prompt, data)
+    headers = {"X-Intent-Route": route}
 
     if "error" in gemini_response:
-        return jsonify({"error": gemini_response["error"]}), 400
+        metrics.set_action("unresolved")
+        return jsonify({"error": gemini_response["error"]}), 400, headers
 
     action = gemini_response.get("action")
+    metrics.set_action(action or "unresolved")
     repo_name = gemini_response.get("repo")
-    additional_params = gemini_response.get("additional_params", {})
-    pr_number = additional_params.get("pr_number")
+    additional_params = gemini_response.get("additional_params") or {}
 
-    try:
-        if action == "fetch_pull_requests":
-            result = fetch_pull_requests(repo_name)
-        elif action == "fetch_repo_files":
-            result = fetch_repo_files(repo_name)
-        elif action == "read_file" and additional_params.get("file_path"):
-            result = read_file(repo_name, additional_params["file_path"])
-        elif action == "create_pr":
-            branch_name = data.get("branch_name")
-            title = data.get("title")
-            body = data.get("body")
-            if not (branch_name and title and body):
-                return jsonify({"error": "Missing required parameters for creating a PR."}), 400
-            result = {"pr_url": create_pr(repo_name, branch_name, title, body)}
-        elif action == "generate_snapshot" and pr_number:
-            result = {"snapshot": generate_snapshot(repo_name, pr_number)}
-        elif action == "compare_snapshot" and pr_number and data.get("pr_number2"):
-            result = compare_snapshot(repo_name, pr_number, data["pr_number2"])
-        elif action == "fetch_pr_details" and pr_number:
-            result = fetch_pr_details(repo_name, pr_number)
-        elif action == "fetch_all_repos":
-            result = fetch_all_repos()
-        elif action == "generate_code_review" and pr_number:
-            result = {"review": generate_code_review(repo_name, pr_number)}
-        elif action == "generate_bdd_test_cases" and pr_number:
-            result = {"bdd_tests": generate_bdd_test_cases(repo_name, pr_number)}
-        elif action == "generate_bdd_from_repo":
-            result = {"bdd_tests": generate_bdd_from_repo(repo_name)}
-        else:
-            return jsonify({"error": "I couldn't understand your request. Please try rephrasing or check the help section for examples."}), 400
+    # The intent cost was charged up front
+    limited = charge_user(current_user, action_cost(action, data) - rate_limit.INTENT_COST, headers)
+    if limited:
+        return limited
 
-        return jsonify({"result": result})
+    if data.get("stream"):
+        try:
+            return stream_action(current_user, action, repo_name, data, headers)
+        except ActionError as e:
+            return jsonify({"error": str(e)}), 400, headers
+
+    if data.get("async") and action in LONG_RUNNING_ACTIONS:
+        return submit_job(current_user, action, repo_name, additional_params, data), 202, headers
+
+    try:
+        result = run_action(action, repo_name, additional_params, data)
+        with metrics.span("serialize"):
+            response = jsonify({"result": select_fields(result, parse_fields(data.get("fields")))})
+        return response, 200, headers
+    except ActionError as e:
+        return jsonify({"error": str(e)}), 400, headers
+    except RateLimited as e:
+        return rate_limited(e.retry_after, str(e), headers)
     except Exception as e:
         # logger.error(f"Error processing action {action}: {str(e)}", exc_info=True)
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500, headers
+
+@bp.route('/github-action/async', methods=['POST'])
+@token_required
+async def github_action_async(current_user):
+    """``/github-action`` on the asyncio path: same request and response, awaited upstream I/O."""
+    try:
+        return await serve_action_async(current_user)
+    finally:
+        # Flask closes this view's event loop once it returns
+        await clients.close_async()
+
+async def serve_action_async(current_user):
+    data = request.get_json()
+    if not data or "prompt" not in data:
+        return jsonify({"error": "Please provide a prompt to proceed."}), 400
+
+    limited = charge_user(current_user, rate_limit.INTENT_COST)
+    if limited:
+        return limited
+
+    gemini_response, route = await resolve_intent_async(data["prompt"], data)
+    headers = {"X-Intent-Route": route}
+
+    if "error" in gemini_response:
+        metrics.set_action("unresolved")
+        return jsonify({"error": gemini_response["error"]}), 400, headers
+
+    action = gemini_response.get("action")
+    repo_name = gemini_response.get("repo")
+    additional_params = gemini_response.get("additional_params") or {}
+    metrics.set_action(action or "unresolved")
+
+    # The intent cost was charged up front
+    limited = charge_user(current_user, action_cost(action, data) - rate_limit.INTENT_COST, headers)
+    if limited:
+        return limited
+
+    if data.get("stream"):
+        try:
+            return stream_action(current_user, action, repo_name, data, headers)
+        except ActionError as e:
+            return jsonify({"error": str(e)}), 400, headers
+
+    if data.get("async") and action in LONG_RUNNING_ACTIONS:
+        return submit_job(current_user, action, repo_name, additional_params, data), 202, headers
+
+    try:
+        result = await run_action_async(action, repo_name, additional_params, data)
+        with metrics.span("serialize"):
+            response = jsonify({"result": select_fields(result, parse_fields(data.get("fields")))})
+        return response, 200, headers
+    except ActionError as e:
+        return jsonify({"error": str(e)}), 400, headers
+    except RateLimited as e:
+        return rate_limited(e.retry_after, str(e), headers)
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500, headers
+
+def stream_response(chunks, info, ranged):
+    """Stream ``chunks`` as text, announcing the cap up front and marking a cut-off the client could not foresee."""
+    headers = {"X-Max-Bytes": str(info["max_bytes"]), "Cache-Control": "no-store"}
+    announced = not ranged and info["total_bytes"] is not None and info["total_bytes"] > info["max_bytes"]
+    if info["total_bytes"] is not None:
+        headers["X-Total-Bytes"] = str(info["total_bytes"])
+    if announced:
+        headers["X-Truncated"] = "true"
+
+    def generate():
+        yield from chunks
+        if info["truncated"] and not announced:
+            yield f"\n[truncated after {info['bytes']} bytes]\n".encode()
+
+    return Response(stream_with_context(generate()), mimetype="text/plain; charset=utf-8", headers=headers)
+
+def stream_args():
+    """Common query parameters of the /stream endpoints."""
+    try:
+        max_bytes = int(request.args.get("max_bytes", MAX_STREAM_BYTES))
+    except ValueError:
+        raise ValueError("max_bytes must be an integer.")
+    if max_bytes < 1:
+        raise ValueError("max_bytes must be at least 1.")
+    max_bytes = min(max_bytes, MAX_STREAM_BYTES)
+    return parse_range(request.args.get("bytes")), parse_range(request.args.get("lines")), max_bytes
+
+@bp.route('/stream/snapshot', methods=['GET'])
+@token_required
+def stream_snapshot(current_user):
+    repo_name, pr_number = request.args.get("repo"), request.args.get("pr")
+    if not repo_name or not pr_number:
+        return jsonify({"error": "repo and pr are required."}), 400
+    try:
+        byte_range, line_range, max_bytes = stream_args()
+        chunks, info = open_stream(clients.http(), pull_url(repo_name, pr_number), DIFF_MEDIA_TYPE,
+                                   byte_range, line_range, max_bytes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.HTTPError as e:
+        return jsonify({"error": f"Error fetching PR diff: {e.response.status_code}"}), e.response.status_code
+    return stream_response(chunks, info, byte_range or line_range)
+
+@bp.route('/stream/file', methods=['GET'])
+@token_required
+def stream_file(current_user):
+    repo_name, file_path = request.args.get("repo"), request.args.get("path")
+    if not repo_name or not file_path:
+        return jsonify({"error": "repo and path are required."}), 400
+    try:
+        byte_range, line_range, max_bytes = stream_args()
+        chunks, info = open_stream(clients.http(), contents_url(repo_name, file_path, request.args.get("ref")),
+                                   RAW_MEDIA_TYPE, byte_range, line_range, max_bytes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except requests.HTTPError as e:
+        return jsonify({"error": f"Error fetching file: {e.response.status_code}"}), e.response.status_code
+    return stream_response(chunks, info, byte_range or line_range)
+
+@bp.route('/stream/compare', methods=['GET'])
+@token_required
+def stream_compare(current_user):
+    """Both PR diffs back to back, each under its own "=== PR #n ===" line and size cap."""
+    repo_name, pr_number1, pr_number2 = request.args.get("repo"), request.args.get("pr1"), request.args.get("pr2")
+    if not repo_name or not pr_number1 or not pr_number2:
+        return jsonify({"error": "repo, pr1 and pr2 are required."}), 400
+    try:
+        _, _, max_bytes = stream_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        for pr_number in (pr_number1, pr_number2):
+            yield f"=== PR #{pr_number} ===\n".encode()
+            try:
+                chunks, info = open_stream(clients.http(), pull_url(repo_name, pr_number), DIFF_MEDIA_TYPE,
+                                           max_bytes=max_bytes)
+            except requests.HTTPError as e:
+                yield f"Error fetching PR diff: {e.response.status_code}\n".encode()
+                continue
+            yield from chunks
+            if info["truncated"]:
+                yield f"\n[truncated after {info['bytes']} bytes]\n".encode()
+
+    return Response(stream_with_context(generate()), mimetype="text/plain; charset=utf-8",
+                    headers={"X-Max-Bytes": str(max_bytes), "Cache-Control": "no-store"})
+
+@bp.route('/webhooks/github', methods=['POST'])
+def github_webhook():
+    """Precompute for pull_request opened/synchronize/reopened deliveries; everything else is acknowledged."""
+    if not GITHUB_WEBHOOK_SECRET:
+        return jsonify({"error": "Webhooks are not configured."}), 503
+    if not webhooks.verify_signature(GITHUB_WEBHOOK_SECRET, request.get_data(),
+                                     request.headers.get("X-Hub-Signature-256")):
+        return jsonify({"error": "Invalid signature."}), 401
+
+    event = request.headers.get("X-GitHub-Event")
+    if event == "ping":
+        return jsonify({"message": "pong"})
+    target = webhooks.pull_request_target(event, request.get_json(silent=True))
+    if target is None:
+        return jsonify({"message": "Ignored."})
+    repo_name, pr_number, head_sha = target
+
+    def job(emit):
+        # Webhook work shares upstream slots per repo, like a user
+        rate_limit.current_user.set(f"webhook:{repo_name}")
+        return precompute_pr(repo_name, pr_number, head_sha, emit)
+
+    job_id = get_job_manager().submit("webhook", "precompute_pr", metrics.tracked("precompute_pr", job))
+    return jsonify({"job_id": job_id, "repo": repo_name, "pr_number": pr_number, "head_sha": head_sha}), 202
+
+@bp.before_app_request
+def start_request_timer():
+    metrics.start()
+
+@bp.after_app_request
+def record_request_timing(response):
+    timer = metrics.current()
+    if timer is None:
+        return response
+    endpoint, status = request.endpoint or "unmatched", str(response.status_code)
+
+    def done():
+        metrics.request_seconds.observe(timer.elapsed(), endpoint, status)
+        metrics.finish(timer)
+
+    if response.is_streamed:
+        # A streamed body does its work after this hook; time it until the body is closed
+        response.call_on_close(done)
+        return response
+    done()
+    if request.headers.get("X-Profile"):
+        response.headers["Server-Timing"] = metrics.server_timing(timer)
+    return response
+
+# Registered after the timing hook so it runs first: compression counts toward the request's time
+@bp.after_app_request
+def compress_response(response):
+    with metrics.span("serialize"):
+        return compression.compress_response(response, request.accept_encodings)
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; protected by METRICS_TOKEN when it is set."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Invalid metrics token."}), 401
+    rate_limits = clients.stats().get("rate_limit", {})
+    return Response(metrics.render(rate_limits), mimetype="text/plain; version=0.0.4")
+
+@bp.app_errorhandler(RateLimited)
+def handle_rate_limited(e):
+    return rate_limited(e.retry_after, str(e))
+
+@bp.route('/cache-stats', methods=['GET'])
+@token_required
+def cache_stats(current_user):
+    return jsonify({
+        "llm": get_llm_cache().stats(),
+        "results": get_result_cache().stats(),
+        "github": clients.stats(),
+        "tokens": get_token_cache().stats(),
+        "slots": {"github": rate_limit.github_gate.stats(), "gemini": rate_limit.gemini_gate.stats()},
+        "repo_index": get_repo_index().stats() if get_repo_index() else None,
+    })
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def job_status(current_user, job_id):
+    job = get_job_manager().get(job_id, current_user)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
+
+@bp.route('/jobs/<job_id>/events', methods=['GET'])
+@token_required
+def job_events(current_user, job_id):
+    if not get_job_manager().get(job_id, current_user, with_partials=False):
+        return jsonify({"error": "Job not found."}), 404
+    return Response(
+        stream_with_context(get_job_manager().events(job_id, current_user)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server; run wsgi:app under gunicorn (see gunicorn.conf.py) in production
+    create_app().run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")),
+                     debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
 
 
@@ -0,0 +1,116 @@
+"""Bounded-parallel fetch + generate pipeline for repository-wide BDD generation."""
+import os
+import posixpath
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from metrics import bind
+
+GITHUB_CONCURRENCY = int(os.getenv("BDD_GITHUB_CONCURRENCY", "8"))
+GEMINI_CONCURRENCY = int(os.getenv("BDD_GEMINI_CONCURRENCY", "4"))
+MAX_FILE_BYTES = int(os.getenv("BDD_MAX_FILE_BYTES", "100000"))
+
+VENDORED_DIRS = {
+    "node_modules", "vendor", "third_party", "third-party", "bower_components",
+    "dist", "build", "site-packages", "venv", ".venv", "__pycache__", ".git",
+}
+BINARY_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".svg", ".pdf",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war",
+    ".exe", ".dll", ".so", ".dylib", ".a", ".o", ".class", ".pyc", ".whl",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot", ".mp3", ".mp4", ".mov", ".avi",
+    ".wav", ".db", ".sqlite", ".bin", ".pkl", ".npy", ".parquet",
+}
+GENERATED_FILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock",
+    "Pipfile.lock", "Cargo.lock", "composer.lock", "Gemfile.lock", "go.sum",
+}
+
+
+def skip_reason(entry, max_bytes=MAX_FILE_BYTES):
+    """Return why a tree entry should not be sent to the model, or None to keep it."""
+    path = entry["path"]
+    name = posixpath.basename(path)
+    if any(part in VENDORED_DIRS for part in path.split("/")[:-1]):
+        return "vendored"
+    if name in GENERATED_FILES or name.endswith((".min.js", ".min.css", ".map")):
+        return "generated"
+    if posixpath.splitext(name)[1].lower() in BINARY_EXTENSIONS:
+        return "binary"
+    if entry.get("size") is not None and entry["size"] > max_bytes:
+        return "oversized"
+    if entry.get("size") == 0:
+        return "empty"
+    return None
+
+
+def select_files(entries, max_bytes=MAX_FILE_BYTES):
+    """Split tree entries into files worth analysing and a {path: reason} skip map."""
+    kept, skipped = [], {}
+    for entry in entries:
+        if entry.get("type", "blob") != "blob":
+            continue
+        reason = skip_reason(entry, max_bytes)
+        if reason:
+            skipped[entry["path"]] = reason
+        else:
+            kept.append(entry)
+    return kept, skipped
+
+
+def run_bdd_pipeline(paths, read_fn, generate_fn, github_workers=GITHUB_CONCURRENCY,
+                     gemini_workers=GEMINI_CONCURRENCY, on_result=None, stop=None):
+    """Fetch and analyse ``paths`` concurrently, returning {path: result} in input order.
+
+    ``read_fn(path)`` returns the file text and ``generate_fn(path, content)``
+    returns the per-file result. Each stage has its own worker limit, and a
+    file is handed to the model as soon as its content arrives. Failures are
+    recorded as ``{"error": ...}`` for that file. ``on_result(path, result)``
+    is called as each file finishes. Setting the ``stop`` event cancels the
+    files not yet started; only those already finished are returned.
+    """
+    results = {}
+
+    def stopped():
+        return stop is not None and stop.is_set()
+
+    def record(path, result):
+        results[path] = result
+        if on_result:
+            on_result(path, result)
+
+    pending = iter(paths)
+    # Files in either stage at once: enough to keep both pools busy, few enough
+    # that a blocked ``on_result`` holds back new work instead of queueing the repo
+    window = github_workers + gemini_workers
+    with ThreadPoolExecutor(max_workers=github_workers) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=gemini_workers) as gemini_pool:
+        read_fn, generate_fn = bind(read_fn), bind(generate_fn)
+        fetches, generations = {}, {}
+        while not stopped():
+            for path in islice(pending, window - len(fetches) - len(generations)):
+                fetches[fetch_pool.submit(read_fn, path)] = path
+            if not fetches and not generations:
+                break
+            done, _ = wait([*fetches, *generations], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetches:
+                    path = fetches.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        record(path, {"error": str(e)})
+                        continue
+                    generations[gemini_pool.submit(generate_fn, path, content)] = path
+                else:
+                    path = generations.pop(future)
+                    try:
+                        record(path, future.result())
+                    except Exception as e:
+                        record(path, {"error": str(e)})
+
+        if stopped():
+            fetch_pool.shutdown(cancel_futures=True)
+            gemini_pool.shutdown(cancel_futures=True)
+
+    return {path: results[path] for path in paths if path in results}
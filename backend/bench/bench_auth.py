@@ -0,0 +1,145 @@
+"""Login and authenticated-request throughput with thousands of users.
+
+Seeds ``--users`` accounts, then drives the real Flask routes: POST /login
+for a sample of them, and GET /jobs/<id> (auth plus one job-store lookup)
+with each user's token, once with the verified-token cache disabled and once
+with it enabled. Users live in bench/fakes.py's in-memory collection unless
+--mongo-uri points at a real server, in which case a scratch database is
+used and dropped afterwards.
+
+Login cost is almost all password hashing, so its throughput follows
+--iterations (PBKDF2 rounds; the default is PASSWORD_HASH_ITERATIONS).
+
+Usage: python bench/bench_auth.py [--users 5000] [--logins 50] [--requests 20000] [--concurrency 8]
+           [--iterations 600000] [--mongo-uri mongodb://localhost:27017] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from bench_load import RssSampler, percentile  # noqa: E402
+from fakes import FakeUsersCollection  # noqa: E402
+
+PASSWORD = "bench-password"
+
+
+def run(requests, concurrency, send):
+    def one(i):
+        start = time.perf_counter()
+        status = send(i)
+        return time.perf_counter() - start, status
+
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - start
+    latencies = [seconds * 1000 for seconds, _ in outcomes]
+    return {
+        "requests": requests, "errors": sum(1 for _, status in outcomes if status not in (200, 404)),
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "p99_ms": percentile(latencies, 99),
+        "throughput_rps": requests / wall if wall else 0.0, "peak_rss_mb": sampler.peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--logins", type=int, default=50, help="login requests, spread over random users")
+    parser.add_argument("--requests", type=int, default=20000, help="authenticated requests per cache setting")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--iterations", type=int, help="PBKDF2 rounds for password hashes")
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.0, help="delay per fake collection call")
+    parser.add_argument("--mongo-uri", help="use this Mongo server instead of the in-memory collection")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("JOB_STORE", "file")
+    os.environ.setdefault("JOB_STORE_DIR", tempfile.mkdtemp(prefix="bench-jobs-"))
+    os.environ["REPO_INDEX"] = "0"
+    if args.iterations:
+        os.environ["PASSWORD_HASH_ITERATIONS"] = str(args.iterations)
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ["MONGO_DB"] = f"bench_auth_{os.getpid()}"
+
+    import jwt
+    import auth
+    import backend
+
+    if args.mongo_uri:
+        users = backend.get_users()
+    else:
+        users = FakeUsersCollection(latency_ms=args.mongo_latency_ms)
+        backend.get_users = lambda: users
+    store = backend.get_user_store()
+
+    # One hash for every seeded user: hashing thousands of passwords at full cost would take minutes
+    start = time.perf_counter()
+    password_hash = auth.hash_password(PASSWORD, store.iterations)
+    hash_ms = (time.perf_counter() - start) * 1000
+    names = [f"user{i:06d}" for i in range(args.users)]
+    docs = [{"username": name, "password": password_hash} for name in names]
+    if args.mongo_uri:
+        users.insert_many(docs)
+    else:
+        users.docs.extend(docs)
+    print(f"{args.users} users, pbkdf2:sha256 x {store.iterations}: {hash_ms:.1f} ms per hash")
+
+    app = backend.create_app()
+    client = app.test_client()
+    secret = app.config["SECRET_KEY"]
+    tokens = [jwt.encode({"username": name, "exp": int(time.time()) + 3600}, secret, algorithm="HS256")
+              for name in names]
+    rng = random.Random(0)
+
+    def login(i):
+        name = rng.choice(names)
+        return client.post("/login", json={"username": name, "password": PASSWORD}).status_code
+
+    def authenticated(i):
+        headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        return client.get("/jobs/missing", headers=headers).status_code
+
+    scenarios = [("login", args.logins, login, None),
+                 ("auth_no_cache", args.requests, authenticated, 0),
+                 ("auth_cached", args.requests, authenticated, auth.TOKEN_CACHE_SIZE)]
+    results = {}
+    print(f"{'scenario':>14} {'reqs':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'rss MB':>7}")
+    try:
+        for name, requests, send, cache_size in scenarios:
+            if cache_size is not None:
+                backend._shared["token_cache"] = auth.TokenCache(max_entries=cache_size)
+            stats = run(requests, min(args.concurrency, max(requests, 1)), send)
+            if cache_size:
+                stats["token_cache"] = backend.get_token_cache().stats()
+            results[name] = stats
+            print(f"{name:>14} {stats['requests']:>6} {stats['errors']:>4} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['throughput_rps']:>9.1f} "
+                  f"{stats['peak_rss_mb']:>7.1f}")
+    finally:
+        if args.mongo_uri:
+            backend.clients.mongo().drop_database(backend.MONGO_DB)
+
+    print(f"token cache: {results['auth_cached']['token_cache']}")
+    if not args.mongo_uri:
+        print(f"documents scanned by unindexed lookups: {users.scanned}")
+    if store.index_error:
+        print(f"username index not created: {store.index_error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "hash_ms": hash_ms, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
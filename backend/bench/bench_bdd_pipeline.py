@@ -0,0 +1,74 @@
+"""Throughput of generate_bdd_from_repo's pipeline against stubbed GitHub/Gemini calls.
+
+Usage: python bench/bench_bdd_pipeline.py [--files 300] [--github-ms 80] [--gemini-ms 600]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bdd_pipeline import run_bdd_pipeline  # noqa: E402
+
+
+def make_stubs(github_ms, gemini_ms):
+    def read_fn(path):
+        time.sleep(github_ms / 1000)
+        return f"def {path.replace('/', '_').replace('.', '_')}():\n    return 1\n"
+
+    def generate_fn(path, content):
+        time.sleep(gemini_ms / 1000)
+        return {"test_cases": [{"feature": path, "given": "", "when": "", "then": "", "scenario": ""}]}
+
+    return read_fn, generate_fn
+
+
+def serial(paths, read_fn, generate_fn):
+    """The original one-file-at-a-time loop."""
+    results = {}
+    for path in paths:
+        try:
+            results[path] = generate_fn(path, read_fn(path))
+        except Exception as e:
+            results[path] = {"error": str(e)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--github-ms", type=float, default=80)
+    parser.add_argument("--gemini-ms", type=float, default=600)
+    parser.add_argument("--github-workers", type=int, default=8)
+    parser.add_argument("--gemini-workers", type=int, default=16)
+    parser.add_argument("--skip-serial", action="store_true",
+                        help="only time the pipeline (the serial run is slow for large --files)")
+    args = parser.parse_args()
+
+    paths = [f"src/module_{i}.py" for i in range(args.files)]
+    read_fn, generate_fn = make_stubs(args.github_ms, args.gemini_ms)
+
+    timings = {}
+    if not args.skip_serial:
+        start = time.perf_counter()
+        expected = serial(paths, read_fn, generate_fn)
+        timings["serial"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = run_bdd_pipeline(paths, read_fn, generate_fn,
+                               github_workers=args.github_workers,
+                               gemini_workers=args.gemini_workers)
+    timings["pipeline"] = time.perf_counter() - start
+
+    if not args.skip_serial:
+        assert results == expected, "pipeline output differs from the serial loop"
+
+    for name, elapsed in timings.items():
+        print(f"{name:>8}: {elapsed:8.2f}s  {args.files / elapsed:8.1f} files/s")
+    if "serial" in timings:
+        print(f"{'speedup':>8}: {timings['serial'] / timings['pipeline']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Per-request latency of bare requests.get versus the registry's pooled session.
+
+By default it targets a local keep-alive HTTP server, which shows the TCP
+setup cost only. Pass --url with an https:// endpoint to include the TLS
+handshake as well, e.g. --url https://api.github.com/zen.
+
+Usage: python bench/bench_http_session.py [--requests 200] [--url URL]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clients import ClientRegistry  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b"diff --git a/x b/x\n" * 64
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(fetch, url, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fetch(url).content
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print(f"{name:>14}: mean {statistics.mean(samples):7.3f}ms  "
+          f"p50 {samples[len(samples) // 2]:7.3f}ms  p95 {samples[int(0.95 * (len(samples) - 1))]:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/repos/o/r/pulls/1"
+
+    # No token: a benchmark has no business sending credentials to --url
+    session = ClientRegistry(github_token=None).http()
+    session.get(url).content  # warm the pool
+
+    report("requests.get", measure(requests.get, url, args.requests))
+    report("pooled session", measure(session.get, url, args.requests))
+
+
+if __name__ == "__main__":
+    main()
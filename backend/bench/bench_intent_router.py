@@ -0,0 +1,80 @@
+"""Routing latency and accuracy of the local intent router over bench/intent_corpus.json.
+
+Prompts the router is not confident about are counted as LLM fallbacks;
+--llm-ms sets the simulated Gemini latency used for the blended estimate.
+
+Usage: python bench/bench_intent_router.py [--threshold 0.8] [--llm-ms 2500] [--verbose]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from intent_router import route  # noqa: E402
+
+
+def expected_of(case):
+    return (case["action"], case["repo"], case["pr_number"], case["pr_number2"], case["file_path"])
+
+
+def routed_of(intent):
+    params = intent["additional_params"]
+    return (intent["action"], intent["repo"], params.get("pr_number"), params.get("pr_number2"), params.get("file_path"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=os.path.join(HERE, "intent_corpus.json"))
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8")))
+    parser.add_argument("--llm-ms", type=float, default=2500)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    latencies = []
+    local = correct = wrong = deferred_ok = 0
+    for case in corpus:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            intent, confidence = route(case["prompt"])
+        latencies.append((time.perf_counter() - start) / args.repeat)
+
+        served_locally = intent is not None and confidence >= args.threshold
+        if not served_locally:
+            if case["action"] is None:
+                deferred_ok += 1
+            elif args.verbose:
+                print(f"fallback  {case['prompt']!r}")
+            continue
+        local += 1
+        if case["action"] is not None and routed_of(intent) == expected_of(case):
+            correct += 1
+        else:
+            wrong += 1
+            if args.verbose:
+                print(f"wrong     {case['prompt']!r}: {routed_of(intent)} != {expected_of(case)}")
+
+    routable = sum(1 for case in corpus if case["action"] is not None)
+    latencies_us = sorted(t * 1e6 for t in latencies)
+    fallback_share = (len(corpus) - local) / len(corpus)
+    blended_ms = statistics.mean(latencies_us) / 1000 + fallback_share * args.llm_ms
+
+    print(f"prompts:            {len(corpus)} ({routable} with a single clear action)")
+    print(f"served locally:     {local} ({local / len(corpus):.0%})")
+    print(f"local accuracy:     {correct}/{local} correct, {wrong} misrouted")
+    print(f"vague kept for LLM: {deferred_ok}/{len(corpus) - routable}")
+    print(f"local latency:      mean {statistics.mean(latencies_us):.1f}us  "
+          f"p95 {latencies_us[int(0.95 * (len(latencies_us) - 1))]:.1f}us")
+    print(f"mean routing time:  {blended_ms:.0f}ms with router vs {args.llm_ms:.0f}ms LLM-only")
+
+
+if __name__ == "__main__":
+    main()
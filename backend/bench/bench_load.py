@@ -0,0 +1,181 @@
+"""Offline load test of /github-action against local GitHub and Gemini stand-ins.
+
+Every action is driven through the real Flask route (JWT check, intent
+routing, GitHub client, chunking, caches) with the network replaced by
+bench/fakes.py. generate_bdd_from_repo runs once per synthetic repo size.
+Reports p50/p95/p99 latency, throughput and peak RSS per scenario; --json
+writes the same numbers for comparison between runs.
+
+--async sends the same requests to /github-action/async instead.
+
+Usage: python bench/bench_load.py [--requests 50] [--concurrency 8] [--async]
+           [--github-latency-ms 20] [--gemini-latency-ms 300] [--error-rate 0.01]
+           [--repo-sizes 10,100,1000,10000] [--actions review,bdd_repo] [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeGitHub, FakeGeminiModel  # noqa: E402
+
+REPO = "bench/repo-100"
+
+# name -> (prompt, extra request fields)
+SCENARIOS = {
+    "list_prs": (f"list open pull requests in {REPO}", {}),
+    "list_files": (f"list files in {REPO}", {}),
+    "read_file": (f"read file src/pkg_1/mod_1.py in {REPO}", {}),
+    "create_pr": (f"open a new PR in {REPO}", {"branch_name": "feature", "title": "Bench", "body": "Bench"}),
+    "snapshot": (f"snapshot of PR #3 in {REPO}", {}),
+    "compare": (f"compare PR #3 and PR #4 in {REPO}", {}),
+    "pr_details": (f"show details of PR #3 in {REPO}", {}),
+    "all_repos": ("list all my repos", {}),
+    "review": (f"review PR #3 in {REPO}", {"full_review": True}),
+    "review_all": (f"review all open PRs in {REPO}", {"full_review": True}),
+    "all_prs": ("list PRs across all my repos", {"limit": 10}),
+    "bdd_pr": (f"generate BDD test cases for PR #3 in {REPO}", {}),
+    "intent_llm": ("could you help me with something in my project", {}),
+}
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)]
+
+
+def rss_mb():
+    """Current resident set size, from /proc where available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler:
+    """Tracks the peak RSS while a scenario runs."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def run_scenario(client, path, headers, prompt, extra, requests, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        response = client.post(path, json={"prompt": prompt, **extra}, headers=headers)
+        return time.perf_counter() - start, response.status_code
+
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - start
+
+    latencies = [seconds * 1000 for seconds, _ in outcomes]
+    errors = sum(1 for _, status in outcomes if status >= 400)
+    return {
+        "requests": requests, "errors": errors,
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "p99_ms": percentile(latencies, 99),
+        "throughput_rps": requests / wall if wall else 0.0, "peak_rss_mb": sampler.peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--github-latency-ms", type=float, default=20.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake GitHub/Gemini calls that fail")
+    parser.add_argument("--file-bytes", type=int, default=2048, help="size of each synthetic file")
+    parser.add_argument("--diff-files", type=int, default=5)
+    parser.add_argument("--diff-lines", type=int, default=20, help="changed lines per file in each PR diff")
+    parser.add_argument("--repo-sizes", default="10,100,1000,10000",
+                        help="file counts for generate_bdd_from_repo; empty to skip")
+    parser.add_argument("--bdd-repo-requests", type=int, default=1, help="requests per repo size")
+    parser.add_argument("--actions", help="comma-separated scenario names (default: all, plus bdd_repo)")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the Gemini response cache enabled")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use /github-action/async")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    github = FakeGitHub(latency_ms=args.github_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        file_bytes=args.file_bytes, diff_files=args.diff_files, diff_lines=args.diff_lines).start()
+    # The backend reads its configuration at import time
+    os.environ["GITHUB_API_URL"] = github.url
+    os.environ["GITHUB_TOKEN"] = "bench"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("JOB_STORE", "file")
+    os.environ.setdefault("JOB_STORE_DIR", tempfile.mkdtemp(prefix="bench-jobs-"))
+    os.environ.setdefault("REVIEW_STORE", "memory")
+    os.environ.setdefault("REPO_INDEX_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-index-"), "index.sqlite3"))
+    # Every benchmark request comes from one user
+    os.environ.setdefault("USER_RATE_PER_MINUTE", "1000000")
+    os.environ.setdefault("USER_BURST", "1000000")
+    os.environ["LLM_CACHE_PERSIST"] = "0"
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+
+    import jwt
+    import backend
+
+    model = FakeGeminiModel(latency_ms=args.gemini_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    backend.clients._models[backend.GEMINI_MODEL] = model
+    backend.clients.async_model = lambda name: model
+    path = "/github-action/async" if args.use_async else "/github-action"
+    client = backend.create_app().test_client()
+    token = jwt.encode({"username": "bench"}, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    selected = set(args.actions.split(",")) if args.actions else set(SCENARIOS) | {"bdd_repo"}
+    runs = [(name, prompt, extra, args.requests) for name, (prompt, extra) in SCENARIOS.items() if name in selected]
+    if "bdd_repo" in selected and args.repo_sizes:
+        for size in (int(s) for s in args.repo_sizes.split(",")):
+            prompt = f"generate BDD tests for the whole repo bench/repo-{size}"
+            runs.append((f"bdd_repo[{size}]", prompt, {}, args.bdd_repo_requests))
+
+    results = {}
+    print(f"{'scenario':>16} {'reqs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'rss MB':>7}")
+    for name, prompt, extra, requests in runs:
+        stats = run_scenario(client, path, headers, prompt, extra, requests, min(args.concurrency, requests))
+        results[name] = stats
+        print(f"{name:>16} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['throughput_rps']:>8.2f} {stats['peak_rss_mb']:>7.1f}")
+
+    print(f"fake GitHub requests: {github.requests}, fake Gemini calls: {model.calls}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    github.stop()
+
+
+if __name__ == "__main__":
+    main()
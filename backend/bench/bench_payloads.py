@@ -0,0 +1,104 @@
+"""Size, time to first byte and memory of list responses as repos grow, offline.
+
+Lists the files of synthetic repos of each size through /github-action,
+against bench/fakes.py's GitHub, as one JSON body, gzip-compressed JSON,
+one page, and streamed NDJSON. Memory is the Python heap peak while the
+request runs and its body is read, from a second run under tracemalloc
+(which slows allocation too much to time the same run). The repo tree is
+fetched once before measuring, so the numbers are about the response, not
+GitHub.
+
+Usage: python bench/bench_payloads.py [--repo-sizes 1000,10000] [--limit 100] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fakes import FakeGitHub  # noqa: E402
+
+# name -> (extra request fields, extra headers)
+MODES = {
+    "json": ({}, {}),
+    "json_gzip": ({}, {"Accept-Encoding": "gzip"}),
+    "page": ({"limit": None}, {}),
+    "ndjson": ({"stream": True}, {}),
+    "ndjson_gzip": ({"stream": True}, {"Accept-Encoding": "gzip"}),
+}
+
+
+def send(client, headers, prompt, extra, extra_headers):
+    start = time.perf_counter()
+    response = client.post("/github-action", json={"prompt": prompt, **extra},
+                           headers={**headers, **extra_headers}, buffered=False)
+    first_byte, size = None, 0
+    for chunk in response.iter_encoded():
+        if first_byte is None and chunk:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    response.close()
+    return {"status": response.status_code, "bytes": size, "ttfb_ms": (first_byte or total) * 1000,
+            "total_ms": total * 1000}
+
+
+def measure(*args):
+    stats = send(*args)
+    tracemalloc.start()
+    send(*args)
+    stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo-sizes", default="1000,10000")
+    parser.add_argument("--limit", type=int, default=100, help="page size of the paged mode")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    github = FakeGitHub().start()
+    os.environ["GITHUB_API_URL"] = github.url
+    os.environ["GITHUB_TOKEN"] = "bench"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("JOB_STORE", "file")
+    os.environ.setdefault("JOB_STORE_DIR", tempfile.mkdtemp(prefix="bench-jobs-"))
+    os.environ.setdefault("USER_RATE_PER_MINUTE", "1000000")
+    os.environ.setdefault("USER_BURST", "1000000")
+    os.environ["REPO_INDEX"] = "0"
+
+    import jwt
+    import backend
+
+    client = backend.create_app().test_client()
+    token = jwt.encode({"username": "bench"}, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    MODES["page"][0]["limit"] = args.limit
+
+    results = {}
+    print(f"{'files':>6} {'mode':>12} {'status':>6} {'bytes':>10} {'ttfb ms':>9} {'total ms':>9} {'peak MB':>8}")
+    for size in (int(s) for s in args.repo_sizes.split(",")):
+        prompt = f"list files in bench/repo-{size}"
+        client.post("/github-action", json={"prompt": prompt}, headers=headers)  # warms the tree cache
+        for mode, (extra, extra_headers) in MODES.items():
+            stats = measure(client, headers, prompt, extra, extra_headers)
+            results[f"{mode}[{size}]"] = stats
+            print(f"{size:>6} {mode:>12} {stats['status']:>6} {stats['bytes']:>10} {stats['ttfb_ms']:>9.1f} "
+                  f"{stats['total_ms']:>9.1f} {stats['peak_mb']:>8.2f}")
+
+    github.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
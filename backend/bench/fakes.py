@@ -0,0 +1,355 @@
+"""Local stand-ins for the GitHub REST API and Gemini, for offline benchmarks.
+
+``FakeGitHub`` serves just enough of the REST API for every backend action:
+repos named ``bench/repo-<n>`` have ``n`` synthetic files, and every repo
+has ``prs`` open pull requests with generated diffs. ``FakeGeminiModel``
+answers each backend prompt template with valid JSON. Both take a latency
+(with jitter) and an error rate. ``FakeUsersCollection`` is an in-memory
+``users`` collection for the auth benchmark.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from urllib.parse import urlsplit, parse_qs, unquote
+
+_REPO_RE = re.compile(r'^/repos/([^/]+)/([^/]+)(/.*)?$')
+
+
+def _sha(*parts):
+    return hashlib.sha1("/".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def synthetic_file(path, size):
+    """Deterministic Python source of about ``size`` bytes."""
+    lines = [f'"""Synthetic module {path}."""', ""]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        lines += [f"def handler_{i}(request):", f"    return request.get('field_{i}', {i})", ""]
+        i += 1
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_diff(pr_number, files, lines_per_file):
+    """Unified diff touching ``files`` files with ``lines_per_file`` changed lines each."""
+    out = []
+    for f in range(files):
+        path = f"src/pkg_{f % 10}/mod_{(pr_number * 7 + f) % 50}.py"
+        out += [f"diff --git a/{path} b/{path}", f"index {_sha(pr_number, f)[:7]}..{_sha(pr_number, f, 1)[:7]} 100644",
+                f"--- a/{path}", f"+++ b/{path}"]
+        start = 10 + pr_number % 5
+        out.append(f"@@ -{start},{lines_per_file + 3} +{start},{lines_per_file + 3} @@ def handler():")
+        out.append("     context = load()")
+        for i in range(lines_per_file):
+            out.append(f"-    value_{i} = compute({i})")
+            out.append(f"+    value_{i} = compute({i}, pr={pr_number})")
+        out += ["     return context", "     # end"]
+    return "\n".join(out) + "\n"
+
+
+class FakeGitHub:
+    """Threaded HTTP server mimicking the GitHub REST endpoints the backend calls."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, file_bytes=2048, prs=5,
+                 diff_files=5, diff_lines=20, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.file_bytes = file_bytes
+        self.prs = prs
+        self.diff_files = diff_files
+        self.diff_lines = diff_lines
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.requests = 0
+        # (repo_name, number) -> head SHA, to stand in for a push to a PR
+        self.heads = {}
+        self._server = None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            github = fake
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    # -- behaviour ---------------------------------------------------------
+
+    def delay_and_fail(self):
+        """Sleep for the configured latency; True if this request should fail."""
+        with self._random_lock:
+            self.requests += 1
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return fail
+
+    @staticmethod
+    def repo_size(name):
+        match = re.search(r'-(\d+)$', name)
+        return int(match.group(1)) if match else 10
+
+    def repo_json(self, owner, name):
+        full_name = f"{owner}/{name}"
+        return {
+            "id": int(_sha(full_name)[:8], 16), "name": name, "full_name": full_name,
+            "owner": {"login": owner}, "private": False, "default_branch": "main",
+            "url": f"{self.url}/repos/{full_name}", "html_url": f"https://github.com/{full_name}",
+        }
+
+    def paths(self, repo_name):
+        n = self.repo_size(repo_name)
+        return [f"src/pkg_{i % 10}/mod_{i}.py" if i % 20 else f"docs/page_{i}.md" for i in range(n)]
+
+    def tree_json(self, repo_name, sha):
+        tree = [{"path": f"src/pkg_{i}", "mode": "040000", "type": "tree", "sha": _sha(repo_name, "dir", i)}
+                for i in range(min(10, self.repo_size(repo_name)))]
+        tree += [{"path": path, "mode": "100644", "type": "blob", "sha": _sha(repo_name, path), "size": self.file_bytes}
+                 for path in self.paths(repo_name)]
+        return {"sha": sha, "url": f"{self.url}/repos/{repo_name}/git/trees/{sha}", "tree": tree, "truncated": False}
+
+    def pull_json(self, repo_name, number):
+        return {
+            "id": number, "number": number, "state": "open", "title": f"Benchmark change #{number}",
+            "body": "Synthetic pull request.", "user": {"login": "bench"},
+            "head": {"ref": f"feature-{number}", "sha": self.heads.get((repo_name, number), _sha(repo_name, "head", number))},
+            "base": {"ref": "main", "sha": _sha(repo_name, "main")},
+            "url": f"{self.url}/repos/{repo_name}/pulls/{number}",
+            "html_url": f"https://github.com/{repo_name}/pull/{number}",
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    github = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.send_header("X-RateLimit-Resource", "core")
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        fake = self.github
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+        if fake.delay_and_fail():
+            return self._send(502, {"message": "Injected failure"})
+
+        parts = urlsplit(self.path)
+        path, query = unquote(parts.path), parse_qs(parts.query)
+        accept = self.headers.get("Accept", "")
+        if path == "/user":
+            return self._send(200, {"login": "bench", "id": 1})
+        if path == "/user/repos":
+            page = int(query.get("page", ["1"])[0])
+            repos = [fake.repo_json("bench", f"repo-{n}") for n in (10, 100, 1000, 10000)] if page == 1 else []
+            return self._send(200, repos)
+
+        match = _REPO_RE.match(path)
+        if not match:
+            return self._send(404, {"message": "Not Found"})
+        owner, name, rest = match.group(1), match.group(2), match.group(3) or ""
+        repo_name = f"{owner}/{name}"
+
+        if rest == "":
+            return self._send(200, fake.repo_json(owner, name))
+        if rest.startswith("/git/refs/heads/") or rest.startswith("/git/ref/heads/"):
+            sha = _sha(repo_name, "main")
+            return self._send(200, {"ref": "refs/heads/main", "object": {"sha": sha, "type": "commit"}})
+        if rest.startswith("/git/trees/"):
+            return self._send(200, fake.tree_json(repo_name, rest.rsplit("/", 1)[1]))
+        if rest.startswith("/contents/"):
+            file_path = rest[len("/contents/"):]
+            if "raw" not in accept:
+                return self._send(415, {"message": "Only the raw media type is faked"})
+            return self._send(200, synthetic_file(file_path, fake.file_bytes), "application/vnd.github.v3.raw")
+        if rest == "/pulls" and method == "POST":
+            return self._send(201, fake.pull_json(repo_name, fake.prs + 1))
+        if rest == "/pulls":
+            page = int(query.get("page", ["1"])[0])
+            pulls = [fake.pull_json(repo_name, n) for n in range(1, fake.prs + 1)] if page == 1 else []
+            return self._send(200, pulls)
+        match = re.match(r'^/pulls/(\d+)$', rest)
+        if match:
+            number = int(match.group(1))
+            if number > fake.prs + 1:
+                return self._send(404, {"message": "Not Found"})
+            if "diff" in accept:
+                return self._send(200, synthetic_diff(number, fake.diff_files, fake.diff_lines), "text/plain")
+            return self._send(200, fake.pull_json(repo_name, number))
+        if rest.startswith("/compare/"):
+            if "diff" in accept:
+                return self._send(200, synthetic_diff(1, 1, fake.diff_lines), "text/plain")
+            head = rest[len("/compare/"):].split("...")[-1]
+            return self._send(200, {"status": "ahead", "ahead_by": 1, "behind_by": 0, "total_commits": 1,
+                                    "commits": [{"sha": head, "parents": [{"sha": "0" * 40}]}]})
+        return self._send(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class FakeGeminiModel:
+    """Drop-in for ``genai.GenerativeModel`` that recognises the backend's prompt templates."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, issues_per_call=3, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.issues_per_call = issues_per_call
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _answer(self, prompt):
+        if "GitHub automation" in prompt:
+            return {"action": "fetch_pull_requests", "repo": "bench/repo-10", "additional_params": {}}
+        if "code reviewer" in prompt:
+            files = re.findall(r'^\+\+\+ b/(.+)$', prompt, re.M) or ["unknown"]
+            return {"issues": [
+                {"file": files[i % len(files)], "line_number": 10 + i, "comment": f"Synthetic finding {i}."}
+                for i in range(self.issues_per_call)
+            ]}
+        return {"test_cases": [
+            {"feature": "Synthetic", "given": "a request", "when": "it is handled",
+             "then": "a value is returned", "scenario": f"Scenario {i}"}
+            for i in range(self.issues_per_call)
+        ]}
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._random.random() < self.error_rate
+        return max(delay, 0) / 1000, fail
+
+    def _respond(self, prompt, fail):
+        if fail:
+            raise RuntimeError("Injected Gemini failure")
+        text = "```json\n" + json.dumps(self._answer(prompt)) + "\n```"
+        part = SimpleNamespace(text=text)
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))], text=text)
+
+    def generate_content(self, prompt):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        return self._respond(prompt, fail)
+
+    async def generate_content_async(self, prompt):
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        return self._respond(prompt, fail)
+
+
+class FakeUsersCollection:
+    """Enough of a pymongo collection for the user store: exact-match finds on one field.
+
+    Until ``create_index("username", unique=True)`` runs, lookups scan every
+    document, as Mongo would without the index.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.docs = []
+        self._by_username = None
+        self._lock = threading.Lock()
+        self.scanned = 0
+
+    def create_index(self, key, unique=False):
+        if key != "username":
+            raise NotImplementedError(key)
+        with self._lock:
+            index = {}
+            for doc in self.docs:
+                if unique and doc["username"] in index:
+                    raise DuplicateKeyError(f"duplicate username {doc['username']!r}")
+                index[doc["username"]] = doc
+            self._by_username = index
+        return "username_1"
+
+    def _find(self, query):
+        if set(query) - {"_id", "username", "password"}:
+            raise NotImplementedError(query)
+        if self._by_username is not None and "username" in query:
+            candidates = [self._by_username[query["username"]]] if query["username"] in self._by_username else []
+        else:
+            candidates = self.docs
+            self.scanned += len(candidates)
+        return [doc for doc in candidates if all(doc.get(k) == v for k, v in query.items())]
+
+    def find_one(self, query, projection=None):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            found = self._find(query)
+        if not found:
+            return None
+        doc = found[0]
+        if projection:
+            return {k: v for k, v in doc.items() if k == "_id" or k in projection}
+        return dict(doc)
+
+    def insert_one(self, doc):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            if self._by_username is not None:
+                if doc["username"] in self._by_username:
+                    raise DuplicateKeyError(f"duplicate username {doc['username']!r}")
+                self._by_username[doc["username"]] = doc
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    def update_one(self, query, update):
+        time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            found = self._find(query)
+            if found:
+                found[0].update(update["$set"])
+        return SimpleNamespace(matched_count=len(found[:1]), modified_count=len(found[:1]))
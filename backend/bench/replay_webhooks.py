@@ -0,0 +1,130 @@
+"""Replay recorded GitHub webhook deliveries against /webhooks/github, offline.
+
+Each fixture in bench/fixtures is ``{"event", "delivery", "payload"}``. It is
+signed with a local secret and posted through the Flask test client, while
+bench/fakes.py stands in for GitHub and Gemini. The script waits for each
+precomputation job, then times the chat requests the job should have warmed,
+next to the same requests for a PR that no webhook covered.
+
+A synchronize fixture moves the fake PR's head to the payload's head first,
+as the push would have. The exit status is 1 if a job fails or a signature
+check does not behave.
+
+Usage: python bench/replay_webhooks.py [fixture.json ...] [--github-latency-ms 20] [--gemini-latency-ms 300]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fakes import FakeGitHub, FakeGeminiModel  # noqa: E402
+
+FIXTURES = ["ping.json", "pull_request_opened.json", "pull_request_synchronize.json", "pull_request_labeled.json"]
+SECRET = "replay-secret"
+# Chat prompts a precomputed PR should answer from warm state
+CHAT_PROMPTS = ["show details of PR #{number} in {repo}", "snapshot of PR #{number} in {repo}",
+                "review PR #{number} in {repo}"]
+
+
+def wait_for(manager, job_id, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.store.get(job_id)
+        if job and job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def time_chat(client, headers, repo_name, number):
+    timings = []
+    for template in CHAT_PROMPTS:
+        prompt = template.format(number=number, repo=repo_name)
+        start = time.perf_counter()
+        response = client.post("/github-action", json={"prompt": prompt}, headers=headers)
+        timings.append((template.split(" ")[0], response.status_code, (time.perf_counter() - start) * 1000))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", nargs="*", help=f"fixture files (default: {', '.join(FIXTURES)})")
+    parser.add_argument("--github-latency-ms", type=float, default=20.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+    paths = args.fixtures or [os.path.join(HERE, "fixtures", name) for name in FIXTURES]
+
+    github = FakeGitHub(latency_ms=args.github_latency_ms).start()
+    os.environ["GITHUB_API_URL"] = github.url
+    os.environ["GITHUB_TOKEN"] = "bench"
+    os.environ["GITHUB_WEBHOOK_SECRET"] = SECRET
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("JOB_STORE", "file")
+    os.environ.setdefault("JOB_STORE_DIR", tempfile.mkdtemp(prefix="replay-jobs-"))
+    os.environ.setdefault("REVIEW_STORE", "memory")
+    os.environ.setdefault("REPO_INDEX_PATH", os.path.join(tempfile.mkdtemp(prefix="replay-index-"), "index.sqlite3"))
+    os.environ["LLM_CACHE_PERSIST"] = "0"
+
+    import jwt
+    import backend
+    from webhooks import sign
+
+    model = FakeGeminiModel(latency_ms=args.gemini_latency_ms)
+    backend.clients._models[backend.GEMINI_MODEL] = model
+    client = backend.create_app().test_client()
+    token = jwt.encode({"username": "replay"}, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    failed = False
+
+    body = b'{"zen": "forged"}'
+    forged = client.post("/webhooks/github", data=body, headers={
+        "X-GitHub-Event": "ping", "X-Hub-Signature-256": sign("wrong-secret", body)})
+    print(f"forged signature -> {forged.status_code}")
+    failed |= forged.status_code != 401
+
+    warmed = set()
+    for path in paths:
+        with open(path) as f:
+            fixture = json.load(f)
+        payload = fixture["payload"]
+        pull = payload.get("pull_request") or {}
+        if payload.get("action") == "synchronize":
+            github.heads[(payload["repository"]["full_name"], pull["number"])] = pull["head"]["sha"]
+
+        body = json.dumps(payload).encode()
+        response = client.post("/webhooks/github", data=body, headers={
+            "Content-Type": "application/json", "X-GitHub-Event": fixture["event"],
+            "X-GitHub-Delivery": fixture.get("delivery", ""), "X-Hub-Signature-256": sign(SECRET, body)})
+        line = f"{os.path.basename(path)} -> {response.status_code}"
+        if response.status_code == 202:
+            start = time.perf_counter()
+            job = wait_for(backend.get_job_manager(), response.json["job_id"])
+            line += f" job {job['status']} in {(time.perf_counter() - start) * 1000:.0f} ms: {json.dumps(job['result'] or job['error'])}"
+            failed |= job["status"] != "done" or bool((job["result"] or {}).get("errors"))
+            warmed.add((response.json["repo"], response.json["pr_number"]))
+        elif response.status_code != 200:
+            failed = True
+        print(line)
+
+    for repo_name, number in sorted(warmed):
+        cold_number = number + 1
+        print(f"\nchat latency, {repo_name}: PR #{number} (precomputed) vs PR #{cold_number} (cold)")
+        warm = time_chat(client, headers, repo_name, number)
+        cold = time_chat(client, headers, repo_name, cold_number)
+        for (name, warm_status, warm_ms), (_, cold_status, cold_ms) in zip(warm, cold):
+            print(f"  {name:>8}  warm {warm_ms:8.1f} ms ({warm_status})   cold {cold_ms:8.1f} ms ({cold_status})")
+            failed |= warm_status != 200
+
+    print(f"\nfake GitHub requests: {github.requests}, fake Gemini calls: {model.calls}")
+    github.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
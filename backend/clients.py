@@ -0,0 +1,178 @@
+"""Process-wide registry of pooled HTTP sessions, GitHub clients, Gemini models and the Mongo client."""
+import os
+import threading
+import weakref
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from github import Github, Auth
+from pymongo import MongoClient
+
+from async_github import AsyncGitHub
+from http_cache import ConditionalCacheAdapter, install_github_session
+from rate_limit import MAX_RETRIES, github_gate, github_pacer
+
+
+class ClientRegistry:
+    """Builds each client once, on first use, and shares it across threads.
+
+    The HTTP session keeps connections alive in a pool sized by
+    ``pool_connections`` (hosts) and ``pool_maxsize`` (connections per host),
+    carries the GitHub token, and revalidates GETs through the ETag cache.
+    PyGithub is routed through the same session.
+
+    Nothing is created, and no service contacted, until first use, so the
+    registry can be built at import time. Call ``reset()`` in a forked child
+    so it opens its own connections instead of sharing the parent's.
+    """
+
+    def __init__(self, github_token=None, github_api_url="https://api.github.com",
+                 pool_connections=10, pool_maxsize=32, cache_bytes=32 * 1024 * 1024,
+                 seconds_between_requests=0, gemini_api_key=None, mongo_uri="mongodb://localhost:27017",
+                 mongo_options=None):
+        self.github_token = github_token
+        self.github_api_url = github_api_url
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.cache_bytes = cache_bytes
+        self.seconds_between_requests = seconds_between_requests
+        self.gemini_api_key = gemini_api_key
+        self.mongo_uri = mongo_uri
+        # Pool settings passed to MongoClient, except those the URI already sets
+        self.mongo_options = mongo_options or {}
+        self.reset()
+
+    def reset(self):
+        """Forget every client built so far; the next use builds fresh ones."""
+        self._lock = threading.Lock()
+        self._http = None
+        self._github = None
+        self._mongo = None
+        self._gemini_configured = False
+        self._models = {}
+        self._async_models = weakref.WeakKeyDictionary()  # event loop -> {name: model}
+        self.http_cache = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            github_token=os.getenv("GITHUB_TOKEN"),
+            github_api_url=os.getenv("GITHUB_API_URL", "https://api.github.com"),
+            pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", "10")),
+            pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "32")),
+            cache_bytes=int(os.getenv("GITHUB_HTTP_CACHE_BYTES", str(32 * 1024 * 1024))),
+            seconds_between_requests=float(os.getenv("GITHUB_SECONDS_BETWEEN_REQUESTS", "0")),
+            gemini_api_key=os.getenv("GEMINI_API_KEY"),
+            mongo_uri=os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+            mongo_options={
+                "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+                "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+                "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", "300000")),
+                # Fail a request that cannot get a connection instead of queueing it forever
+                "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+                "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+            },
+        )
+
+    def http(self):
+        """Keep-alive session for GitHub REST and diff requests."""
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    self.http_cache = ConditionalCacheAdapter(
+                        max_bytes=self.cache_bytes,
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pacer=github_pacer,
+                        gate=github_gate,
+                        max_retries=MAX_RETRIES,
+                    )
+                    session = requests.Session()
+                    session.mount("https://", self.http_cache)
+                    session.mount("http://", self.http_cache)
+                    if self.github_token:
+                        session.headers["Authorization"] = f"token {self.github_token}"
+                    install_github_session(session)
+                    self._http = session
+        return self._http
+
+    def github(self):
+        """PyGithub client sharing the pooled session."""
+        if self._github is None:
+            self.http()
+            with self._lock:
+                if self._github is None:
+                    self._github = Github(
+                        auth=Auth.Token(self.github_token) if self.github_token else None,
+                        base_url=self.github_api_url,
+                        pool_size=self.pool_maxsize,
+                        per_page=100,
+                        # PyGithub spaces requests 0.25s apart by default, which
+                        # serialises the parallel tree and file fetches
+                        seconds_between_requests=self.seconds_between_requests,
+                    )
+        return self._github
+
+    def model(self, name):
+        """Cached ``genai.GenerativeModel`` for ``name``."""
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    # Imported here: the SDK takes most of a second to import
+                    import google.generativeai as genai
+                    if not self._gemini_configured:
+                        genai.configure(api_key=self.gemini_api_key)
+                        self._gemini_configured = True
+                    model = self._models[name] = genai.GenerativeModel(name)
+        return model
+
+    def async_github(self):
+        """New async GitHub client; one per event loop, so it is not cached here. It shares the ETag cache."""
+        self.http()
+        return AsyncGitHub(self.github_api_url, self.github_token, max_connections=self.pool_maxsize,
+                           pacer=github_pacer, gate=github_gate, max_retries=MAX_RETRIES, cache=self.http_cache)
+
+    def async_model(self, name):
+        """``GenerativeModel`` for ``name`` on an async client shared by everything on the running loop.
+
+        The SDK's default async client is a process-wide grpc.aio channel,
+        which only works on the event loop that first used it, and Flask runs
+        each async view on a fresh loop. So each loop gets its own client;
+        ``close_async`` closes them once the loop's work is done.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            models = self._async_models.setdefault(loop, {})
+            model = models.get(name)
+        if model is None:
+            from google.ai import generativelanguage as glm
+            import google.generativeai as genai
+            self.model(name)  # configures the SDK once
+            model = genai.GenerativeModel(name)
+            model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.gemini_api_key})
+            models[name] = model  # Only this loop's thread touches its dict from here on
+        return model
+
+    async def close_async(self):
+        """Close the async Gemini clients of the running loop."""
+        import asyncio
+        with self._lock:
+            models = self._async_models.pop(asyncio.get_running_loop(), {})
+        for model in models.values():
+            await model._async_client.transport.close()
+
+    def mongo(self):
+        """Shared ``MongoClient``; it connects on the first operation, not here."""
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    in_uri = {name.lower() for name in parse_qs(urlsplit(self.mongo_uri).query)}
+                    options = {k: v for k, v in self.mongo_options.items() if k.lower() not in in_uri}
+                    self._mongo = MongoClient(self.mongo_uri, connect=False, **options)
+        return self._mongo
+
+    def stats(self):
+        return self.http_cache.stats() if self.http_cache else {}
@@ -0,0 +1,68 @@
+"""gzip and, when the ``brotli`` package is installed, brotli compression of API responses."""
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") != "0"
+# Smaller bodies are sent as is: the headers and CPU would cost more than they save
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Server-sent events are left alone so intermediaries never hold an event back
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/plain"}
+
+
+def choose_encoding(accept_encodings):
+    """``br`` or ``gzip``, whichever the client accepts and ranks higher (br on a tie); None if neither."""
+    return accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"])
+
+
+def _compressor(encoding):
+    """``(compress, flush, finish)`` for incremental compression."""
+    if encoding == "br":
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.flush, c.finish
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def _compress_stream(chunks, encoding):
+    compress, flush, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if chunk:
+                # Flushed per chunk, so each one reaches the client when it is produced
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, accept_encodings):
+    """Compress ``response`` in place if the client accepts it and it is worth it; returns it."""
+    if (not COMPRESSION or response.status_code in (204, 304) or response.direct_passthrough
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        if encoding == "br":
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, GZIP_LEVEL, mtime=0))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,256 @@
+"""Unified-diff parsing and token-budgeted chunking for LLM review prompts."""
+import re
+import hashlib
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from bdd_pipeline import skip_reason
+from metrics import bind
+
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$')
+
+# Generated outputs that bdd_pipeline's list does not cover
+GENERATED_SUFFIXES = ("_pb2.py", "_pb2_grpc.py", ".pb.go", ".generated.ts", ".generated.cs", ".snap")
+
+
+@dataclass
+class Hunk:
+    path: str
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    context: str = ""
+    lines: list = field(default_factory=list)
+
+    @property
+    def header(self):
+        return f"@@ -{self.old_start},{self.old_lines} +{self.new_start},{self.new_lines} @@{self.context}"
+
+    @property
+    def text(self):
+        return "\n".join([self.header] + self.lines) + "\n"
+
+    @property
+    def fingerprint(self):
+        """Identity of the change itself, independent of where it sits in the file."""
+        digest = hashlib.sha1(self.path.encode())
+        for line in self.lines:
+            digest.update(b"\n" + line.encode())
+        return digest.hexdigest()
+
+
+@dataclass
+class FileDiff:
+    path: str
+    old_path: str
+    headers: list = field(default_factory=list)
+    hunks: list = field(default_factory=list)
+    binary: bool = False
+
+    @property
+    def header_text(self):
+        return "\n".join(self.headers) + "\n"
+
+
+@dataclass
+class Chunk:
+    files: list = field(default_factory=list)  # FileDiffs holding only the hunks in this chunk
+    tokens: int = 0
+
+    @property
+    def hunks(self):
+        return [hunk for f in self.files for hunk in f.hunks]
+
+    @property
+    def text(self):
+        return "".join(f.header_text + "".join(h.text for h in f.hunks) for f in self.files)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) without a tokenizer round trip."""
+    return len(text) // 4 + 1
+
+
+def _strip_prefix(path):
+    if path == "/dev/null":
+        return path
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+
+def parse_unified_diff(text):
+    """Parse ``git diff`` output into FileDiffs with their hunks."""
+    files = []
+    current = None
+    hunk = None
+    for line in text.splitlines():
+        if line.startswith("diff --git "):
+            match = re.match(r'^diff --git a/(.*) b/(.*)$', line)
+            old_path, path = match.groups() if match else (line, line)
+            current = FileDiff(path=path, old_path=old_path, headers=[line])
+            files.append(current)
+            hunk = None
+        elif current is None:
+            continue
+        elif hunk is None and line.startswith("--- "):
+            current.old_path = _strip_prefix(line[4:].strip())
+            current.headers.append(line)
+        elif hunk is None and line.startswith("+++ "):
+            new_path = _strip_prefix(line[4:].strip())
+            if new_path != "/dev/null":
+                current.path = new_path
+            current.headers.append(line)
+        elif line.startswith("@@"):
+            match = HUNK_HEADER_RE.match(line)
+            if not match:
+                continue
+            old_start, old_lines, new_start, new_lines, context = match.groups()
+            hunk = Hunk(
+                path=current.path,
+                old_start=int(old_start),
+                old_lines=int(old_lines) if old_lines is not None else 1,
+                new_start=int(new_start),
+                new_lines=int(new_lines) if new_lines is not None else 1,
+                context=context,
+            )
+            current.hunks.append(hunk)
+        elif hunk is not None:
+            hunk.lines.append(line)
+        else:
+            if line.startswith("Binary files") or line == "GIT binary patch":
+                current.binary = True
+            current.headers.append(line)
+    return files
+
+
+def review_skip_reason(file_diff):
+    """Why a file's changes should not be sent for review, or None."""
+    if file_diff.binary:
+        return "binary"
+    if file_diff.path.endswith(GENERATED_SUFFIXES):
+        return "generated"
+    reason = skip_reason({"path": file_diff.path})
+    if reason:
+        return reason
+    if not file_diff.hunks:
+        return "no changes"
+    return None
+
+
+def split_hunk(hunk, budget):
+    """Split a hunk that alone exceeds ``budget`` tokens into consecutive smaller hunks."""
+    pieces = []
+    old_line, new_line = hunk.old_start, hunk.new_start
+    current = None
+    for line in hunk.lines:
+        if current is None or estimate_tokens("\n".join(current.lines + [line])) > budget:
+            current = Hunk(hunk.path, old_line, 0, new_line, 0, hunk.context)
+            pieces.append(current)
+        current.lines.append(line)
+        if line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        if not line.startswith("+"):
+            current.old_lines += 1
+            old_line += 1
+        if not line.startswith("-"):
+            current.new_lines += 1
+            new_line += 1
+    return pieces
+
+
+def pack_chunks(files, budget):
+    """Pack the hunks of ``files`` into chunks of at most ~``budget`` tokens, keeping file order."""
+    chunks = []
+    current = Chunk()
+
+    def flush():
+        nonlocal current
+        if current.files:
+            chunks.append(current)
+        current = Chunk()
+
+    for file_diff in files:
+        header_tokens = estimate_tokens(file_diff.header_text)
+        hunks = []
+        for hunk in file_diff.hunks:
+            if header_tokens + estimate_tokens(hunk.text) > budget:
+                hunks.extend(split_hunk(hunk, max(budget - header_tokens, 1)))
+            else:
+                hunks.append(hunk)
+
+        part = None
+        for hunk in hunks:
+            cost = estimate_tokens(hunk.text)
+            needs_header = part is None or not current.files or current.files[-1] is not part
+            extra = cost + (header_tokens if needs_header else 0)
+            if current.tokens and current.tokens + extra > budget:
+                flush()
+                needs_header = True
+                extra = cost + header_tokens
+            if needs_header:
+                part = FileDiff(file_diff.path, file_diff.old_path, file_diff.headers)
+                current.files.append(part)
+            part.hunks.append(hunk)
+            current.tokens += extra
+    flush()
+    return chunks
+
+
+def chunk_diff(diff_text, budget):
+    """Parse, filter and pack a diff. Returns ``(chunks, {path: skip reason})``."""
+    kept, skipped = [], {}
+    for file_diff in parse_unified_diff(diff_text):
+        reason = review_skip_reason(file_diff)
+        if reason:
+            skipped[file_diff.path] = reason
+        else:
+            kept.append(file_diff)
+    return pack_chunks(kept, budget), skipped
+
+
+def map_concurrently(fn, items, max_workers):
+    """Apply ``fn`` to each item on a thread pool; returns ``(result, error)`` pairs in item order."""
+    def call(item):
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, e
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(bind(call), items))
+
+
+def _line_key(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_issues(results):
+    """Combine per-chunk ``{"issues": [...]}`` results, keeping the first issue per (file, line)."""
+    seen = set()
+    issues = []
+    for result in results:
+        for issue in (result or {}).get("issues", []):
+            key = (issue.get("file"), str(issue.get("line_number")))
+            if key not in seen:
+                seen.add(key)
+                issues.append(issue)
+    issues.sort(key=lambda issue: (str(issue.get("file")), _line_key(issue.get("line_number"))))
+    return issues
+
+
+def merge_test_cases(results):
+    """Combine per-chunk ``{"test_cases": [...]}`` results, dropping repeated scenarios."""
+    seen = set()
+    test_cases = []
+    for result in results:
+        for case in (result or {}).get("test_cases", []):
+            key = (case.get("feature"), case.get("scenario"))
+            if key not in seen:
+                seen.add(key)
+                test_cases.append(case)
+    return test_cases
@@ -0,0 +1,120 @@
+"""Structured comparison of two PR diffs: shared files, conflicting line ranges and unique hunks."""
+import hashlib
+
+from diff_chunker import parse_unified_diff
+
+
+def change_key(hunk):
+    """Identity of a hunk's added/removed lines, ignoring context and position.
+
+    The same change cherry-picked into two PRs gets the same key even when
+    the surrounding lines differ.
+    """
+    digest = hashlib.sha1(hunk.path.encode())
+    for line in hunk.lines:
+        if line[:1] in ("+", "-"):
+            digest.update(b"\n" + line.encode())
+    return digest.hexdigest()
+
+
+def changed_spans(hunk):
+    """Base-side line ranges ``(first, last)`` the hunk actually changes.
+
+    Context lines are left out. An insertion touches the lines on either side
+    of it, since git treats edits to adjacent lines as a conflict.
+    """
+    spans = []
+    old_line = hunk.old_start
+    for line in hunk.lines:
+        if line.startswith("\\"):
+            continue
+        if line.startswith("-"):
+            first, last = old_line, old_line
+            old_line += 1
+        elif line.startswith("+"):
+            first, last = max(old_line - 1, 1), old_line
+        else:
+            old_line += 1
+            continue
+        if spans and first <= spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], last))
+        else:
+            spans.append((first, last))
+    return spans
+
+
+def _counts(hunks):
+    additions = sum(1 for h in hunks for line in h.lines if line.startswith("+"))
+    deletions = sum(1 for h in hunks for line in h.lines if line.startswith("-"))
+    return {"hunks": len(hunks), "additions": additions, "deletions": deletions}
+
+
+def _describe(hunk):
+    counts = _counts([hunk])
+    return {"path": hunk.path, "header": hunk.header,
+            "additions": counts["additions"], "deletions": counts["deletions"]}
+
+
+def _index(diff_text):
+    """``{path: FileDiff}`` keyed by the base-side path, so renames still line up."""
+    files = {}
+    for file_diff in parse_unified_diff(diff_text):
+        path = file_diff.old_path if file_diff.old_path != "/dev/null" else file_diff.path
+        files[path] = file_diff
+    return files
+
+
+def _overlaps(hunks1, hunks2):
+    overlaps = []
+    spans2 = [(hunk, span) for hunk in hunks2 for span in changed_spans(hunk)]
+    for hunk1 in hunks1:
+        for first1, last1 in changed_spans(hunk1):
+            for hunk2, (first2, last2) in spans2:
+                if first1 <= last2 and first2 <= last1:
+                    overlaps.append({
+                        "lines": [max(first1, first2), min(last1, last2)],
+                        "pr1_hunk": hunk1.header,
+                        "pr2_hunk": hunk2.header,
+                    })
+    return overlaps
+
+
+def compare_diffs(diff_text1, diff_text2):
+    """Compare two unified diffs against (roughly) the same base.
+
+    Returns files touched by both sides with the base-side line ranges both
+    change, files only one side touches, and hunks whose change appears on
+    one side only. Hunks present on both sides are counted, not listed.
+    """
+    files1, files2 = _index(diff_text1), _index(diff_text2)
+    keys1 = {change_key(h) for f in files1.values() for h in f.hunks}
+    keys2 = {change_key(h) for f in files2.values() for h in f.hunks}
+
+    common_files = []
+    for path in sorted(files1.keys() & files2.keys()):
+        file1, file2 = files1[path], files2[path]
+        overlaps = _overlaps(file1.hunks, file2.hunks)
+        common_files.append({
+            "path": path,
+            "pr1": _counts(file1.hunks),
+            "pr2": _counts(file2.hunks),
+            "identical_hunks": len({change_key(h) for h in file1.hunks} & {change_key(h) for h in file2.hunks}),
+            "overlaps": overlaps,
+        })
+
+    unique1 = [_describe(h) for path in sorted(files1) for h in files1[path].hunks if change_key(h) not in keys2]
+    unique2 = [_describe(h) for path in sorted(files2) for h in files2[path].hunks if change_key(h) not in keys1]
+    return {
+        "summary": {
+            "pr1_files": len(files1),
+            "pr2_files": len(files2),
+            "common_files": len(common_files),
+            "conflicting_files": sum(1 for f in common_files if f["overlaps"]),
+            "overlapping_ranges": sum(len(f["overlaps"]) for f in common_files),
+            "identical_hunks": len(keys1 & keys2),
+        },
+        "common_files": common_files,
+        "only_in_pr1": [{"path": path, **_counts(files1[path].hunks)} for path in sorted(files1.keys() - files2.keys())],
+        "only_in_pr2": [{"path": path, **_counts(files2[path].hunks)} for path in sorted(files2.keys() - files1.keys())],
+        "unique_hunks": {"pr1": unique1, "pr2": unique2},
+    }
@@ -0,0 +1,21 @@
+"""Gunicorn settings for ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Each worker is a process with its own thread pool; requests spend most of
+their time waiting on GitHub and Gemini, so threads carry the concurrency.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("WEB_THREADS", "16"))
+worker_class = "gthread"
+# Synchronous code reviews of large PRs can take minutes
+timeout = int(os.getenv("WEB_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+# Import the app once in the master; workers rebuild clients after fork
+preload_app = os.getenv("WEB_PRELOAD", "1") == "1"
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
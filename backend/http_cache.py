@@ -0,0 +1,296 @@
+"""ETag / Last-Modified revalidation cache for GitHub HTTP traffic."""
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from github.Requester import Requester, RequestsResponse
+
+from metrics import span
+from rate_limit import MAX_WAIT_SECONDS, RateLimited, current_user, github_retry_delay, resource_of
+
+RATE_LIMIT_HEADERS = ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-used", "x-ratelimit-reset")
+# Headers describing the stored body's encoding on the wire; the cached body is already decoded
+_WIRE_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+def endpoint_of(url):
+    """Collapse a request URL into an endpoint template for per-endpoint stats."""
+    parts = urlsplit(url)
+    path = parts.path
+    if path.endswith((".diff", ".patch")):
+        return "diff"
+    path = re.sub(r'^/api/v3', '', path)
+    path = re.sub(r'^/repos/[^/]+/[^/]+', '/repos/{repo}', path)
+    path = re.sub(r'/contents/.*$', '/contents/{path}', path)
+    path = re.sub(r'/git/(trees|blobs|commits|ref|refs)/.*$', r'/git/\1/{ref}', path)
+    path = re.sub(r'/compare/.*$', '/compare/{range}', path)
+    path = re.sub(r'/[0-9a-f]{40}(?=/|$)', '/{sha}', path)
+    path = re.sub(r'/\d+(?=/|$)', '/{n}', path)
+    return path or "/"
+
+
+def cache_key(url, headers):
+    """Cache key of a GET: the URL, the media type asked for and (hashed) who asked."""
+    auth = headers.get("Authorization", "")
+    return (str(url), headers.get("Accept", ""), hashlib.sha1(auth.encode()).hexdigest())
+
+
+def add_validators(headers, entry):
+    """Make a request for a cached ``entry`` conditional, unless the caller already did."""
+    if entry and "If-None-Match" not in headers and "If-Modified-Since" not in headers:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        elif entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+
+def cacheable(response):
+    return response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers)
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """HTTPAdapter that revalidates cached GET responses with If-None-Match / If-Modified-Since.
+
+    A 304 from GitHub does not count against the rate limit; the adapter
+    turns it back into a 200 carrying the cached body (and the 304's fresh
+    rate-limit headers) so callers never see the difference. Entries are kept
+    in an LRU bounded by ``max_bytes``; bodies above ``max_entry_bytes`` are
+    not stored, and streamed ones only once the caller has read them to the end.
+
+    With a ``pacer`` (rate_limit.QuotaPacer) each request first waits for its
+    share of the remaining quota; with a ``gate`` (rate_limit.FairGate) it
+    also waits for a slot among all users' calls. 403/429 rate-limit
+    responses are retried up to ``max_retries`` times, then raise
+    RateLimited.
+
+    ``lookup``, ``store`` and ``record`` let async_github.AsyncGitHub share
+    the cache and its stats.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=4 * 1024 * 1024,
+                 pacer=None, gate=None, max_retries=0, **kwargs):
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.pacer = pacer
+        self.gate = gate
+        self.max_retries = max_retries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._rate_limits = {}
+
+    def lookup(self, key):
+        """Cached entry for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+        return entry
+
+    def record(self, url, headers, revalidated):
+        """Count a response toward its endpoint's stats and note its rate-limit headers."""
+        endpoint = endpoint_of(str(url))
+        with self._lock:
+            counts = self._endpoints.setdefault(endpoint, {"requests": 0, "not_modified": 0})
+            counts["requests"] += 1
+            counts["not_modified"] += revalidated
+            if "x-ratelimit-remaining" in headers:
+                resource = headers.get("x-ratelimit-resource", "core")
+                self._rate_limits.setdefault(resource, {}).update(
+                    (h[len("x-ratelimit-"):], int(headers[h])) for h in RATE_LIMIT_HEADERS if h in headers
+                )
+
+    def store(self, key, response, content):
+        """Keep ``response``'s decoded ``content`` and validators under ``key``; any HTTP client's response will do."""
+        if len(content) > self.max_entry_bytes:
+            return
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS}
+        entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "headers": headers,
+            "content": content,
+            "encoding": response.encoding,
+        }
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old["content"])
+            self._entries[key] = entry
+            self._bytes += len(content)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["content"])
+
+    def _replay(self, entry, request, not_modified):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response._content = entry["content"]
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        for name, value in not_modified.headers.items():
+            if name.lower().startswith("x-ratelimit-") or name.lower() == "date":
+                response.headers[name] = value
+        response.encoding = entry["encoding"]
+        response.url = request.url
+        response.request = request
+        response.elapsed = not_modified.elapsed
+        response.connection = self
+        return response
+
+    def send(self, request, stream=False, **kwargs):
+        with span("github"):
+            return self._send_paced(request, stream=stream, **kwargs)
+
+    def _send_paced(self, request, stream=False, **kwargs):
+        resource = resource_of(request.url)
+        for attempt in range(self.max_retries + 1):
+            if self.pacer:
+                self.pacer.wait(resource)
+            # The slot covers only the request itself, not pacing waits or retry sleeps
+            if self.gate is None:
+                response = self._send(request, stream=stream, **kwargs)
+            else:
+                with self.gate.slot(current_user.get()):
+                    response = self._send(request, stream=stream, **kwargs)
+            if self.pacer:
+                self.pacer.update(response.headers)
+            delay = github_retry_delay(response.status_code, response.headers, attempt)
+            if delay is None:
+                return response
+            response.close()
+            if attempt == self.max_retries or delay > MAX_WAIT_SECONDS:
+                raise RateLimited(delay, "github")
+            time.sleep(delay)
+
+    def _send(self, request, stream=False, **kwargs):
+        if request.method != "GET":
+            return super().send(request, stream=stream, **kwargs)
+
+        key = cache_key(request.url, request.headers)
+        entry = self.lookup(key)
+        add_validators(request.headers, entry)
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and entry:
+            response.close()
+            self.record(request.url, response.headers, True)
+            return self._replay(entry, request, response)
+
+        self.record(request.url, response.headers, False)
+        if cacheable(response):
+            if stream:
+                response.raw = _TeeBody(response.raw, self.max_entry_bytes,
+                                        lambda content: self.store(key, response, content))
+            else:
+                self.store(key, response, response.content)
+        return response
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                name: {**counts, "hit_ratio": counts["not_modified"] / counts["requests"]}
+                for name, counts in self._endpoints.items()
+            }
+            total = sum(c["requests"] for c in self._endpoints.values())
+            hits = sum(c["not_modified"] for c in self._endpoints.values())
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_ratio": hits / total if total else 0.0,
+                "endpoints": endpoints,
+                "rate_limit": {resource: dict(values) for resource, values in self._rate_limits.items()},
+            }
+
+
+class _TeeBody:
+    """Stand-in for a streamed response's ``raw`` that keeps a copy of the body as it is read.
+
+    Once the body has been read to the end, and if it fits in ``max_bytes``,
+    the copy goes to ``on_complete``. A body read only part way is dropped.
+    """
+
+    def __init__(self, raw, max_bytes, on_complete):
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._on_complete = on_complete
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        pieces, size = [], 0
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            if pieces is not None:
+                size += len(chunk)
+                if size <= self._max_bytes:
+                    pieces.append(chunk)
+                else:
+                    pieces = None
+            yield chunk
+        if pieces is not None:
+            self._on_complete(b"".join(pieces))
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class SessionConnection:
+    """PyGithub connection class that sends every request through one shared requests session.
+
+    PyGithub stores the pending request on its connection object between
+    ``request()`` and ``getresponse()`` and may hand the same object to
+    several threads, so the pending request is kept per thread here. All
+    instances reuse ``session`` and its connection pool.
+    """
+
+    session = None
+    protocol = "https"
+    default_port = 443
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self._pending = threading.local()
+
+    def request(self, verb, url, input, headers):
+        self._pending.args = (verb, url, input, headers)
+
+    def getresponse(self):
+        verb, url, input, headers = self._pending.args
+        response = self.session.request(
+            verb,
+            f"{self.protocol}://{self.host}:{self.port}{url}",
+            headers=headers,
+            data=input,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=False,
+        )
+        return RequestsResponse(response)
+
+    def close(self):
+        # The shared session outlives any one request
+        pass
+
+
+class PlainSessionConnection(SessionConnection):
+    protocol = "http"
+    default_port = 80
+
+
+def install_github_session(session):
+    """Send all PyGithub traffic through ``session`` (and whatever adapters it has mounted)."""
+    # Disable requests' .netrc fallback, as PyGithub does for its own sessions
+    if session.auth is None:
+        session.auth = Requester.noopAuth
+    SessionConnection.session = session
+    Requester.injectConnectionClasses(PlainSessionConnection, SessionConnection)
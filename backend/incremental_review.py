@@ -0,0 +1,193 @@
+"""Incremental PR re-review: only hunks changed since the last reviewed head SHA go back to the model."""
+import os
+import threading
+from datetime import datetime
+
+from diff_chunker import parse_unified_diff, merge_issues
+
+
+class MongoReviewStore:
+    """Last reviewed state per (repo, PR) in a MongoDB collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, repo_name, pr_number):
+        doc = self.collection.find_one({"_id": f"{repo_name}#{pr_number}"})
+        if doc:
+            doc.pop("_id")
+        return doc
+
+    def put(self, repo_name, pr_number, state):
+        key = f"{repo_name}#{pr_number}"
+        self.collection.replace_one({"_id": key}, {"_id": key, **state}, upsert=True)
+
+
+class MemoryReviewStore:
+    """Process-local stand-in for MongoReviewStore."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_name, pr_number):
+        with self._lock:
+            return self._states.get(f"{repo_name}#{pr_number}")
+
+    def put(self, repo_name, pr_number, state):
+        with self._lock:
+            self._states[f"{repo_name}#{pr_number}"] = state
+
+
+def make_review_store(db):
+    """Pick the review state store from REVIEW_STORE ("mongo" or "memory")."""
+    if os.getenv("REVIEW_STORE", "mongo") == "memory":
+        return MemoryReviewStore()
+    return MongoReviewStore(db["review_state"])
+
+
+def _line(issue):
+    try:
+        return int(issue.get("line_number"))
+    except (TypeError, ValueError):
+        return None
+
+
+def attribute_issues(diff_text, issues):
+    """Group issues under the hunk (by file and new-side line) they belong to.
+
+    Issues that fall outside every hunk are kept in a file-level record with
+    no fingerprint, so they can still be carried forward.
+    """
+    records = []
+    by_path = {}
+    for file_diff in parse_unified_diff(diff_text):
+        for hunk in file_diff.hunks:
+            record = {
+                "path": hunk.path, "fingerprint": hunk.fingerprint,
+                "new_start": hunk.new_start, "new_lines": hunk.new_lines, "issues": [],
+            }
+            records.append(record)
+            by_path.setdefault(hunk.path, []).append(record)
+
+    loose = {}
+    for issue in issues:
+        line = _line(issue)
+        for record in by_path.get(issue.get("file"), []):
+            if line is not None and record["new_start"] <= line < record["new_start"] + record["new_lines"]:
+                record["issues"].append(issue)
+                break
+        else:
+            path = issue.get("file")
+            if path not in loose:
+                loose[path] = {"path": path, "fingerprint": None, "new_start": 0, "new_lines": 0, "issues": []}
+                records.append(loose[path])
+            loose[path]["issues"].append(issue)
+    return records
+
+
+def line_mapper(hunks):
+    """Map line numbers in the old version of a file to the new one across ``hunks``.
+
+    Returns a function giving the new line number, or None for lines the
+    change removed or rewrote.
+    """
+    exact = {}
+    shifts = []  # (first old line after the hunk, cumulative offset from then on)
+    for hunk in sorted(hunks, key=lambda h: h.old_start):
+        old_line, new_line = hunk.old_start, hunk.new_start
+        for text in hunk.lines:
+            if text.startswith("\\"):
+                continue
+            if text.startswith("-"):
+                exact[old_line] = None
+                old_line += 1
+            elif text.startswith("+"):
+                new_line += 1
+            else:
+                exact[old_line] = new_line
+                old_line += 1
+                new_line += 1
+        shifts.append((old_line, new_line - old_line))
+
+    def map_line(line):
+        if line in exact:
+            return exact[line]
+        offset = 0
+        for start, shift in shifts:
+            if line >= start:
+                offset = shift
+        return line + offset
+
+    return map_line
+
+
+def carry_forward(records, push_diff_text):
+    """Move the previous review's records onto the new head, dropping findings on lines the push changed."""
+    pushed = {}
+    for file_diff in parse_unified_diff(push_diff_text):
+        pushed[file_diff.old_path] = file_diff
+        pushed.setdefault(file_diff.path, file_diff)
+
+    carried = []
+    for record in records:
+        file_diff = pushed.get(record["path"])
+        if file_diff is None:
+            carried.append(record)
+            continue
+        map_line = line_mapper(file_diff.hunks)
+        issues = []
+        for issue in record["issues"]:
+            line = _line(issue)
+            new_line = map_line(line) if line is not None else None
+            if new_line is not None:
+                issues.append({**issue, "file": file_diff.path, "line_number": new_line})
+        start = map_line(record["new_start"]) if record["new_start"] else 0
+        if issues or start is not None:
+            carried.append({**record, "path": file_diff.path, "new_start": start or 0, "issues": issues})
+    return carried
+
+
+def flatten(records):
+    """All findings across records, one per (file, line)."""
+    return merge_issues([{"issues": [issue for record in records for issue in record["issues"]]}])
+
+
+def incremental_review(store, repo_name, pr_number, head_sha, fetch_pr_diff, fetch_push_diff, review_fn,
+                       full=False):
+    """Review a PR, reusing the stored review of an earlier head where possible.
+
+    ``fetch_push_diff(old_sha, new_sha)`` returns the diff between two heads,
+    or None when the push cannot be reviewed incrementally (e.g. after a
+    force-push). ``review_fn(diff_text)`` returns ``(issues, meta)``. With
+    ``full`` the stored review is ignored and replaced.
+    """
+    state = None if full else store.get(repo_name, pr_number)
+    if state and state["head_sha"] == head_sha:
+        return {
+            "issues": flatten(state["hunks"]), "chunks": 0, "tokens_sent": 0, "skipped_files": {},
+            "incremental": {"mode": "unchanged", "head_sha": head_sha, "reviewed_at": state.get("reviewed_at")},
+        }
+
+    push_diff = fetch_push_diff(state["head_sha"], head_sha) if state else None
+    if push_diff is not None:
+        carried = carry_forward(state["hunks"], push_diff)
+        issues, meta = review_fn(push_diff)
+        records = carried + attribute_issues(push_diff, issues)
+        mode = {"mode": "incremental", "base_sha": state["head_sha"],
+                "carried_issues": sum(len(r["issues"]) for r in carried)}
+    else:
+        diff_text = fetch_pr_diff()
+        issues, meta = review_fn(diff_text)
+        records = attribute_issues(diff_text, issues)
+        mode = {"mode": "full"}
+
+    if meta.get("errors"):
+        # Keep the old state so the failed chunks are retried next time
+        return {"issues": flatten(records), **meta, "incremental": {**mode, "head_sha": head_sha, "saved": False}}
+
+    store.put(repo_name, pr_number, {
+        "repo": repo_name, "pr_number": pr_number, "head_sha": head_sha,
+        "hunks": records, "reviewed_at": datetime.utcnow().isoformat() + "Z",
+    })
+    return {"issues": flatten(records), **meta, "incremental": {**mode, "head_sha": head_sha}}
@@ -0,0 +1,165 @@
+"""Deterministic prompt -> action routing that avoids a Gemini round trip for common requests."""
+import re
+
+REPO_URL_RE = re.compile(r'github\.com/([\w.-]+/[\w.-]+?)(?:\.git)?(?:[/\s?#]|$)', re.I)
+REPO_KEYWORD_RE = re.compile(
+    r'\b(?:repo(?:sitory)?|in|for|from|of|on|at|to|across)\s+[`\'"]?([\w.-]+/[\w.-]+)(?![\w/-])', re.I)
+REPO_ANY_RE = re.compile(r'(?<![\w./-])([\w-][\w.-]*/[\w-][\w.-]*)(?![\w/-])')
+PR_RE = re.compile(r'(?:#|\b(?:pr|pull request|pull|pulls|prs|pull requests)\s*(?:number\s*|no\.?\s*)?#?)\s*(\d+)\b'
+                   # More numbers listed after it: "PRs 3 and 4", "#3 vs 4"
+                   r'((?:\s*(?:,|&|\band\b|\bor\b|\bvs\b\.?|\bversus\b)\s*(?:(?:pr|pull request)\s*)?#?\s*\d+\b)*)', re.I)
+FILE_KEYWORD_RE = re.compile(r'\bfile\s+[`\'"]?([^\s`\'",]+)', re.I)
+FILE_ANY_RE = re.compile(r'[`\'"]?((?:[\w.-]+/)*[\w-][\w.-]*\.[A-Za-z0-9]{1,8})[`\'"]?(?=[\s,.?!]|$)')
+BRANCH_RE = re.compile(r'\b(?:from\s+)?branch\s+(?:named\s+|called\s+)?[`\'"]?([\w./-]+?)[`\'"]?(?=[\s,.;!?]|$)', re.I)
+TITLE_RE = re.compile(r'\btitled?\s+(?:"([^"]+)"|\'([^\']+)\'|`([^`]+)`)', re.I)
+BODY_RE = re.compile(r'\b(?:body|description)\s+(?:"([^"]+)"|\'([^\']+)\'|`([^`]+)`)', re.I)
+# Verbs no rule serves; prompts with them always go to the LLM, which can decline
+UNSUPPORTED_RE = re.compile(
+    r'\b(?:delete|remove|close|merge|archive|rename|transfer|revert|approve|reject|lock|unlock)\b', re.I)
+
+BDD = r'\b(?:bdd|gherkin|behaviou?r[- ]driven|test cases?|test scenarios?|scenarios)\b'
+PR_WORD = r'\b(?:pr|prs|pull requests?|pulls?)\b'
+
+# (action, pattern, needs) in priority order. ``needs`` lists the parameters
+# that must be extracted for the rule to be trusted.
+RULES = [
+    ("compare_snapshot", re.compile(r'\b(?:compare|comparison|differences? between|diff between|vs|versus)\b', re.I),
+     ("repo", "pr_number", "pr_number2")),
+    ("generate_bdd_test_cases", re.compile(BDD, re.I), ("repo", "pr_number")),
+    ("generate_bdd_from_repo", re.compile(BDD, re.I), ("repo", "no_pr")),
+    ("review_open_prs", re.compile(r'\b(?:review|critique|audit)\b.*\b(?:all|every|each|open)\b.*' + PR_WORD, re.I),
+     ("repo", "no_pr")),
+    ("generate_code_review", re.compile(r'\b(?:review|critique|audit|feedback on)\b', re.I), ("repo", "pr_number")),
+    ("generate_snapshot", re.compile(r'\b(?:snapshot|diff|changes|patch|changed lines)\b', re.I), ("repo", "pr_number")),
+    # Only an explicit create verb right before the PR word: "show new PRs" and
+    # "make a list of PRs" are reads
+    ("create_pr", re.compile(r'\b(?:(?:create|raise|submit|file)\s+(?:an?\s+)?|open\s+an?\s+)(?:new\s+)?(?:draft\s+)?'
+                             + PR_WORD, re.I), ("repo", "no_pr", "pr_fields")),
+    ("fetch_pr_details", re.compile(r'\b(?:details?|info(?:rmation)?|describe|description|about|summary|status|show|get)\b', re.I),
+     ("repo", "pr_number")),
+    ("fetch_pull_requests", re.compile(r'\b(?:list|show|get|fetch|find|open|what|which|display|all|any)\b.*' + PR_WORD, re.I),
+     ("repo", "no_pr")),
+    ("read_file", re.compile(r'\b(?:read|open|cat|view|show|display|contents? of|print|get)\b', re.I), ("repo", "file_path")),
+    ("fetch_repo_files", re.compile(r'\b(?:files|file list|tree|structure|contents)\b', re.I), ("repo",)),
+    ("fetch_all_pull_requests", re.compile(PR_WORD + r'.*\b(?:across|in|from|of|for)\s+(?:all\s+)?(?:of\s+)?(?:my|all)\b.*'
+                                           r'\b(?:repos|repositories)\b', re.I), ("no_repo",)),
+    # Only with a read verb, and not when PRs are asked for: that is fetch_all_pull_requests
+    ("fetch_all_repos", re.compile(r'^(?!.*' + PR_WORD + r')(?=.*\b(?:list|show|get|fetch|display|see|what|which)\b)'
+                                   r'.*(?:\b(?:my|all)\b.*\brepo(?:sitorie)?s\b|\brepositories\b)', re.I | re.S), ("no_repo",)),
+]
+
+# Actions whose keywords ("show", "get", "files") also appear in most other requests
+GENERIC_ACTIONS = {"fetch_pr_details", "fetch_pull_requests", "read_file", "fetch_repo_files", "generate_snapshot"}
+
+# Actions that change the repo; when one matches without its parameters, no read is served instead
+WRITE_ACTIONS = {"create_pr"}
+# Likewise for a comparison missing its second PR: a one-PR read would silently drop it
+EXCLUSIVE_ACTIONS = WRITE_ACTIONS | {"compare_snapshot"}
+
+CONFIDENT = 0.95
+AMBIGUOUS = 0.6
+INCOMPLETE = 0.3
+
+
+def extract_params(prompt):
+    """Pull the repository, PR numbers and file path out of a prompt."""
+    repo_candidates = [m.group(1).rstrip(".") for m in REPO_KEYWORD_RE.finditer(prompt)]
+
+    file_path = None
+    match = FILE_KEYWORD_RE.search(prompt)
+    # "file tree" / "file list" name no file
+    if match and re.search(r'[./]', match.group(1).rstrip(".")):
+        file_path = match.group(1).rstrip(".")
+    else:
+        for match in FILE_ANY_RE.finditer(prompt):
+            candidate = match.group(1)
+            # "vercel/next.js" is a repo, not a file, when it is the only repo-like phrase
+            if "github.com" in candidate or repo_candidates == [candidate]:
+                continue
+            file_path = candidate
+            break
+
+    match = REPO_URL_RE.search(prompt)
+    if match:
+        repo = match.group(1)
+    else:
+        # The repository usually closes the sentence: "read src/a.py in owner/repo"
+        others = [c for c in repo_candidates if c != file_path]
+        if not others:
+            others = [m.group(1).rstrip(".") for m in REPO_ANY_RE.finditer(prompt)
+                      if m.group(1).rstrip(".") != file_path and "github.com" not in m.group(1)]
+        repo = others[-1] if others else None
+
+    pr_numbers = []
+    for first, more in PR_RE.findall(prompt):
+        for number in [first, *re.findall(r'\d+', more)]:
+            if int(number) not in pr_numbers:
+                pr_numbers.append(int(number))
+    pr_fields = {}
+    for name, regex in (("branch_name", BRANCH_RE), ("title", TITLE_RE), ("body", BODY_RE)):
+        match = regex.search(prompt)
+        if match:
+            pr_fields[name] = next(group for group in match.groups() if group)
+    return {"repo": repo, "pr_numbers": pr_numbers, "file_path": file_path, "pr_fields": pr_fields}
+
+
+def _satisfied(needs, params):
+    for need in needs:
+        if need == "repo" and not params["repo"]:
+            return False
+        if need == "no_repo" and params["repo"]:
+            return False
+        if need == "pr_number" and not params["pr_numbers"]:
+            return False
+        if need == "pr_number2" and len(params["pr_numbers"]) < 2:
+            return False
+        if need == "no_pr" and params["pr_numbers"]:
+            return False
+        if need == "file_path" and not params["file_path"]:
+            return False
+        if need == "pr_fields" and not ({"branch_name", "title"} & set(params["pr_fields"])):
+            return False
+    return True
+
+
+def route(prompt, supplied=()):
+    """Return ``(intent, confidence)`` for ``prompt``.
+
+    ``intent`` has the same shape as call_gemini's output, or is None when no
+    rule matched. Confidence is high only when exactly one rule matched with
+    all of its parameters present. ``supplied`` names PR fields (branch_name,
+    title) the request carries besides the prompt.
+    """
+    if UNSUPPORTED_RE.search(prompt):
+        return None, 0.0
+    params = extract_params(prompt)
+    params["pr_fields"] = {**{name: None for name in supplied}, **params["pr_fields"]}
+    matched = [(action, needs) for action, regex, needs in RULES if regex.search(prompt)]
+    complete = [action for action, needs in matched if _satisfied(needs, params)]
+    if any(action in EXCLUSIVE_ACTIONS and action not in complete for action, _ in matched):
+        complete = []
+    if not complete:
+        if not matched:
+            return None, 0.0
+        action, confidence = matched[0][0], INCOMPLETE
+    else:
+        action = complete[0]
+        # A prompt with two specific readings (e.g. "review PR #3 and write BDD
+        # tests") is ambiguous; generic readers never outrank a specific match.
+        rivals = [a for a in complete[1:] if a not in GENERIC_ACTIONS]
+        confidence = AMBIGUOUS if rivals else CONFIDENT
+        # PRs the action would ignore ("review PRs 3 and 4") need the LLM to decide
+        needs = dict(matched)[action]
+        if len(params["pr_numbers"]) > ("pr_number2" in needs) + ("pr_number" in needs):
+            confidence = min(confidence, AMBIGUOUS)
+
+    pr_numbers = params["pr_numbers"]
+    additional_params = {
+        "file_path": params["file_path"] if action == "read_file" else None,
+        "pr_number": pr_numbers[0] if pr_numbers else None,
+    }
+    if action == "compare_snapshot" and len(pr_numbers) > 1:
+        additional_params["pr_number2"] = pr_numbers[1]
+    if action == "create_pr":
+        additional_params.update({name: value for name, value in params["pr_fields"].items() if value})
+    return {"action": action, "repo": params["repo"], "additional_params": additional_params}, confidence
@@ -0,0 +1,244 @@
+"""Background job queue for long-running GitHub actions."""
+import os
+import json
+import uuid
+import socket
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING, ReturnDocument
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "error"
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _owner():
+    return {"host": socket.gethostname(), "pid": os.getpid()}
+
+
+def _orphaned(job):
+    """True for an unfinished job whose worker process on this host has exited."""
+    owner = job.get("owner") or {}
+    if job.get("status") not in (QUEUED, RUNNING) or owner.get("host") != socket.gethostname():
+        return False
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except (KeyError, TypeError, PermissionError):
+        return False
+    return False
+
+
+class MongoJobStore:
+    """Keeps job state in a MongoDB collection, and partial results in another.
+
+    Each partial result is its own document, keyed by job id and sequence
+    number, so a job over thousands of files stays far below Mongo's 16 MB
+    document limit.
+    """
+
+    def __init__(self, collection, partials):
+        self.collection = collection
+        self.partials_collection = partials
+        self._indexed = False
+
+    def _ensure_indexes(self):
+        if not self._indexed:
+            self.partials_collection.create_index([("job_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+            self._indexed = True
+
+    def create(self, job):
+        self.collection.insert_one({"_id": job["id"], **{k: v for k, v in job.items() if k != "partial"},
+                                    "partial_count": 0})
+
+    def get(self, job_id, with_partials=True):
+        doc = self.collection.find_one({"_id": job_id}, {"_id": 0, "partial_count": 0})
+        if doc and with_partials:
+            doc["partial"] = self.partials(job_id)
+        return doc
+
+    def update(self, job_id, **fields):
+        self.collection.update_one({"_id": job_id}, {"$set": {**fields, "updated_at": _now()}})
+
+    def append_partial(self, job_id, item):
+        self._ensure_indexes()
+        job = self.collection.find_one_and_update(
+            {"_id": job_id},
+            {"$inc": {"partial_count": 1}, "$set": {"updated_at": _now()}},
+            projection={"partial_count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            self.partials_collection.insert_one({"job_id": job_id, "seq": job["partial_count"] - 1, "item": item})
+
+    def partials(self, job_id, start=0):
+        """Partial results from the ``start``-th on, stopping at one still being written."""
+        items = []
+        for doc in self.partials_collection.find({"job_id": job_id, "seq": {"$gte": start}}).sort("seq", ASCENDING):
+            if doc["seq"] != start + len(items):
+                break
+            items.append(doc["item"])
+        return items
+
+    def mark_interrupted(self):
+        for job in self.collection.find({"status": {"$in": [QUEUED, RUNNING]}, "owner.host": socket.gethostname()}):
+            if _orphaned(job):
+                self.update(job["_id"], status=FAILED, error="Interrupted by a server restart.")
+
+
+class FileJobStore:
+    """Local stand-in for MongoJobStore: one JSON file per job plus a JSONL file of partial results."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        # Job ids are generated by uuid4().hex, but never trust them as paths.
+        if not job_id.isalnum():
+            raise KeyError(job_id)
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def _write(self, job):
+        path = self._path(job["id"], ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id, ".json")) as f:
+                return json.load(f)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def create(self, job):
+        with self._lock:
+            self._write({k: v for k, v in job.items() if k != "partial"})
+
+    def get(self, job_id, with_partials=True):
+        job = self._read(job_id)
+        if job is not None and with_partials:
+            job["partial"] = self.partials(job_id)
+        return job
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._read(job_id)
+            if job is not None:
+                job.update(fields, updated_at=_now())
+                self._write(job)
+
+    def append_partial(self, job_id, item):
+        with self._lock:
+            with open(self._path(job_id, ".partial.jsonl"), "a") as f:
+                f.write(json.dumps(item) + "\n")
+
+    def partials(self, job_id, start=0):
+        try:
+            with open(self._path(job_id, ".partial.jsonl")) as f:
+                lines = [line for line in f if line.endswith("\n")]  # A last line still being written waits
+        except OSError:
+            return []
+        return [json.loads(line) for line in lines[start:] if line.strip()]
+
+    def mark_interrupted(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                job = self._read(name[:-len(".json")])
+                if job and _orphaned(job):
+                    self.update(job["id"], status=FAILED, error="Interrupted by a server restart.")
+
+
+class JobManager:
+    """Runs submitted callables on an in-process worker pool and records their progress in a store."""
+
+    def __init__(self, store, max_workers=4):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        # Wakes event streams in this process; other processes fall back to polling.
+        self._changed = threading.Condition()
+        self._pool.submit(self._recover)
+
+    def _recover(self):
+        # Runs on the pool so a slow or unreachable store never blocks startup.
+        try:
+            self.store.mark_interrupted()
+        except Exception:
+            pass
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def submit(self, user, action, fn):
+        """Queue ``fn(emit)`` and return the new job id.
+
+        ``fn`` returns the final result; it may call ``emit(key, value)`` to
+        publish partial results while it runs. Those are stored once, as the
+        job's ``partial`` list, so ``fn`` should leave them out of its result.
+        """
+        job_id = uuid.uuid4().hex
+        now = _now()
+        self.store.create({
+            "id": job_id, "user": user, "action": action, "status": QUEUED, "owner": _owner(),
+            "created_at": now, "updated_at": now, "partial": [], "result": None, "error": None,
+        })
+        self._pool.submit(self._run, job_id, fn)
+        return job_id
+
+    def _run(self, job_id, fn):
+        self.store.update(job_id, status=RUNNING)
+        self._notify()
+
+        def emit(key, value):
+            self.store.append_partial(job_id, {"key": key, "value": value})
+            self._notify()
+
+        try:
+            self.store.update(job_id, status=DONE, result=fn(emit))
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, error=str(e))
+        self._notify()
+
+    def get(self, job_id, user, with_partials=True):
+        """Return the job if it exists and belongs to ``user``."""
+        job = self.store.get(job_id, with_partials)
+        if not job or job["user"] != user:
+            return None
+        return job
+
+    def events(self, job_id, user, poll_interval=1.0):
+        """Yield Server-Sent Events for each partial result, then a final ``done``/``error`` event."""
+        sent = 0
+        while True:
+            # Status first: once it reads done, every partial result is already stored
+            job = self.get(job_id, user, with_partials=False)
+            if job is None:
+                yield _sse("error", {"error": "Job not found."})
+                return
+            for item in self.store.partials(job_id, sent):
+                yield _sse("partial", item)
+                sent += 1
+            if job["status"] in (DONE, FAILED):
+                yield _sse(job["status"], {"result": job["result"], "error": job["error"]})
+                return
+            with self._changed:
+                self._changed.wait(poll_interval)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def make_job_store(db):
+    """Pick the job store from JOB_STORE ("mongo" or "file")."""
+    if os.getenv("JOB_STORE", "mongo") == "file":
+        return FileJobStore(os.getenv("JOB_STORE_DIR", "jobs_data"))
+    return MongoJobStore(db["jobs"], db["job_partials"])
@@ -0,0 +1,110 @@
+"""Content-addressed cache for LLM responses with an in-memory LRU tier and an optional MongoDB tier."""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+def cache_key(model, template_version, content):
+    """Hash of everything that determines the model's answer."""
+    digest = hashlib.sha256()
+    for part in (model, template_version, content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Maps cache keys to response text.
+
+    The memory tier evicts least-recently-used entries once either
+    ``max_entries`` or ``max_bytes`` is exceeded, and drops entries older than
+    ``ttl_seconds``. If ``collection`` is given, entries are also written to
+    MongoDB, where a TTL index expires them; memory misses fall through to it.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl_seconds=86400, collection=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self._entries = OrderedDict()  # key -> (text, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._indexed = False
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def _remember(self, key, text, stored_at):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[2]
+            self._entries[key] = (text, stored_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.counters["evictions"] += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            if entry:
+                self._entries.pop(key)
+                self._bytes -= entry[2]
+
+        if self.collection is not None:
+            try:
+                doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            except Exception:
+                doc = None
+                self._count("errors")
+            if doc:
+                self._remember(key, doc["text"], now)
+                self._count("persistent_hits")
+                return doc["text"]
+
+        self._count("misses")
+        return None
+
+    def set(self, key, text):
+        self._remember(key, text, time.time())
+        if self.collection is not None:
+            try:
+                self._ensure_index()
+                self.collection.replace_one(
+                    {"_id": key},
+                    {"_id": key, "text": text, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)},
+                    upsert=True,
+                )
+            except Exception:
+                self._count("errors")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["persistent_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,212 @@
+"""Per-request stage timings and Prometheus text-format metrics.
+
+Each request gets a ``Timer`` held in a context variable; code on the hot
+path wraps its work in ``span(stage)``. When the request ends the stage
+totals feed the histograms and, if the client asked, a ``Server-Timing``
+header.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current = ContextVar("metrics_timer", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def render_gauge(name, help, labelnames, samples):
+    """Text lines for a gauge whose ``{labels: value}`` samples are read at scrape time."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(labelnames, labels)} {value}")
+    return lines
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint and status.", ("endpoint", "status"))
+stage_seconds = Histogram(
+    "github_action_stage_seconds", "Time spent per stage of a GitHub action (stage=total for the whole request).",
+    ("action", "stage"))
+gemini_tokens = Counter(
+    "gemini_tokens_total", "Gemini tokens by prompt template and direction (prompt or completion).",
+    ("template", "kind"))
+gemini_calls = Counter("gemini_calls_total", "Gemini calls by prompt template and cache outcome.", ("template", "cache"))
+
+
+class Timer:
+    """Stage spans recorded while serving one request or background job."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.action = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.spans.append((stage, seconds))
+
+    def totals(self):
+        """Seconds per stage, in first-seen order. Spans from parallel workers add up."""
+        totals = {}
+        with self._lock:
+            for stage, seconds in self.spans:
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start():
+    """Begin timing the current request; returns its Timer."""
+    timer = Timer()
+    _current.set(timer)
+    return timer
+
+
+def current():
+    return _current.get()
+
+
+def use(timer):
+    """Make ``timer`` current again, for work that outlives the request (a streamed body)."""
+    _current.set(timer)
+
+
+def set_action(action):
+    timer = _current.get()
+    if timer is not None:
+        timer.action = action
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as ``stage`` of the current request (no-op outside one)."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - started)
+
+
+def bind(fn):
+    """Wrap ``fn`` so it runs on a worker thread in the caller's context.
+
+    Spans it records count toward the current request, and other context
+    (such as rate_limit.current_user) carries over too.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        # A Context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return bound
+
+
+def finish(timer):
+    """Feed a finished Timer's stage totals into the stage histogram."""
+    if timer.action is None:
+        return
+    for stage, seconds in timer.totals().items():
+        stage_seconds.observe(seconds, timer.action, stage)
+    stage_seconds.observe(timer.elapsed(), timer.action, "total")
+
+
+def server_timing(timer):
+    """``Server-Timing`` header value (milliseconds) for a Timer."""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timer.totals().items()]
+    entries.append(f"total;dur={timer.elapsed() * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def tracked(action, fn):
+    """Wrap a background job's ``fn`` so it is timed like a request for ``action``."""
+    def run(*args, **kwargs):
+        timer = start()
+        timer.action = action
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            finish(timer)
+            _current.set(None)
+    return run
+
+
+def render(rate_limits=None):
+    """All metrics in the Prometheus text exposition format.
+
+    ``rate_limits`` is the ``{resource: {"limit", "remaining", ...}}`` dict
+    from the HTTP cache stats.
+    """
+    lines = request_seconds.render() + stage_seconds.render() + gemini_tokens.render() + gemini_calls.render()
+    for field in ("limit", "remaining", "used", "reset"):
+        samples = {(resource,): values[field] for resource, values in (rate_limits or {}).items() if field in values}
+        lines += render_gauge(f"github_rate_limit_{field}", f"Last seen X-RateLimit-{field.capitalize()} by resource.",
+                              ("resource",), samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,105 @@
+"""Opaque cursors over list results, so large answers come back a page at a time, and field selection."""
+import base64
+import json
+import os
+from itertools import islice
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Offset a cursor points at; raises ValueError for anything we did not issue."""
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded.encode()))["o"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor.")
+    return offset
+
+
+def page_size(limit):
+    """Clamp a client's ``limit`` to 1..MAX_PAGE_SIZE, defaulting to DEFAULT_PAGE_SIZE."""
+    if limit in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer.")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(items, cursor=None, limit=None):
+    """One page of ``items`` as ``(page, meta)``; ``meta["next_cursor"]`` is None on the last page."""
+    start = min(decode_cursor(cursor), len(items))
+    end = min(start + page_size(limit), len(items))
+    return items[start:end], {"total": len(items), "next_cursor": encode_cursor(end) if end < len(items) else None}
+
+
+def page_requested(cursor, limit):
+    """True if the client asked for pages; list actions answer in full otherwise."""
+    return cursor not in (None, "") or limit not in (None, "")
+
+
+def paginate_requested(items, cursor=None, limit=None):
+    """``items`` unchanged, or ``{"items": page, "total", "next_cursor"}`` if a page was asked for."""
+    if not page_requested(cursor, limit):
+        return items
+    page, meta = paginate(items, cursor, limit)
+    return {"items": page, **meta}
+
+
+def iter_page(items, cursor=None, limit=None, meta=None):
+    """Lazy ``paginate`` over any iterable, for streaming.
+
+    Yields the page's items (every item if no page was asked for) and, once
+    done, sets ``count`` and ``next_cursor`` in ``meta``. Reads one item past
+    the page to know whether there is a next page.
+    """
+    meta = {} if meta is None else meta
+    items = iter(items)
+    start = decode_cursor(cursor)
+    size = page_size(limit) if page_requested(cursor, limit) else None
+    count = 0
+    for item in islice(items, start, None if size is None else start + size):
+        count += 1
+        yield item
+    end = object()
+    more = size is not None and count == size and next(items, end) is not end
+    meta.update(count=count, next_cursor=encode_cursor(start + count) if more else None)
+
+
+def parse_fields(fields):
+    """Field names from ``"a,b"`` or ``["a", "b"]``; None means every field."""
+    if fields in (None, "", []):
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    if not isinstance(fields, list) or not all(isinstance(name, str) for name in fields):
+        raise ValueError("fields must be a comma-separated string or a list of names.")
+    return [name.strip() for name in fields if name.strip()] or None
+
+
+def select_fields(value, fields):
+    """Keep only ``fields`` of a dict, or of each dict in a list.
+
+    In a page (a dict with ``next_cursor``) the fields are picked from the
+    listed items and the paging keys are kept. Anything else is returned as is.
+    """
+    if not fields:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, fields) if isinstance(item, dict) else item for item in value]
+    if isinstance(value, dict):
+        if "next_cursor" in value:
+            return {k: select_fields(v, fields) if isinstance(v, list) else v for k, v in value.items()}
+        return {name: value[name] for name in fields if name in value}
+    return value
@@ -0,0 +1,322 @@
+"""Per-user budgets, GitHub quota pacing, fair upstream slots and backoff on upstream rate limits."""
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Cost of each action in a user's budget; anything unlisted costs 1
+ACTION_COSTS = {
+    "generate_bdd_from_repo": 20,
+    "fetch_all_pull_requests": 5,
+    "generate_code_review": 5,
+    "generate_bdd_test_cases": 5,
+    "compare_snapshot": 2,
+}
+# Actions charged per item of the page they work on: review_open_prs per PR reviewed
+PER_ITEM_COSTS = {
+    "review_open_prs": 5,
+}
+# Part of every action's cost charged before its prompt is resolved, so prompts
+# that resolve to nothing still spend budget on the intent call
+INTENT_COST = 1
+
+# Per process: under gunicorn each worker keeps its own buckets, so a user's
+# effective budget is these values times WEB_WORKERS
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "60"))
+USER_BURST = float(os.getenv("USER_BURST", "60"))
+GITHUB_RATE_RESERVE = int(os.getenv("GITHUB_RATE_RESERVE", "50"))
+MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "30"))
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_SECONDS", "1"))
+GITHUB_SLOTS = int(os.getenv("GITHUB_SLOTS", "32"))
+GEMINI_SLOTS = int(os.getenv("GEMINI_SLOTS", "8"))
+
+# User whose request or job is running, for fair slot sharing
+current_user = ContextVar("rate_limit_user", default=None)
+
+
+class RateLimited(Exception):
+    """An upstream or per-user limit was hit; the caller should retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after, source):
+        super().__init__(f"{source} rate limit reached; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+        self.source = source
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, cost):
+        """Take ``cost`` tokens if available; otherwise return the seconds until they will be."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class UserLimiter:
+    """A token bucket per user, refilled at ``rate_per_minute`` up to ``burst``.
+
+    Buckets live in this process only; see USER_RATE_PER_MINUTE.
+    """
+
+    def __init__(self, rate_per_minute=USER_RATE_PER_MINUTE, burst=USER_BURST, max_users=10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, user, action):
+        """Charge ``action`` to ``user``; returns 0, or the seconds to wait before it is allowed."""
+        return self.charge(user, action_cost(action))
+
+    def charge(self, user, cost):
+        """Take ``cost`` from ``user``'s bucket; returns 0, or the seconds to wait before it is allowed."""
+        with self._lock:
+            bucket = self._buckets.pop(user, None) or TokenBucket(self.rate, self.burst)
+            self._buckets[user] = bucket
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            return bucket.take(cost)
+
+
+def action_cost(action, items=1):
+    """Budget ``action`` takes when it works on ``items`` things (PRs, for review_open_prs)."""
+    if action in PER_ITEM_COSTS:
+        return PER_ITEM_COSTS[action] * items
+    return ACTION_COSTS.get(action, 1)
+
+
+def resource_of(url):
+    """GitHub rate-limit resource an API URL counts against."""
+    if "/search/" in url:
+        return "search"
+    if url.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+class QuotaPacer:
+    """Spaces GitHub calls so the quota lasts until its reset.
+
+    Fed from ``X-RateLimit-*`` headers. While plenty remains nothing waits.
+    Below ``pace_below`` of the limit, calls are spread evenly over the time
+    left. At ``reserve`` they wait for the reset. Waits longer than
+    ``max_wait`` raise RateLimited instead.
+    """
+
+    def __init__(self, reserve=GITHUB_RATE_RESERVE, pace_below=0.2, max_wait=MAX_WAIT_SECONDS):
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def update(self, headers):
+        if "x-ratelimit-remaining" not in headers or "x-ratelimit-reset" not in headers:
+            return
+        resource = headers.get("x-ratelimit-resource", "core")
+        with self._lock:
+            state = self._state.setdefault(resource, {"next": 0.0})
+            state["limit"] = int(headers.get("x-ratelimit-limit", state.get("limit", 0)))
+            state["remaining"] = int(headers["x-ratelimit-remaining"])
+            state["reset"] = int(headers["x-ratelimit-reset"])
+
+    def delay(self, resource):
+        """Seconds to wait before the next call to ``resource``; raises RateLimited past ``max_wait``."""
+        now = time.time()
+        with self._lock:
+            state = self._state.get(resource)
+            if not state or "reset" not in state or now >= state["reset"]:
+                return 0.0
+            left = state["reset"] - now
+            if state["remaining"] <= self.reserve:
+                wait = left
+            elif state["remaining"] < state["limit"] * self.pace_below:
+                start = max(now, state["next"])
+                state["next"] = start + left / (state["remaining"] - self.reserve)
+                wait = start - now
+            else:
+                wait = 0.0
+            # Count the call now so concurrent callers do not all see the same budget
+            state["remaining"] -= 1
+        if wait > self.max_wait:
+            raise RateLimited(wait, "github")
+        return wait
+
+    def wait(self, resource):
+        delay = self.delay(resource)
+        if delay > 0:
+            time.sleep(delay)
+
+    def snapshot(self):
+        with self._lock:
+            return {resource: dict(state) for resource, state in self._state.items()}
+
+
+def github_retry_delay(status_code, headers, attempt):
+    """Seconds to wait before retrying a GitHub response, or None if it was not rate limited."""
+    if status_code not in (403, 429):
+        return None
+    if "retry-after" in headers:
+        return float(headers["retry-after"])
+    if headers.get("x-ratelimit-remaining") == "0" and "x-ratelimit-reset" in headers:
+        return max(int(headers["x-ratelimit-reset"]) - time.time(), 1.0)
+    if status_code == 429:
+        return backoff(attempt)
+    return None  # A plain 403 is a permissions error
+
+
+def backoff(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt)
+
+
+def is_quota_error(error):
+    """True for Gemini's resource-exhausted / too-many-requests errors."""
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.ResourceExhausted, exceptions.TooManyRequests))
+
+
+def call_with_backoff(fn, retries=MAX_RETRIES):
+    """Call ``fn()``, retrying Gemini quota errors with exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if not is_quota_error(e):
+                raise
+            if attempt == retries:
+                raise RateLimited(backoff(attempt), "gemini") from e
+            time.sleep(backoff(attempt))
+
+
+async def call_with_backoff_async(fn, retries=MAX_RETRIES):
+    """``call_with_backoff`` for a coroutine function."""
+    import asyncio
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if not is_quota_error(e):
+                raise
+            if attempt == retries:
+                raise RateLimited(backoff(attempt), "gemini") from e
+            await asyncio.sleep(backoff(attempt))
+
+
+class FairGate:
+    """At most ``slots`` concurrent upstream calls; waiting callers are admitted round-robin by user.
+
+    A user with a thousand queued calls gets one slot in turn with everyone
+    else, instead of holding the line until their batch drains. Threads wait
+    in ``acquire``; coroutines await ``acquire_async``, which holds no thread.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.active = 0
+        self._queues = OrderedDict()  # user -> deque of waiting tickets, in turn order
+        self._lock = threading.Lock()
+
+    def acquire(self, user=None):
+        ticket = _ThreadTicket()
+        self._enqueue(user, ticket)
+        ticket.event.wait()
+
+    async def acquire_async(self, user=None):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        ticket = _LoopTicket(loop, loop.create_future())
+        self._enqueue(user, ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._queues.get(user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[user]
+                    ticket = None
+            if ticket is not None:
+                self.release()  # Admitted just as the caller gave up
+            raise
+
+    def _enqueue(self, user, ticket):
+        with self._lock:
+            self._queues.setdefault(user, deque()).append(ticket)
+            self._admit()
+
+    def _admit(self):
+        """Hand free slots to the tickets at the head of the line; the lock must be held."""
+        while self.active < self.slots and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            del self._queues[user]
+            if queue:
+                self._queues[user] = queue  # back of the line for this user's next call
+            self.active += 1
+            ticket.admit()
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._admit()
+
+    @contextmanager
+    def slot(self, user=None):
+        self.acquire(user)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {"active": self.active, "slots": self.slots,
+                    "waiting": {str(user): len(queue) for user, queue in self._queues.items()}}
+
+
+class _ThreadTicket:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def admit(self):
+        self.event.set()
+
+
+class _LoopTicket:
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+
+    def admit(self):
+        # Admitted from whichever thread released the slot
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+user_limiter = UserLimiter()
+github_pacer = QuotaPacer()
+github_gate = FairGate(GITHUB_SLOTS)
+gemini_gate = FairGate(GEMINI_SLOTS)
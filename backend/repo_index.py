@@ -0,0 +1,254 @@
+"""On-disk lexical index of repository files, for pulling related code into review and BDD prompts.
+
+Files are split into line chunks and stored in SQLite with an FTS5 index;
+search ranks chunks by BM25. Content is keyed by blob SHA, so syncing a repo
+after a push only reads the blobs that changed, and identical files in
+different repos or branches are stored once.
+"""
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from diff_chunker import estimate_tokens
+from metrics import bind
+
+CHUNK_LINES = int(os.getenv("REPO_INDEX_CHUNK_LINES", "40"))
+TOP_K = int(os.getenv("REPO_INDEX_TOP_K", "4"))
+CONTEXT_TOKENS = int(os.getenv("REPO_INDEX_CONTEXT_TOKENS", "1500"))
+READ_WORKERS = int(os.getenv("REPO_INDEX_READ_WORKERS", "8"))
+# Query terms found in more than this share of chunks are dropped: they match
+# nearly everything, add little to the ranking and make every search slow
+COMMON_TERM_SHARE = float(os.getenv("REPO_INDEX_COMMON_TERM_SHARE", "0.05"))
+# ...but a term in this many chunks or fewer is always kept: in a small repo the
+# share would drop every identifier shared by a caller and its definition
+MIN_COMMON_DF = int(os.getenv("REPO_INDEX_MIN_COMMON_DF", "20"))
+QUERY_TERMS = 16
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]{2,}')
+# Too common across languages to say anything about what a snippet is about
+STOPWORDS = {
+    "and", "are", "as", "assert", "async", "await", "bool", "break", "case", "catch", "class", "const", "continue",
+    "def", "default", "del", "diff", "elif", "else", "except", "export", "false", "final", "finally", "for",
+    "from", "func", "function", "git", "import", "index", "int", "let", "new", "none", "not", "null", "pass",
+    "private", "public", "raise", "return", "self", "static", "str", "string", "the", "this", "throw", "true",
+    "try", "var", "void", "while", "with", "yield",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, chunks INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    repo TEXT NOT NULL, path TEXT NOT NULL, sha TEXT NOT NULL, PRIMARY KEY (repo, path)
+);
+CREATE INDEX IF NOT EXISTS files_sha ON files (sha);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY, sha TEXT NOT NULL, start_line INTEGER NOT NULL, end_line INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_sha ON chunks (sha, start_line);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text, content='chunks', content_rowid='id', tokenize="unicode61 tokenchars '_'"
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, 'row');
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def split_lines(text, chunk_lines=CHUNK_LINES):
+    """``(start_line, end_line, text)`` chunks of ``text``; joined in order they give the text back."""
+    lines = text.splitlines(keepends=True)
+    return [(start + 1, min(start + chunk_lines, len(lines)), "".join(lines[start:start + chunk_lines]))
+            for start in range(0, len(lines), chunk_lines)]
+
+
+def query_terms(text, limit=64):
+    """The most frequent identifiers in ``text``, lowercased, skipping language keywords."""
+    counts = Counter(word.lower() for word in _IDENTIFIER_RE.findall(text))
+    return [term for term, _ in counts.most_common() if term not in STOPWORDS][:limit]
+
+
+def related_context(hits, max_tokens=CONTEXT_TOKENS):
+    """Prompt section quoting ``hits`` until ``max_tokens`` is spent; empty when there are none."""
+    parts, used = [], 0
+    for hit in hits:
+        part = f"--- {hit['path']} (lines {hit['start_line']}-{hit['end_line']})\n{hit['text'].rstrip()}\n"
+        used += estimate_tokens(part)
+        if used > max_tokens:
+            break
+        parts.append(part)
+    if not parts:
+        return ""
+    return "Related code from the repository, for reference only:\n" + "".join(parts) + "\n"
+
+
+class RepoIndex:
+    """Chunked, BM25-searchable copy of the files of each synced repo.
+
+    One SQLite database in WAL mode serves every thread and worker process;
+    each thread opens its own connection.
+    """
+
+    def __init__(self, path, chunk_lines=CHUNK_LINES):
+        self.path = path
+        self.chunk_lines = chunk_lines
+        self._local = threading.local()
+        # term -> number of chunks containing it, until the next sync
+        self._doc_counts = {}
+        self._lock = threading.Lock()
+        self._sync_locks = {}
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def _known(self, conn, shas):
+        shas = list(shas)
+        known = set()
+        for i in range(0, len(shas), 500):
+            batch = shas[i:i + 500]
+            rows = conn.execute(f"SELECT sha FROM blobs WHERE sha IN ({','.join('?' * len(batch))})", batch)
+            known.update(sha for (sha,) in rows)
+        return known
+
+    def sync(self, repo_name, entries, read_fn, workers=READ_WORKERS):
+        """Make the index of ``repo_name`` match ``entries`` (tree entries with path and sha).
+
+        Only blobs the index has never seen are read, through ``read_fn(path)``;
+        files that fail to read are left out until the next sync. Concurrent
+        syncs of one repo run one after the other, so the later ones find the
+        blobs already read. Returns counts of files indexed, blobs read and
+        read errors.
+        """
+        with self._lock:
+            lock = self._sync_locks.setdefault(repo_name, threading.Lock())
+        with lock:
+            return self._sync(repo_name, entries, read_fn, workers)
+
+    def _sync(self, repo_name, entries, read_fn, workers):
+        wanted = {entry["path"]: entry["sha"] for entry in entries}
+        with self._connect() as conn:
+            known = self._known(conn, set(wanted.values()))
+        missing = {}
+        for path, sha in wanted.items():
+            if sha not in known:
+                missing.setdefault(sha, path)
+
+        def read(item):
+            sha, path = item
+            try:
+                return sha, read_fn(path)
+            except Exception:
+                return sha, None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetched = dict(pool.map(bind(read), missing.items())) if missing else {}
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for sha, text in fetched.items():
+                if text is None or conn.execute("SELECT 1 FROM blobs WHERE sha = ?", (sha,)).fetchone():
+                    continue
+                chunks = split_lines(text, self.chunk_lines)
+                conn.executemany("INSERT INTO chunks (sha, start_line, end_line, text) VALUES (?, ?, ?, ?)",
+                                 [(sha, *chunk) for chunk in chunks])
+                conn.execute("INSERT INTO blobs (sha, chunks) VALUES (?, ?)", (sha, len(chunks)))
+            indexed = self._known(conn, set(wanted.values()))
+            conn.execute("DELETE FROM files WHERE repo = ?", (repo_name,))
+            conn.executemany("INSERT INTO files (repo, path, sha) VALUES (?, ?, ?)",
+                             [(repo_name, path, sha) for path, sha in wanted.items() if sha in indexed])
+            # Blobs no longer in any synced tree
+            orphans = [sha for (sha,) in conn.execute(
+                "SELECT sha FROM blobs WHERE sha NOT IN (SELECT sha FROM files)")]
+            for sha in orphans:
+                conn.execute("DELETE FROM chunks WHERE sha = ?", (sha,))
+                conn.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+        with self._lock:
+            self._doc_counts = {}
+        errors = sum(1 for text in fetched.values() if text is None)
+        return {"files": sum(1 for sha in wanted.values() if sha in indexed),
+                "blobs_read": len(fetched) - errors, "read_errors": errors, "blobs_dropped": len(orphans)}
+
+    def has_repo(self, repo_name):
+        """True once ``repo_name`` has been synced with at least one file."""
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM files WHERE repo = ? LIMIT 1", (repo_name,)).fetchone() is not None
+
+    def text(self, repo_name, path):
+        """Indexed content of a file, or None if it is not in the index."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT c.text FROM files f JOIN chunks c ON c.sha = f.sha "
+                "WHERE f.repo = ? AND f.path = ? ORDER BY c.start_line", (repo_name, path)).fetchall()
+        return "".join(text for (text,) in rows) if rows else None
+
+    def _query(self, conn, terms):
+        """FTS5 OR query of the QUERY_TERMS rarest ``terms`` that are not in most chunks."""
+        if not terms:
+            return None
+        with self._lock:
+            counts = self._doc_counts
+            unknown = [term for term in terms if term not in counts]
+        if unknown or "" not in counts:
+            # Counting a term reads its whole posting list, so counts are kept until the next sync
+            found = dict(conn.execute(
+                f"SELECT term, doc FROM chunks_vocab WHERE term IN ({','.join('?' * len(unknown))})", unknown))
+            found.update({term: 0 for term in unknown if term not in found})
+            found[""] = conn.execute("SELECT COALESCE(SUM(chunks), 0) FROM blobs").fetchone()[0]
+            with self._lock:
+                counts.update(found)
+        limit = max(MIN_COMMON_DF, counts[""] * COMMON_TERM_SHARE)
+        useful = sorted((counts[term], term) for term in terms if 0 < counts[term] <= limit)[:QUERY_TERMS]
+        return " OR ".join(f'"{term}"' for _, term in useful) or None
+
+    def search(self, repo_name, terms, k=TOP_K, exclude_paths=()):
+        """Best ``k`` chunks of ``repo_name`` for ``terms`` (see query_terms), ranked by BM25."""
+        exclude = set(exclude_paths)
+        with self._connect() as conn:
+            query = self._query(conn, terms)
+            if query is None:
+                return []
+            rows = conn.execute(
+                "SELECT f.path, c.start_line, c.end_line, c.text, bm25(chunks_fts) AS rank "
+                "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid JOIN files f ON f.sha = c.sha "
+                "WHERE chunks_fts MATCH ? AND f.repo = ? ORDER BY rank LIMIT ?",
+                (query, repo_name, k * 4 if exclude else k)).fetchall()
+        hits = [{"path": path, "start_line": start, "end_line": end, "text": text, "score": -rank}
+                for path, start, end, text, rank in rows if path not in exclude]
+        return hits[:k]
+
+    def stats(self, repo_name=None):
+        with self._connect() as conn:
+            if repo_name:
+                files = conn.execute("SELECT COUNT(*) FROM files WHERE repo = ?", (repo_name,)).fetchone()[0]
+            else:
+                files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            blobs, chunks = conn.execute("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM blobs").fetchone()
+        return {"files": files, "blobs": blobs, "chunks": chunks}
+
+
+class _Transaction:
+    """``with`` block over a connection: commits an open transaction on success, rolls back on error."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, *exc):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
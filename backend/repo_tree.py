@@ -0,0 +1,111 @@
+"""Recursive repository listing built on the GitHub git-trees API."""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import bind
+
+TREE_WORKERS = int(os.getenv("GITHUB_TREE_WORKERS", "8"))
+TREE_CACHE_SIZE = int(os.getenv("GITHUB_TREE_CACHE_SIZE", "64"))
+REF_TTL_SECONDS = float(os.getenv("GITHUB_REF_TTL_SECONDS", "30"))
+
+_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+# (repo_name, commit_sha) -> list of tree entries. A commit's tree never
+# changes, so entries only leave the cache through LRU eviction.
+_tree_cache = OrderedDict()
+# (repo_name, ref) -> (commit_sha, resolved_at)
+_ref_cache = {}
+_lock = threading.Lock()
+
+
+def _entry(element, prefix):
+    path = f"{prefix}/{element.path}" if prefix else element.path
+    return {
+        "path": path,
+        "type": element.type,
+        "sha": element.sha,
+        "size": element.size if element.type == "blob" else None,
+    }
+
+
+def _fetch_subtree(repo, tree_sha, prefix):
+    """Fetch one subtree, returning its entries and any subtrees still to expand."""
+    tree = repo.get_git_tree(tree_sha, recursive=True)
+    if not tree.raw_data.get("truncated"):
+        return [_entry(el, prefix) for el in tree.tree], []
+
+    # The recursive listing was cut short; list this level only and let the
+    # caller fetch each child subtree on its own.
+    tree = repo.get_git_tree(tree_sha)
+    entries = [_entry(el, prefix) for el in tree.tree]
+    pending = [(e["sha"], e["path"]) for e in entries if e["type"] == "tree"]
+    return entries, pending
+
+
+def _walk(repo, commit_sha):
+    entries = []
+    pending = [(commit_sha, "")]
+    with ThreadPoolExecutor(max_workers=TREE_WORKERS) as pool:
+        while pending:
+            results = pool.map(bind(lambda item: _fetch_subtree(repo, *item)), pending)
+            pending = []
+            for found, more in results:
+                entries.extend(found)
+                pending.extend(more)
+    return entries
+
+
+def resolve_ref(gh, repo_name, ref=None):
+    """Resolve a branch, tag or commit SHA (default branch if None) to a commit SHA."""
+    if ref and _SHA_RE.match(ref):
+        return ref
+
+    key = (repo_name, ref)
+    now = time.monotonic()
+    with _lock:
+        cached = _ref_cache.get(key)
+    if cached and now - cached[1] < REF_TTL_SECONDS:
+        return cached[0]
+
+    repo = gh.get_repo(repo_name, lazy=True)
+    name = ref or repo.default_branch
+    try:
+        sha = repo.get_git_ref(f"heads/{name}").object.sha
+    except Exception:
+        sha = repo.get_commit(name).sha
+
+    with _lock:
+        _ref_cache[key] = (sha, now)
+    return sha
+
+
+def list_repo_tree(gh, repo_name, ref=None):
+    """Return every entry (path, type, sha, size) in the repository at ``ref``.
+
+    Uses a single recursive git-trees request where possible and falls back to
+    parallel per-subtree requests when GitHub truncates the response. Results
+    are cached per commit SHA.
+    """
+    commit_sha = resolve_ref(gh, repo_name, ref)
+    key = (repo_name, commit_sha)
+    with _lock:
+        if key in _tree_cache:
+            _tree_cache.move_to_end(key)
+            return _tree_cache[key]
+
+    entries = _walk(gh.get_repo(repo_name, lazy=True), commit_sha)
+
+    with _lock:
+        _tree_cache[key] = entries
+        while len(_tree_cache) > TREE_CACHE_SIZE:
+            _tree_cache.popitem(last=False)
+    return entries
+
+
+def list_repo_files(gh, repo_name, ref=None):
+    """Return the paths of all regular files in the repository."""
+    return [e["path"] for e in list_repo_tree(gh, repo_name, ref) if e["type"] == "blob"]
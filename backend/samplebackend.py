@@ -1,16 +1,17 @@
 import os
 import json
-import google.generativeai as genai
-from github import Github
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import requests
 import re
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
+from repo_tree import list_repo_files
+from clients import ClientRegistry
+from pagination import paginate_requested
+import compression
 
 load_dotenv()
 
@@ -21,9 +22,9 @@ CORS(app, resources={r"/*": {
     "allow_headers": ["Content-Type", "Authorization"]
 }})
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-github_token = os.getenv("GITHUB_TOKEN")
-g = Github(github_token)
+# Clients are built on first use and rebuilt in forked workers
+clients = ClientRegistry.from_env()
+os.register_at_fork(after_in_child=clients.reset)
 
 app.config['SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
 if not app.config['SECRET_KEY']:
@@ -47,20 +48,40 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+@app.after_request
+def compress(response):
+    return compression.compress_response(response, request.accept_encodings)
+
+def list_items(result):
+    """A list result's items and total length, whether it is the whole list or a page of it."""
+    if isinstance(result, dict):
+        return result['items'], result['total']
+    return result, len(result)
+
+def page_note(result):
+    """Where the formatted page sits in the whole list, if there is more to fetch."""
+    if not isinstance(result, dict) or not result['next_cursor']:
+        return ""
+    return f"\nShowing {len(result['items'])} of {result['total']}; send the next_cursor for more."
+
 def format_response(action, result):
-    """Convert GitHub API responses to human-readable format"""
+    """Convert GitHub API responses to human-readable format; paged lists are formatted a page at a time"""
     if isinstance(result, dict) and 'error' in result:
         return f"❌ Error: {result['error']}"
     
     formatted = ""
     
     if action == "fetch_pull_requests":
-        formatted = f"Found {len(result)} open pull requests:\n"
-        formatted += "\n".join([f"• {pr['title']} (#{pr['number']})" for pr in result])
+        items, total = list_items(result)
+        formatted = f"Found {total} open pull requests:\n"
+        formatted += "\n".join([f"• {pr['title']} (#{pr['number']})" for pr in items])
+        formatted += page_note(result)
     
     elif action == "fetch_repo_files":
-        formatted = f"Repository contains {len(result)} files:\n"
-        formatted += "\n".join([f"• {file}" for file in result])
+        items, total = list_items(result)
+        formatted = f"Repository contains {total} files:\n"
+        formatted += "\n".join([f"• {file}" for file in items])
+        formatted += page_note(result)
     
     elif action == "read_file":
         formatted = f"File content:\n```\n{result}\n```"
@@ -133,8 +154,7 @@ def call_gemini(prompt):
     User Request: {prompt}
     """
     try:
-        model = genai.GenerativeModel("gemini-1.5-pro-latest")
-        response = model.generate_content(structured_prompt)
+        response = clients.model("gemini-1.5-pro-latest").generate_content(structured_prompt)
         response_text = response.candidates[0].content.parts[0].text
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         return json.loads(json_match.group()) if json_match else {"error": "Invalid JSON format"}
@@ -160,23 +180,16 @@ def github_action(current_user):
         result = None
         if action == "fetch_pull_requests":
             result = [{"title": pr.title, "number": pr.number} 
-                     for pr in g.get_repo(repo_name).get_pulls(state='open')]
+                     for pr in clients.github().get_repo(repo_name).get_pulls(state='open')]
         
         elif action == "fetch_repo_files":
-            contents = g.get_repo(repo_name).get_contents("")
-            result = []
-            while contents:
-                fc = contents.pop(0)
-                if fc.type == "file":
-                    result.append(fc.path)
-                else:
-                    contents.extend(g.get_repo(repo_name).get_contents(fc.path))
+            result = list_repo_files(clients.github(), repo_name)
 
         elif action == "read_file":
-            result = g.get_repo(repo_name).get_contents(params["file_path"]).decoded_content.decode()
+            result = clients.github().get_repo(repo_name).get_contents(params["file_path"]).decoded_content.decode()
         
         elif action == "create_pr":
-            repo = g.get_repo(repo_name)
+            repo = clients.github().get_repo(repo_name)
             pr = repo.create_pull(
                 title=data["title"],
                 body=data["body"],
@@ -186,12 +199,21 @@ def github_action(current_user):
             result = {"pr_url": pr.html_url}
         
         elif action == "generate_code_review":
-            pr_diff = requests.get(g.get_repo(repo_name).get_pull(params["pr_number"]).diff_url).text
+            pr_diff = clients.http().get(
+                f"{clients.github_api_url}/repos/{repo_name}/pulls/{params['pr_number']}",
+                headers={"Accept": "application/vnd.github.v3.diff"},
+            ).text
             result = {"review": call_gemini(f"Review this diff:\n{pr_diff}")}
         
         else:
             return jsonify({"error": "Unsupported action"}), 400
 
+        if isinstance(result, list):
+            try:
+                result = paginate_requested(result, data.get("cursor"), data.get("limit"))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
         formatted_message = format_response(action, result)
         return jsonify({
             "result": result,
@@ -205,4 +227,4 @@ def github_action(current_user):
         }), 500
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
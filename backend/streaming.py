@@ -0,0 +1,168 @@
+"""Bounded-memory streaming of GitHub diffs and file contents, with byte/line windows and a size cap,
+and of list results as newline-delimited JSON."""
+import json
+import os
+
+MAX_STREAM_BYTES = int(os.getenv("MAX_STREAM_BYTES", str(20 * 1024 * 1024)))
+MAX_INLINE_BYTES = int(os.getenv("MAX_INLINE_BYTES", str(1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+# NDJSON lines are sent in batches of about this many bytes; 0 sends each line as soon as it exists
+NDJSON_FLUSH_BYTES = int(os.getenv("NDJSON_FLUSH_BYTES", str(16 * 1024)))
+
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+RAW_MEDIA_TYPE = "application/vnd.github.v3.raw"
+
+
+def parse_range(value):
+    """Parse "start-end" or "start-" into ``(start, end_or_None)``; None for an empty value."""
+    if not value:
+        return None
+    start, sep, end = str(value).partition("-")
+    if not sep or not start.strip().isdigit() or (end.strip() and not end.strip().isdigit()):
+        raise ValueError(f"Invalid range {value!r}; expected start-end or start-")
+    start, end = int(start), int(end) if end.strip() else None
+    if end is not None and end < start:
+        raise ValueError(f"Invalid range {value!r}; end is before start")
+    return start, end
+
+
+class Window:
+    """Incremental selection of a byte stream by ``byte_range`` (0-based,
+    inclusive) and ``line_range`` (1-based, inclusive), capped at ``max_bytes``.
+
+    ``feed`` each chunk in order and keep what it returns; stop once ``done``.
+    ``info["bytes"]`` and ``info["truncated"]`` are updated as chunks are fed.
+    """
+
+    def __init__(self, info, byte_range=None, line_range=None, max_bytes=MAX_STREAM_BYTES):
+        self.info = info
+        self.first_byte, self.last_byte = byte_range or (0, None)
+        self.first_line, self.last_line = line_range or (1, None)
+        self.by_line = bool(line_range)
+        self.max_bytes = max_bytes
+        self.offset = 0
+        self.line = 1
+        self.done = False
+
+    def feed(self, chunk):
+        lo = max(self.first_byte - self.offset, 0)
+        hi = len(chunk) if self.last_byte is None else min(self.last_byte + 1 - self.offset, len(chunk))
+        self.offset += len(chunk)
+        piece = chunk[lo:hi] if hi > lo else b""
+
+        if self.by_line and piece:
+            selected = bytearray()
+            parts = piece.split(b"\n")
+            for i, part in enumerate(parts):
+                segment = part if i == len(parts) - 1 else part + b"\n"
+                if self.line >= self.first_line and (self.last_line is None or self.line <= self.last_line):
+                    selected += segment
+                if i < len(parts) - 1:
+                    self.line += 1
+            piece = bytes(selected)
+
+        if piece:
+            room = self.max_bytes - self.info["bytes"]
+            if len(piece) > room:
+                piece = piece[:room]
+                self.info["truncated"] = True
+            self.info["bytes"] += len(piece)
+
+        self.done = (self.info["truncated"]
+                     or (self.last_byte is not None and self.offset > self.last_byte)
+                     or (self.last_line is not None and self.line > self.last_line))
+        return piece
+
+
+def window(chunks, info, byte_range=None, line_range=None, max_bytes=MAX_STREAM_BYTES):
+    """Yield the part of a byte-chunk stream selected by a ``Window``.
+
+    Reading stops as soon as the window or the cap is exhausted.
+    """
+    selection = Window(info, byte_range, line_range, max_bytes)
+    for chunk in chunks:
+        piece = selection.feed(chunk)
+        if piece:
+            yield piece
+        if selection.done:
+            return
+
+
+def content_length(headers):
+    """Size of the decoded body from Content-Length, or None when it is unknown.
+
+    With a Content-Encoding the header counts compressed bytes, not what is read.
+    """
+    total = headers.get("Content-Length")
+    if total is None or headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    return int(total)
+
+
+def open_stream(session, url, accept, byte_range=None, line_range=None, max_bytes=MAX_STREAM_BYTES):
+    """Start a streamed GET and return ``(chunks, info)``.
+
+    Raises ``requests.HTTPError`` before any data is read if GitHub refuses
+    the request. ``info`` holds ``total_bytes`` (when known from the headers),
+    ``max_bytes`` and the running ``bytes``/``truncated`` values.
+    """
+    response = session.get(url, headers={"Accept": accept}, stream=True)
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+
+    total = content_length(response.headers)
+    if total is None and response._content_consumed and isinstance(response._content, bytes):
+        total = len(response._content)  # revalidated from the ETag cache
+    info = {"total_bytes": total, "max_bytes": max_bytes,
+            "bytes": 0, "truncated": False}
+
+    def chunks():
+        try:
+            yield from window(response.iter_content(CHUNK_SIZE), info, byte_range, line_range, max_bytes)
+        finally:
+            response.close()
+
+    return chunks(), info
+
+
+def read_capped(session, url, accept, byte_range=None, line_range=None, max_bytes=MAX_INLINE_BYTES):
+    """Read a streamed GET into text, keeping at most ``max_bytes``. Returns ``(text, info)``."""
+    chunks, info = open_stream(session, url, accept, byte_range, line_range, max_bytes)
+    data = b"".join(chunks)
+    return data.decode("utf-8", errors="replace"), info
+
+
+def truncation_meta(info):
+    """Fields describing a capped read, for JSON responses."""
+    return {
+        "truncated": info["truncated"],
+        "bytes": info["bytes"],
+        "total_bytes": info["total_bytes"],
+    }
+
+
+def ndjson_lines(items, trailer, flush_bytes=NDJSON_FLUSH_BYTES):
+    """Encode ``items`` one JSON object per line, in chunks of about ``flush_bytes``.
+
+    The last line is ``trailer()``, called once the items are exhausted, or
+    ``{"error": ...}`` if producing them failed part way: the status line has
+    already gone out by then.
+    """
+    buffer = []
+    size = 0
+    try:
+        for item in items:
+            line = json.dumps(item) + "\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= flush_bytes:
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+        last = trailer()
+    except Exception as e:
+        last = {"error": str(e)}
+    buffer.append(json.dumps(last) + "\n")
+    yield "".join(buffer).encode()
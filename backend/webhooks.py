@@ -0,0 +1,32 @@
+"""GitHub webhook signature checks and pull_request event parsing."""
+import hashlib
+import hmac
+
+# pull_request actions that give a PR a new head worth precomputing for
+PRECOMPUTE_ACTIONS = {"opened", "synchronize", "reopened"}
+
+
+def sign(secret, body):
+    """``X-Hub-Signature-256`` value GitHub sends for ``body``."""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, body, signature):
+    """True if ``signature`` is the HMAC-SHA256 of the raw ``body`` under ``secret``."""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature)
+
+
+def pull_request_target(event, payload):
+    """``(repo_name, pr_number, head_sha)`` for an event worth precomputing for, else None."""
+    if event != "pull_request" or not isinstance(payload, dict):
+        return None
+    if payload.get("action") not in PRECOMPUTE_ACTIONS:
+        return None
+    pull = payload.get("pull_request") or {}
+    repo_name = (payload.get("repository") or {}).get("full_name")
+    head_sha = (pull.get("head") or {}).get("sha")
+    if not repo_name or not pull.get("number") or not head_sha:
+        return None
+    return repo_name, pull["number"], head_sha
@@ -39,8 +39,50 @@ const formatResponse = (responseData) => {
         if (responseData.pr_url) {
             return `I’ve created a pull request for you! You can view it here: ${responseData.pr_url}`;
         }
-        if (responseData.pr1_diff && responseData.pr2_diff) {
-            return `Here’s the comparison between the two pull requests:\n- PR1 Diff: ${responseData.pr1_diff}\n- PR2 Diff: ${responseData.pr2_diff}`;
+        if (responseData.comparison) {
+            const { summary, common_files: commonFiles, pr1, pr2 } = responseData.comparison;
+            let formatted = `Here’s the comparison between PR #${pr1.number} and PR #${pr2.number}:\n`;
+            formatted += `- Files changed: ${summary.pr1_files} vs ${summary.pr2_files}, ${summary.common_files} in common\n`;
+            formatted += `- Identical changes: ${summary.identical_hunks}\n`;
+            formatted += `- Overlapping changes: ${summary.overlapping_ranges} in ${summary.conflicting_files} file${summary.conflicting_files === 1 ? '' : 's'}\n`;
+            commonFiles.forEach((file) => {
+                file.overlaps.forEach((overlap) => {
+                    formatted += `  • ${file.path} lines ${overlap.lines[0]}-${overlap.lines[1]}\n`;
+                });
+            });
+            return formatted;
+        }
+        if (Array.isArray(responseData.items)) { // A page of a list action (sent with limit or cursor)
+            let formatted = formatResponse(responseData.items);
+            if (responseData.next_cursor) formatted += `Showing ${responseData.items.length} of ${responseData.total}; ask again with the next cursor for more.\n`;
+            return formatted;
+        }
+        if (responseData.pull_requests) {
+            const { pull_requests: pulls, total, repos } = responseData;
+            if (total === 0) return `No open pull requests across ${repos} repositories.`;
+            let formatted = `I found ${total} open pull request${total === 1 ? '' : 's'} across ${repos} repositories:\n`;
+            pulls.forEach((pr, index) => {
+                formatted += `${index + 1}. ${pr.repo}: ${pr.title} (PR #${pr.number})\n`;
+            });
+            if (responseData.next_cursor) formatted += `Showing ${pulls.length} of ${total}; ask again with the next cursor for more.\n`;
+            return formatted;
+        }
+        if (responseData.reviews) {
+            const { reviews, total, repo } = responseData;
+            if (total === 0) return `There are no open pull requests in ${repo} to review.`;
+            let formatted = `Here are the reviews of ${reviews.length} of ${total} open pull request${total === 1 ? '' : 's'} in ${repo}:\n`;
+            reviews.forEach((pr) => {
+                if (pr.error) {
+                    formatted += `- PR #${pr.number} (${pr.title}): review failed: ${pr.error}\n`;
+                    return;
+                }
+                const issues = pr.review.issues || [];
+                formatted += `- PR #${pr.number} (${pr.title}): ${issues.length} issue${issues.length === 1 ? '' : 's'}\n`;
+                issues.forEach((issue) => {
+                    formatted += `    • "${issue.file}" line ${issue.line_number}: ${issue.comment}\n`;
+                });
+            });
+            return formatted;
         }
         if (responseData.title && responseData.body) {
             return `Here are the details of the pull request:\n- Title: ${responseData.title}\n- Body: ${responseData.body}\n- State: ${responseData.state}\n- Created by: ${responseData.user}`;
@@ -67,6 +109,10 @@ const formatResponse = (responseData) => {
                         formatted += tests.test_cases.map(formatTestCase).join('\n');
                     }
                 }
+                const skipped = Object.entries(responseData.skipped_files || {});
+                if (skipped.length) {
+                    formatted += `Skipped ${skipped.length} file(s): ${skipped.map(([file, reason]) => `${file} (${reason})`).join(', ')}\n`;
+                }
             }
             return formatted;
         }